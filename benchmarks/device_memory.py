@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# device_memory.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures how much memory a loaded group uses per device. Runs against an
+installed build:
+
+    python3 benchmarks/device_memory.py [pkgdatadir] [count]
+"""
+
+import sys
+import tracemalloc
+
+def device_config(i):
+    return {
+        "label": f"Light {i}",
+        "kind": "lifx",
+        "data": {
+            "ip": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}",
+            "mac": "d0:73:d5:" + ":".join(f"{i >> s & 255:02x}" for s in (16, 8, 0))
+        }
+    }
+
+def measure(create, count):
+    tracemalloc.start()
+    objects = create(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return current / count
+
+def main():
+    pkgdatadir = sys.argv[1] if len(sys.argv) > 1 else "/usr/local/share/ambience"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    sys.path.insert(1, pkgdatadir)
+
+    from ambience.model.ambience_group import AmbienceGroup
+    from ambience.providers.lifx.ambience_lifx_light import AmbienceLIFXLight
+
+    # Imports, the shared socket and the provider cache are allocated once.
+    AmbienceGroup.from_config({"label": "Warmup", "devices": [device_config(0)]})
+
+    def create_records(n):
+        records = []
+        for i in range(n):
+            # Same fields AmbienceWindow fills once a device has loaded
+            record = AmbienceLIFXLight()
+            record.label = f"Light {i}"
+            record.available = True
+            record.capabilities = []
+            record.color = (0.0, 0.0, 1.0, 3500)
+            record.power = True
+            record.info = {}
+            records.append(record)
+        return records
+
+    def create_group(n):
+        return AmbienceGroup.from_config({
+            "label": "Benchmark",
+            "devices": [device_config(i) for i in range(n)]
+        })
+
+    print(f"{count} devices")
+    print(f"  device record:        {measure(create_records, count):8.0f} bytes/device")
+    print(f"  loaded group (total): {measure(create_group, count):8.0f} bytes/device")
+
+if __name__ == "__main__":
+    main()
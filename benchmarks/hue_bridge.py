@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# hue_bridge.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares the hue provider's pooled keep-alive session against opening a
+connection per request, and per-light writes against one group action,
+using the mock bridge. Runs against an installed build:
+
+    python3 benchmarks/hue_bridge.py [pkgdatadir] [lights]
+"""
+
+import os, sys, time
+
+import requests
+
+from mock_hue_bridge import USERNAME, create_bridge
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def main():
+    pkgdatadir = sys.argv[1] if len(sys.argv) > 1 else "/usr/local/share/ambience"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    sys.path.insert(1, pkgdatadir)
+
+    from ambience.providers.hue.ambience_hue_bridge import AmbienceHueBridge
+
+    server = create_bridge(0, count)
+    host = "{}:{}".format(*server.server_address)
+    bridge = AmbienceHueBridge(host, USERNAME)
+    light_ids = [str(i) for i in range(1, count + 1)]
+    state = {"on": True, "bri": 127}
+
+    def per_connection():
+        for light_id in light_ids:
+            requests.put(bridge.url("lights", light_id, "state"), json=state, timeout=2).json()
+
+    def pooled():
+        for light_id in light_ids:
+            bridge.request("PUT", "lights", light_id, "state", body=state)
+
+    def group_action():
+        bridge.request("PUT", "groups", "0", "action", body=state)
+
+    print(f"{count} lights")
+    for (name, fn) in (("connection per request", per_connection),
+                       ("pooled session", pooled),
+                       ("group action", group_action)):
+        connections = server.connections
+        seconds = timed(fn)
+        print(f"  {name:24} {seconds * 1000:8.1f} ms  {server.connections - connections:4} connections")
+
+if __name__ == "__main__":
+    main()
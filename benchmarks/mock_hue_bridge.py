@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# mock_hue_bridge.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A small in-memory Hue-style bridge for trying the hue provider without
+hardware, for tests and for benchmarks. Speaks HTTP/1.1 with keep-alive,
+counts the TCP connections it accepts and logs every request.
+
+    python3 benchmarks/mock_hue_bridge.py [port] [lights]
+    AMBIENCE_HUE_BRIDGES=127.0.0.1:8000 ambience
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socket import IPPROTO_TCP, TCP_NODELAY
+import json, sys, threading
+
+USERNAME = "ambience-mock"
+
+class MockBridgeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately, don't let Nagle hold the body
+        self.connection.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def path_parts(self):
+        parts = self.path.strip("/").split("/")
+        if parts[0] != "api":
+            return None
+        if len(parts) > 1 and parts[1] != USERNAME:
+            return None
+        return parts[2:]
+
+    def do_GET(self):
+        parts = self.path_parts()
+        lights = self.server.lights
+
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.log.append((self.command, self.path))
+            if parts == ["lights"]:
+                return self.reply(lights)
+            if len(parts) == 2 and parts[0] == "lights" and parts[1] in lights:
+                return self.reply(lights[parts[1]])
+            if parts == ["groups"]:
+                return self.reply(self.server.groups)
+
+        self.reply([{"error": {"type": 3, "address": self.path, "description": "resource not available"}}])
+
+    def do_PUT(self):
+        parts = self.path_parts()
+        body = self.read_body()
+        lights = self.server.lights
+
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.log.append((self.command, self.path))
+            if len(parts) == 3 and parts[0] == "lights" and parts[2] == "state" and parts[1] in lights:
+                lights[parts[1]]["state"].update(body)
+                return self.reply([{"success": {k: v}} for (k, v) in body.items()])
+
+            if len(parts) == 2 and parts[0] == "lights" and parts[1] in lights:
+                lights[parts[1]].update(body)
+                return self.reply([{"success": {k: v}} for (k, v) in body.items()])
+
+            if len(parts) == 3 and parts[0] == "groups" and parts[2] == "action":
+                members = lights.keys() if parts[1] == "0" else self.server.groups.get(parts[1], {}).get("lights", [])
+                for light_id in members:
+                    lights[light_id]["state"].update(body)
+                return self.reply([{"success": {k: v}} for (k, v) in body.items()])
+
+        self.reply([{"error": {"type": 3, "address": self.path, "description": "resource not available"}}])
+
+    def do_POST(self):
+        parts = self.path_parts()
+        body = self.read_body()
+
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.log.append((self.command, self.path))
+            if parts == []:
+                return self.reply([{"success": {"username": USERNAME}}])
+
+            if parts == ["groups"]:
+                group_id = str(len(self.server.groups) + 1)
+                self.server.groups[group_id] = {"name": body["name"], "type": body["type"], "lights": body["lights"]}
+                return self.reply([{"success": {"id": group_id}}])
+
+        self.reply([{"error": {"type": 3, "address": self.path, "description": "resource not available"}}])
+
+def create_bridge(port=0, count=10):
+    """
+    Starts a mock bridge on a background thread. Returns the server, its
+    address is server.server_address.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockBridgeHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = 0
+    server.log = [] # (method, path) of every request
+    server.groups = {}
+    server.lights = {
+        str(i): {
+            "name": f"Hue {i}",
+            "type": "Extended color light",
+            "modelid": "LCT015",
+            "productname": "Hue color lamp",
+            "state": {"on": True, "bri": 254, "hue": 8418, "sat": 140, "ct": 366,
+                      "colormode": "ct", "reachable": True}
+        } for i in range(1, count + 1)
+    }
+
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    return server
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    server = create_bridge(port, count)
+    print(f"Mock bridge with {count} lights on {server.server_address[0]}:{server.server_address[1]}")
+    threading.Event().wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+# mock_mqtt_broker.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Minimal MQTT 3.1.1 broker standing in for a Zigbee2MQTT setup, for trying
+the mqtt provider without hardware, for tests and for benchmarks. Supports
+QoS 0 and 1 publishes, retained messages and wildcard subscriptions, and
+plays the bridge: it publishes a retained device list and state per light
+and applies <base>/<name>/set commands to them.
+
+    python3 benchmarks/mock_mqtt_broker.py [port] [lights]
+    AMBIENCE_MQTT_BROKER=127.0.0.1:1883 ambience
+"""
+
+import json, socketserver, struct, sys, threading
+
+BASE_TOPIC = "zigbee2mqtt"
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+def packet(packet_type, flags, body):
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+def encode_string(string):
+    data = string.encode()
+    return struct.pack("!H", len(data)) + data
+
+def topic_matches(topic_filter, topic):
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for (i, part) in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+class MockBrokerHandler(socketserver.BaseRequestHandler):
+
+    def read_exact(self, count):
+        data = bytearray()
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return bytes(data)
+
+    def read_packet(self):
+        header = self.read_exact(1)[0]
+        (length, multiplier) = (0, 1)
+        while True:
+            byte = self.read_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return (header >> 4, header & 0x0F, self.read_exact(length))
+
+    def send(self, data):
+        with self.send_lock:
+            self.request.sendall(data)
+
+    def handle(self):
+        self.send_lock = threading.Lock()
+        self.filters = []
+
+        try:
+            while True:
+                (packet_type, flags, body) = self.read_packet()
+
+                if packet_type == CONNECT:
+                    self.send(packet(CONNACK, 0, b"\x00\x00"))
+                    with self.server.lock:
+                        self.server.clients.append(self)
+
+                elif packet_type == PUBLISH:
+                    (length,) = struct.unpack("!H", body[:2])
+                    topic = body[2:2 + length].decode()
+                    offset = 2 + length
+                    qos = (flags >> 1) & 3
+                    if qos:
+                        self.send(packet(PUBACK, 0, body[offset:offset + 2]))
+                        offset += 2
+                    with self.server.lock:
+                        self.server.log.append((topic, body[offset:]))
+                    self.server.publish(topic, body[offset:], flags & 1)
+
+                elif packet_type == SUBSCRIBE:
+                    packet_id = body[:2]
+                    (offset, granted, new_filters) = (2, b"", [])
+                    while offset < len(body):
+                        (length,) = struct.unpack("!H", body[offset:offset + 2])
+                        new_filters.append(body[offset + 2:offset + 2 + length].decode())
+                        offset += 3 + length
+                        granted += b"\x00"
+                    self.filters.extend(new_filters)
+                    self.send(packet(SUBACK, 0, packet_id + granted))
+                    self.server.send_retained(self, new_filters)
+
+                elif packet_type == UNSUBSCRIBE:
+                    self.send(packet(UNSUBACK, 0, body[:2]))
+
+                elif packet_type == PINGREQ:
+                    self.send(packet(PINGRESP, 0, b""))
+
+                elif packet_type == DISCONNECT:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self.server.lock:
+                if self in self.server.clients:
+                    self.server.clients.remove(self)
+
+    def deliver(self, topic, payload, retain=0):
+        if any(topic_matches(topic_filter, topic) for topic_filter in self.filters):
+            try:
+                self.send(packet(PUBLISH, retain, encode_string(topic) + payload))
+            except OSError:
+                pass
+
+class MockBroker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, count):
+        super().__init__(address, MockBrokerHandler)
+        self.lock = threading.Lock()
+        self.clients = []
+        self.retained = {}
+        self.commands = 0
+        self.devices = []
+        self.log = [] # (topic, payload) of every message clients published
+
+        for i in range(1, count + 1):
+            self.add_light(f"light_{i}")
+
+    def add_light(self, name, availability=b"online"):
+        """
+        Adds a light to the retained device list. Call before clients
+        connect.
+        """
+        self.devices.append({
+            "friendly_name": name,
+            "type": "Router",
+            "definition": {
+                "description": "Mock color bulb",
+                "exposes": [{"type": "light", "features": [
+                    {"name": "state"}, {"name": "brightness"}, {"name": "color_temp"}, {"name": "color_hs"}
+                ]}]
+            }
+        })
+        self.retained[f"{BASE_TOPIC}/{name}"] = json.dumps({
+            "state": "ON", "brightness": 254, "color_temp": 366, "color_mode": "color_temp",
+            "color": {"hue": 30, "saturation": 60}
+        }).encode()
+        self.retained[f"{BASE_TOPIC}/{name}/availability"] = availability
+        self.retained[f"{BASE_TOPIC}/bridge/devices"] = json.dumps(self.devices).encode()
+
+    def send_retained(self, client, filters):
+        with self.lock:
+            retained = list(self.retained.items())
+        for (topic, payload) in retained:
+            if any(topic_matches(topic_filter, topic) for topic_filter in filters):
+                client.deliver(topic, payload, retain=1)
+
+    def publish(self, topic, payload, retain=0):
+        with self.lock:
+            if retain:
+                self.retained[topic] = payload
+            clients = list(self.clients)
+
+        for client in clients:
+            client.deliver(topic, payload)
+
+        if topic.startswith(BASE_TOPIC + "/") and topic.endswith("/set"):
+            self.apply(topic[:-len("/set")], json.loads(payload))
+
+    def apply(self, state_topic, command):
+        """
+        Plays the bridge: merges a set command into the light's state and
+        publishes the result.
+        """
+        with self.lock:
+            self.commands += 1
+            if state_topic not in self.retained:
+                return
+            state = json.loads(self.retained[state_topic])
+            state.update(command)
+            if "color" in command:
+                state["color_mode"] = "hs"
+            elif "color_temp" in command:
+                state["color_mode"] = "color_temp"
+            payload = json.dumps(state).encode()
+
+        self.publish(state_topic, payload, retain=1)
+
+def create_broker(port=0, count=10):
+    """
+    Starts a mock broker on a background thread. Its address is
+    broker.server_address.
+    """
+    broker = MockBroker(("127.0.0.1", port), count)
+    broker_thread = threading.Thread(target=broker.serve_forever)
+    broker_thread.daemon = True
+    broker_thread.start()
+    return broker
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 1883
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    broker = create_broker(port, count)
+    print(f"Mock broker with {count} lights on {broker.server_address[0]}:{broker.server_address[1]}")
+    threading.Event().wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# mqtt_group.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Times a group colour change through the mqtt provider against the mock
+broker: pipelined publishes versus publishing light by light and waiting
+for each state echo. Also checks that reads come from memory. Runs
+against an installed build:
+
+    python3 benchmarks/mqtt_group.py [pkgdatadir] [lights]
+"""
+
+import os, sys, time
+
+from mock_mqtt_broker import create_broker
+
+def wait_for(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError
+        time.sleep(0.0005)
+
+def main():
+    pkgdatadir = sys.argv[1] if len(sys.argv) > 1 else "/usr/local/share/ambience"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    sys.path.insert(1, pkgdatadir)
+
+    broker = create_broker(0, count)
+    os.environ["AMBIENCE_MQTT_BROKER"] = "{}:{}".format(*broker.server_address)
+
+    from ambience.providers.mqtt.ambience_connector import AmbienceConnector
+    from ambience.providers.mqtt.ambience_mqtt_client import AmbienceMQTTClient
+
+    connector = AmbienceConnector()
+    lights = connector.discovery_list()
+    group = connector.create_group(lights)
+    client = AmbienceMQTTClient()
+
+    def echoed(brightness):
+        # Every light's state as published back by the broker
+        return lambda: broker.commands >= expected[0] and all(
+            client.states[light.friendly_name].get("brightness") == brightness for light in lights)
+
+    print(f"{len(lights)} lights")
+
+    start = time.perf_counter()
+    for light in lights:
+        light.refresh_state()
+    print(f"  refresh_state, all lights    {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+    expected = [broker.commands + len(lights)]
+    start = time.perf_counter()
+    group.set_color([0.5, 1, 0.5, 3500])
+    wait_for(echoed(127))
+    print(f"  pipelined group set_color    {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+    start = time.perf_counter()
+    for light in lights:
+        expected = [broker.commands + 1]
+        light.set_color([0.25, 1, 1, 3500])
+        wait_for(lambda: broker.commands >= expected[0])
+    print(f"  light by light, with echo    {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -16,8 +16,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from gi.repository import Gtk, Gdk, GLib, GObject, Handy
-import threading, json
+import threading
 
+from ambience.ambience_profiler import AmbienceProfiler
+from ambience.model.ambience_event_loop import AmbienceTaskScope
 from ambience.providers.ambience_providers import AmbienceProviders
 from ambience.widgets.ambience_discovery_item import AmbienceDiscoveryItem
 
@@ -35,6 +37,8 @@ class AmbienceDiscovery(Gtk.Dialog):
 
     providers = AmbienceProviders()
     current_provider = None
+    all_providers = False
+    scan_tasks = None
 
     group = None
 
@@ -45,12 +49,18 @@ class AmbienceDiscovery(Gtk.Dialog):
         if not selected_row:
             return
 
-        provider = AmbienceProviders().import_provider(selected_row.provider)
-
         self.main_deck.set_visible_child_name("devices")
-        self.subheader.set_title(self.providers.get_name_for_provider(selected_row.provider))
+        self.subheader.set_subtitle(None)
+
+        if selected_row.provider is None:
+            self.subheader.set_title("All Providers")
+            self.all_providers = True
+            self.current_provider = None
+        else:
+            self.subheader.set_title(self.providers.get_name_for_provider(selected_row.provider))
+            self.all_providers = False
+            self.current_provider = AmbienceProviders().import_async_provider(selected_row.provider)
 
-        self.current_provider = provider
         self.reload_devices(self)
 
     @Gtk.Template.Callback("reload_devices")
@@ -62,8 +72,21 @@ class AmbienceDiscovery(Gtk.Dialog):
         for item in self.devices_list.get_children():
             self.devices_list.remove(item)
 
-        def set_devices():
-            devices = self.current_provider.discovery_list()
+        # A new scan replaces the running one
+        self.scan_tasks.cancel()
+        self.scan_tasks = AmbienceTaskScope()
+
+        if self.all_providers:
+            self.reload_all_devices(self.scan_tasks)
+            return
+
+        scan_tasks = self.scan_tasks
+
+        provider = self.current_provider
+
+        async def set_devices():
+            with AmbienceProfiler().timed("discovery"):
+                devices = await provider.discovery_list()
 
             def update_list():
                 for device in devices: 
@@ -75,21 +98,69 @@ class AmbienceDiscovery(Gtk.Dialog):
                 self.providers_list.unselect_all()
                 self.reload_stack.set_visible_child_name("button")
 
-            GLib.idle_add(update_list)
+            scan_tasks.idle(update_list)
 
-        discovery_thread = threading.Thread(target=set_devices)
-        discovery_thread.start()
+        scan_tasks.submit(set_devices())
 
         #AmbienceProviders().unimport_provider(provider) ??
 
+    def reload_all_devices(self, scan_tasks):
+        """
+        Scans every provider in parallel, adding devices to the list as each
+        provider reports back and skipping ones already shown.
+        """
+        seen = set()
+        timings = []
+
+        def devices_found(provider, devices, seconds):
+            def update_list():
+                for device in devices:
+                    key = device.get_static_id()
+                    if key in seen:
+                        continue
+                    seen.add(key)
+
+                    row = AmbienceDiscoveryItem(device, self.group)
+                    row.set_visible(True)
+                    self.devices_list.insert(row, -1)
+
+                timings.append(f"{self.providers.get_name_for_provider(provider)} {seconds:.1f}s")
+                self.subheader.set_subtitle(", ".join(timings))
+
+            scan_tasks.idle(update_list)
+
+        async def scan():
+            await self.providers.discover_all_async(devices_found)
+
+            def finish():
+                self.providers_list.unselect_all()
+                self.reload_stack.set_visible_child_name("button")
+
+            scan_tasks.idle(finish)
+
+        scan_tasks.submit(scan())
+
     @Gtk.Template.Callback("go_back")
     def go_back(self, sender):
+        self.scan_tasks.cancel()
         self.providers_list.unselect_all()
         self.main_deck.set_visible_child_name("providers")
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        
+
+        self.scan_tasks = AmbienceTaskScope()
+
+        all_row = Handy.ActionRow()
+        all_row.set_title("All Providers")
+        all_row.provider = None
+
+        all_img = Gtk.Image.new_from_icon_name("go-next-symbolic", 0)
+        all_img.set_visible(True)
+
+        all_row.add(all_img)
+        self.providers_list.insert(all_row, -1)
+
         for provider in self.providers.get_provider_list():
             row = Handy.ActionRow()
             row.set_title(self.providers.get_name_for_provider(provider))
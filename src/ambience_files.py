@@ -0,0 +1,38 @@
+# ambience_files.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json, os, tempfile
+
+def atomic_write_json(path, data):
+    """
+    Writes data to path as compact JSON through a temporary file in the
+    same directory, so readers see the old file or the new one, never a
+    partial one. The temporary file is removed if anything fails. Callers
+    writing the same path from several threads must hold a lock, or an
+    older write can replace a newer one.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    temp_file = tempfile.NamedTemporaryFile("w", dir=directory, delete=False)
+    try:
+        with temp_file:
+            json.dump(data, temp_file, separators=(",", ":"))
+        os.replace(temp_file.name, path)
+    except BaseException:
+        os.unlink(temp_file.name)
+        raise
@@ -0,0 +1,111 @@
+# ambience_info_cache.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+import json, threading
+
+from ambience.ambience_files import atomic_write_json
+from ambience.model.ambience_device import AmbienceDeviceInfoType
+from ambience.singleton import Singleton
+
+CACHE_FILE_NAME = "info.json"
+
+class AmbienceInfoCache(metaclass=Singleton):
+    """
+    Static device info (model, group, location...) kept in the user cache
+    directory without expiry. Entries are keyed by the device's static id,
+    so groups containing the same bulb share one, and stored with the
+    device's info version. The first load of a device in a session
+    compares the version and fetches the info again if it changed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = self.read()
+        self.validated = set()
+        self.dirty = False
+
+    def get_path(self):
+        return GLib.build_filenamev([GLib.get_user_cache_dir(), "ambience", CACHE_FILE_NAME])
+
+    def read(self) -> dict:
+        try:
+            with open(self.get_path()) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, device):
+        """
+        Cached info of device, without any I/O. None if there is none.
+        """
+        with self.lock:
+            entry = self.entries.get(device.get_static_id())
+
+        if not entry:
+            return None
+        return {AmbienceDeviceInfoType[name]: value for (name, value) in entry["info"].items()}
+
+    def load(self, device, write=True):
+        """
+        Returns device's info, fetching it only if it isn't cached or its
+        version changed. Blocks, call from a worker thread. Loading many
+        devices, pass write=False and call write() once they are done.
+        """
+        key = device.get_static_id()
+        with self.lock:
+            validated = key in self.validated
+
+        if validated:
+            return self.get(device)
+
+        version = device.get_info_version()
+        with self.lock:
+            entry = self.entries.get(key)
+            fresh = entry is not None and entry["version"] == version
+
+        if not fresh:
+            info = device.get_info()
+            with self.lock:
+                self.entries[key] = {
+                    "version": version,
+                    "info": {info_type.name: value for (info_type, value) in info.items()}
+                }
+                self.dirty = True
+
+            if write:
+                self.write()
+
+        with self.lock:
+            self.validated.add(key)
+        return self.get(device)
+
+    def write(self):
+        """
+        Writes the cache file if an entry changed since the last write.
+        """
+        with self.lock:
+            if not self.dirty:
+                return
+
+            self.dirty = False
+            try:
+                atomic_write_json(self.get_path(), self.entries)
+            except (OSError, TypeError, ValueError) as error:
+                self.dirty = True
+                print(f"Could not write info cache: {error}")
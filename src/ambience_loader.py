@@ -18,9 +18,11 @@
 from gi.repository import GLib, Gio
 
 from ambience.model.ambience_group import *
+from ambience.providers.ambience_providers import AmbienceProviders
 from ambience.singleton import *
+from ambience.ambience_settings import get_old_dest_file, query_old_lights, merge_old_lights, move_old_config
 
-import json
+import json, threading
 
 class AmbienceLoader(metaclass=Singleton):
     """
@@ -30,6 +32,11 @@ class AmbienceLoader(metaclass=Singleton):
 
     CONFIG_FILE_NAME = 'ambience.json'
 
+    def __init__(self):
+        # Held for every read-modify-write of the config, from any thread
+        self.config_lock = threading.RLock()
+        self.old_config_checked = False
+
     def read_config_file(self, file):
         data_dir = GLib.get_user_config_dir()
         dest = GLib.build_filenamev([data_dir, file])
@@ -60,12 +67,36 @@ class AmbienceLoader(metaclass=Singleton):
 
         return config
 
+    def convert_old_config(self, progress_cb=None) -> bool:
+        """
+        Moves lights from the pre 1.0 lights.json into the config, once.
+        Every bulb is asked for its group, which blocks for up to
+        MIGRATION_DEADLINE: call from a worker thread. Returns whether
+        lights were moved.
+        """
+        with self.config_lock:
+            if self.old_config_checked:
+                return False
+            self.old_config_checked = True
+
+        if not get_old_dest_file().query_exists(None):
+            return False
+
+        print("Converting old config file...")
+        lights = query_old_lights(progress_cb)
+
+        with self.config_lock: # Not held while the bulbs are asked
+            merge_old_lights(lights)
+            move_old_config()
+        return True
+
     def get_config(self):
         file = self.read_config_file(self.CONFIG_FILE_NAME)
         try:
-            (_, content, _) = file.load_contents()
-            config = json.loads(content.decode("utf-8"))
-            config = self.validate_config(config)
+            with self.config_lock: # validate_config may write a migrated config
+                (_, content, _) = file.load_contents()
+                config = json.loads(content.decode("utf-8"))
+                config = self.validate_config(config)
             return config
         except GLib.GError as error:
             # File doesn't exist
@@ -87,19 +118,19 @@ class AmbienceLoader(metaclass=Singleton):
             print("Unable to create required directory/ies for config file")
 
     def get_group(self, label):
-        config = self.get_config()
+        with self.config_lock:
+            config = self.get_config()
 
-        for group in config["groups"]:
-            if group["label"] == label:
-                return AmbienceGroup.from_config(group)
+            for group in config["groups"]:
+                if group["label"] == label:
+                    return AmbienceGroup.from_config(group)
 
-        group = AmbienceGroup()
-        group.label = label
+            group = AmbienceGroup(label)
 
-        config["groups"].append(group.write_config())
+            config["groups"].append(group.write_config())
 
-        self.write_config(config)
-        return group
+            self.write_config(config)
+            return group
     
     def remove_group(self, config, group):
         for g in config["groups"]:
@@ -108,9 +139,10 @@ class AmbienceLoader(metaclass=Singleton):
         return config
 
     def delete_group(self, group):
-        config = self.get_config()
-        self.remove_group(config, group)
-        self.write_config(config)
+        with self.config_lock:
+            config = self.get_config()
+            self.remove_group(config, group)
+            self.write_config(config)
 
     def get_all_groups(self):
         return [AmbienceGroup.from_config(x) for x in self.get_config()["groups"]]
@@ -124,11 +156,47 @@ class AmbienceLoader(metaclass=Singleton):
                     return True
         return False
 
+    def get_static_id(self, device_config):
+        """
+        Static id of the device a group's config entry describes.
+        """
+        connector = AmbienceProviders().import_provider(device_config["kind"])
+        return connector.load_device(device_config, None).get_static_id()
+
+    def reconcile_labels(self, devices):
+        """
+        Writes labels that were changed on the devices themselves back to
+        every group containing them, using a single config write.
+        """
+        labels = {}
+        for device in devices:
+            if device.label:
+                labels[device.get_static_id()] = device.label
+
+        if not labels:
+            return False
+
+        with self.config_lock:
+            config = self.get_config()
+            changed = False
+
+            for group in config["groups"]:
+                for d in group["devices"]:
+                    label = labels.get(self.get_static_id(d))
+                    if label and d["label"] != label:
+                        d["label"] = label
+                        changed = True
+
+            if changed:
+                self.write_config(config)
+            return changed
+
     def modify_group(self, group, modify_fn):
-        config = self.remove_group(self.get_config(), group)
-        modify_fn()
-        config["groups"].append(group.write_config())
-        self.write_config(config)
+        with self.config_lock:
+            config = self.remove_group(self.get_config(), group)
+            modify_fn()
+            config["groups"].append(group.write_config())
+            self.write_config(config)
 
     def add_device(self, group, device):
         def add_fn():
@@ -148,3 +216,12 @@ class AmbienceLoader(metaclass=Singleton):
             group.set_label(label)
         self.modify_group(group, rename_fn)
         return group
+
+    def get_schedules(self):
+        return self.get_config().get("schedules", [])
+
+    def write_schedules(self, schedules):
+        with self.config_lock:
+            config = self.get_config()
+            config["schedules"] = schedules
+            self.write_config(config)
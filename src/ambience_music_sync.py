@@ -0,0 +1,280 @@
+# ambience_music_sync.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Music sync: audio from a WAV file or a pipe is split into short blocks,
+analysed with a streaming FFT and turned into one colour per device of a
+group, low bands on the first device and high bands on the last.
+"""
+
+from collections import deque
+from time import monotonic
+import threading, time, wave
+
+from ambience.ambience_profiler import AmbienceProfiler
+
+try:
+    import numpy
+    NUMPY_AVAIL = True
+except ImportError:
+    NUMPY_AVAIL = False
+
+FPS             = 20    # LIFX bulbs take at most 20 messages per second
+WINDOW          = 2048  # samples per FFT
+QUEUE_BLOCKS    = 4     # blocks waiting for the sender, older ones are dropped
+LATE            = 2 / FPS   # seconds, blocks older than this are dropped
+MIN_FREQ        = 40
+MAX_FREQ        = 12000
+PEAK_DECAY      = 0.995 # per frame, how quickly auto gain recovers after a loud part
+KELVIN          = 3500
+
+# Input that isn't a WAV file is read as raw signed 16 bit little endian
+RAW_RATE        = 44100
+RAW_CHANNELS    = 2
+
+class AmbienceAudioSource():
+    """
+    Reads audio as mono float blocks in -1..1.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.wav = None
+
+        if self.file.peek(4)[:4] == b"RIFF":
+            try:
+                self.wav = wave.open(self.file)
+            except (wave.Error, EOFError) as e:
+                self.file.close()
+                raise ValueError(f"Invalid WAV file: {e}")
+
+            self.rate = self.wav.getframerate()
+            self.channels = self.wav.getnchannels()
+            self.width = self.wav.getsampwidth()
+
+            if self.width not in (1, 2, 3, 4):
+                self.close()
+                raise ValueError(f"Unsupported sample width of {self.width} bytes")
+        else:
+            self.rate = RAW_RATE
+            self.channels = RAW_CHANNELS
+            self.width = 2
+
+    def read(self, frames):
+        """
+        Returns up to frames samples, or None at end of input.
+        """
+        if self.wav:
+            data = self.wav.readframes(frames)
+        else:
+            data = self.file.read(frames * self.channels * self.width)
+
+        frame_size = self.channels * self.width
+        data = data[:len(data) - len(data) % frame_size]
+        if not data:
+            return None
+
+        if self.width == 1:
+            samples = (numpy.frombuffer(data, dtype=numpy.uint8).astype(numpy.float32) - 128) / 128
+        elif self.width == 3:
+            # Widened to the top of an int32, the shift back sign extends
+            packed = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 3).astype(numpy.int32)
+            ints = (packed[:, 0] << 8) | (packed[:, 1] << 16) | (packed[:, 2] << 24)
+            samples = (ints >> 8).astype(numpy.float32) / (1 << 23)
+        else:
+            dtype = {2: numpy.int16, 4: numpy.int32}[self.width]
+            samples = numpy.frombuffer(data, dtype=dtype).astype(numpy.float32) / (1 << (8 * self.width - 1))
+
+        return samples.reshape(-1, self.channels).mean(axis=1)
+
+    def close(self):
+        if self.wav:
+            self.wav.close()
+        self.file.close()
+
+class AmbienceBandAnalyser():
+    """
+    Log-spaced band energies of the last WINDOW samples, normalised to
+    0..1 against a slowly decaying peak.
+    """
+
+    def __init__(self, rate, bands):
+        self.window = numpy.hanning(WINDOW).astype(numpy.float32)
+        self.samples = numpy.zeros(WINDOW, dtype=numpy.float32)
+
+        freqs = numpy.fft.rfftfreq(WINDOW, 1 / rate)
+        edges = numpy.geomspace(MIN_FREQ, min(MAX_FREQ, rate / 2), bands + 1)
+        self.bins = numpy.searchsorted(freqs, edges)
+        for i in range(1, bands + 1): # At least one bin per band
+            self.bins[i] = max(self.bins[i], self.bins[i - 1] + 1)
+        self.bins = numpy.minimum(self.bins, len(freqs))
+        self.peak = numpy.full(bands, 1e-6, dtype=numpy.float32)
+
+    def push(self, block):
+        block = block[-WINDOW:]
+        self.samples = numpy.concatenate((self.samples[len(block):], block))
+
+        power = numpy.abs(numpy.fft.rfft(self.samples * self.window)) ** 2
+        total = numpy.concatenate(([0], numpy.cumsum(power)))
+        sums = total[self.bins[1:]] - total[self.bins[:-1]]
+        energies = numpy.log1p(sums / numpy.maximum(numpy.diff(self.bins), 1))
+
+        self.peak = numpy.maximum(self.peak * PEAK_DECAY, energies)
+        return energies / self.peak
+
+def band_colors(levels):
+    """
+    One colour per band level: hue runs from red for the lowest band to
+    blue for the highest and brightness follows the level.
+    """
+    count = len(levels)
+    colors = numpy.empty((count, 4))
+    colors[:, 0] = numpy.linspace(0, 0.66, count) if count > 1 else 0
+    colors[:, 1] = 1
+    colors[:, 2] = numpy.clip(levels, 0.02, 1)
+    colors[:, 3] = KELVIN
+    return colors
+
+class AmbienceMusicSync():
+    """
+    Streams colours for group from the audio at path. A reader thread opens
+    the input, which blocks for a pipe until its writer connects, paces it
+    to real time and fills a bounded queue; a sender thread takes the newest
+    block, drops it if it is already late and streams a frame through the
+    group's providers. Audio to light latency of frames that were sent in
+    full is recorded as the music_latency metric.
+    """
+
+    def __init__(self, group, path, done_cb=None):
+        self.group = group
+        self.path = path
+        self.done_cb = done_cb
+
+        self.blocks = deque(maxlen=QUEUE_BLOCKS)
+        self.ready = threading.Condition()
+        self.stopped = threading.Event()
+        self.finished = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.latency_total = 0
+        self.latency_max = 0
+
+    def start(self):
+        """
+        Returns right away. done_cb is called, from a background thread,
+        once streaming ends or if the input can't be opened.
+        """
+        read_thread = threading.Thread(target=self.read_loop)
+        read_thread.daemon = True
+        read_thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        with self.ready:
+            self.ready.notify()
+
+    def read_loop(self):
+        try:
+            self.source = AmbienceAudioSource(self.path)
+        except (OSError, ValueError) as e:
+            print("Unable to open", self.path, e)
+            if self.done_cb:
+                self.done_cb(self)
+            return
+
+        send_thread = threading.Thread(target=self.send_loop)
+        send_thread.daemon = True
+        send_thread.start()
+
+        hop = self.source.rate // FPS
+        start = monotonic()
+        played = 0
+
+        try:
+            while not self.stopped.is_set():
+                block = self.source.read(hop)
+                if block is None:
+                    break
+
+                # A file is read faster than it plays, hold each block back
+                # until it would have been heard
+                played += len(block)
+                delay = start + played / self.source.rate - monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+                with self.ready:
+                    if len(self.blocks) == self.blocks.maxlen:
+                        self.dropped += 1
+                    self.blocks.append((monotonic(), block))
+                    self.ready.notify()
+        except (OSError, ValueError) as e:
+            print("Music sync:", e)
+        finally:
+            self.source.close()
+            with self.ready:
+                self.finished = True
+                self.ready.notify()
+
+    def send_loop(self):
+        analyser = AmbienceBandAnalyser(self.source.rate, max(len(self.group.get_devices()), 1))
+
+        while True:
+            with self.ready:
+                while not self.blocks and not self.finished and not self.stopped.is_set():
+                    self.ready.wait()
+
+                if self.stopped.is_set() or (self.finished and not self.blocks):
+                    break
+
+                blocks = list(self.blocks)
+                self.blocks.clear()
+
+            # Every block feeds the analysis window but only the newest is shown
+            for (_, block) in blocks:
+                levels = analyser.push(block)
+            self.dropped += len(blocks) - 1
+
+            (captured, _) = blocks[-1]
+            if monotonic() - captured > LATE:
+                self.dropped += 1
+                continue
+
+            try:
+                sent = self.group.stream_colors(band_colors(levels))
+            except Exception as e:
+                print("Music sync:", e)
+                continue
+
+            # A frame held back by throttling has not reached the lights yet
+            if not sent:
+                self.dropped += 1
+                continue
+
+            latency = monotonic() - captured
+            AmbienceProfiler().record_metric("music_latency", latency)
+            self.sent += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+        if self.sent:
+            print(f"Music sync: {self.sent} frames sent, {self.dropped} dropped, latency mean "
+                  f"{self.latency_total / self.sent * 1000:.1f} ms, max {self.latency_max * 1000:.1f} ms")
+
+        if self.done_cb:
+            self.done_cb(self)
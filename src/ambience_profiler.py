@@ -0,0 +1,284 @@
+# ambience_profiler.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+from contextlib import contextmanager
+import cProfile, io, os, pstats, threading, time, tracemalloc
+
+from ambience.singleton import Singleton
+
+PROFILE_ENV  = "AMBIENCE_PROFILE"    # "cprofile", "tracemalloc" or both, comma separated
+MODES        = ("cprofile", "tracemalloc")
+TOP_STATS    = 40
+REPORT_DELAY = 1.0 # seconds a phase has to be quiet before its runs are reported together
+
+class AmbienceProfilerRun():
+    """
+    One run of a named phase.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.monotonic()
+        self.profile = None
+        self.snapshot = None
+
+class AmbienceProfilerBurst():
+    """
+    Runs of a phase that follow each other closely, e.g. one slider drag.
+    They share a tracemalloc baseline and are reported once.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.profiles = []
+        self.runs = 0
+        self.seconds = 0.0
+        self.last = time.monotonic()
+
+class AmbienceProfiler(metaclass=Singleton):
+    """
+    Optional cProfile / tracemalloc instrumentation around named phases
+    (startup, reload, push_light, push_group), and wall-clock metrics for
+    work that spans threads (sidebar_selected, discovery).
+    Enabled through the AMBIENCE_PROFILE environment variable or the hidden
+    app.profile action; reports go to the user cache directory so they can
+    be attached to bug reports. Reports are written from a background
+    thread once a phase has been quiet for REPORT_DELAY, metrics at most
+    once per REPORT_DELAY.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = {}
+        self.runs = {}
+        self.metrics = {}
+        self.bursts = {}
+        self.metrics_dirty = None # When the oldest unwritten sample was recorded
+        self.modes = set()
+        self.writer = None
+        self.writer_wake = threading.Condition(self.lock)
+
+        env = os.environ.get(PROFILE_ENV, "")
+        if env in ("1", "all"):
+            env = ",".join(MODES)
+        self.set_modes(mode.strip() for mode in env.split(","))
+
+    def get_report_dir(self):
+        return GLib.build_filenamev([GLib.get_user_cache_dir(), "ambience", "profiles"])
+
+    def set_modes(self, modes):
+        self.modes = set(modes) & set(MODES)
+        if "tracemalloc" in self.modes and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        elif "tracemalloc" not in self.modes and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        if self.modes:
+            print(f"Profiling ({', '.join(sorted(self.modes))}), reports in {self.get_report_dir()}")
+
+    def enabled(self):
+        return bool(self.modes)
+
+    def begin(self, name):
+        """
+        Starts a run of phase name on the calling thread. Returns a handle
+        for end(), or None when profiling is off. A phase nested in another
+        on the same thread is covered by the outer cProfile run.
+        """
+        if not self.modes:
+            return None
+
+        run = AmbienceProfilerRun(name)
+
+        if "cprofile" in self.modes and not getattr(self.local, "active", False):
+            run.profile = cProfile.Profile()
+            try:
+                run.profile.enable()
+                self.local.active = True
+            except ValueError: # Python >= 3.12 allows one active profiler at a time
+                run.profile = None
+
+        with self.lock:
+            burst = self.bursts.get(name)
+
+        # Only the first run of a burst pays for a snapshot
+        if not burst and "tracemalloc" in self.modes and tracemalloc.is_tracing():
+            run.snapshot = tracemalloc.take_snapshot()
+
+        return run
+
+    def end(self, run):
+        """
+        Adds run to its phase's burst; nothing is written on this thread.
+        """
+        if not run:
+            return
+
+        if run.profile:
+            run.profile.disable()
+            self.local.active = False
+
+        seconds = time.monotonic() - run.start
+
+        with self.lock:
+            burst = self.bursts.get(run.name)
+            if not burst:
+                burst = self.bursts[run.name] = AmbienceProfilerBurst(run.snapshot)
+
+            if run.profile:
+                burst.profiles.append(run.profile)
+            burst.runs += 1
+            burst.seconds += seconds
+            burst.last = time.monotonic()
+
+            self.start_writer()
+            self.writer_wake.notify()
+
+    def start_writer(self):
+        if self.writer:
+            return
+
+        self.writer = threading.Thread(target=self.write_loop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def write_loop(self):
+        while True:
+            with self.lock:
+                while True:
+                    now = time.monotonic()
+                    due = [name for (name, burst) in self.bursts.items() if now - burst.last >= REPORT_DELAY]
+                    metrics_due = self.metrics_dirty is not None and now - self.metrics_dirty >= REPORT_DELAY
+                    if due or metrics_due:
+                        break
+
+                    timeouts = [REPORT_DELAY - (now - burst.last) for burst in self.bursts.values()]
+                    if self.metrics_dirty is not None:
+                        timeouts.append(REPORT_DELAY - (now - self.metrics_dirty))
+                    self.writer_wake.wait(min(timeouts) if timeouts else None)
+
+                bursts = [(name, self.bursts.pop(name)) for name in due]
+
+                lines = None
+                if metrics_due:
+                    self.metrics_dirty = None
+                    lines = [f"{name}: n={m['count']} min={m['min']:.4f} mean={m['total'] / m['count']:.4f} "
+                             f"max={m['max']:.4f} last={m['last']:.4f}\n" for (name, m) in sorted(self.metrics.items())]
+
+            if lines:
+                try:
+                    os.makedirs(self.get_report_dir(), exist_ok=True)
+                    with open(os.path.join(self.get_report_dir(), "metrics.txt"), "w") as report:
+                        report.writelines(lines)
+                except (OSError, GLib.GError) as error:
+                    print(f"Could not write metrics: {error}")
+
+            for (name, burst) in bursts:
+                try:
+                    self.write_reports(name, burst)
+                except (OSError, GLib.GError) as error:
+                    print(f"Could not write profile for {name}: {error}")
+
+    @contextmanager
+    def phase(self, name):
+        run = self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(run)
+
+    @contextmanager
+    def timed(self, name):
+        """
+        Records the wall-clock time of the block as metric name. Unlike
+        phase() nothing is profiled, so the block may await or hand work to
+        other threads.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_metric(name, time.monotonic() - start)
+
+    def record_metric(self, name, value):
+        """
+        Adds a sample to metric name. Count, min, mean, max and last are
+        kept at all times and written to metrics.txt, in batches, while
+        profiling.
+        """
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = {"count": 0, "total": 0.0, "min": value, "max": value, "last": value}
+
+            metric["count"] += 1
+            metric["total"] += value
+            metric["min"] = min(metric["min"], value)
+            metric["max"] = max(metric["max"], value)
+            metric["last"] = value
+
+            if not self.modes or self.metrics_dirty is not None:
+                return
+
+            self.metrics_dirty = time.monotonic()
+            self.start_writer()
+            self.writer_wake.notify()
+
+    def get_metric(self, name):
+        with self.lock:
+            return dict(self.metrics.get(name, {}))
+
+    def write_reports(self, name, burst):
+        report_dir = self.get_report_dir()
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(report_dir, name)
+
+        with self.lock:
+            count = self.runs.get(name, 0) + burst.runs
+            self.runs[name] = count
+            stats = self.stats.get(name)
+
+        header = f"{name}: run {count}, last {burst.runs} took {burst.seconds:.3f}s\n\n"
+
+        if burst.profiles:
+            if stats:
+                stats.add(*burst.profiles)
+            else:
+                stats = pstats.Stats(*burst.profiles)
+
+            with self.lock:
+                self.stats[name] = stats
+
+            stats.dump_stats(path + ".prof")
+
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_STATS)
+            with open(path + ".txt", "w") as report:
+                report.write(header + out.getvalue())
+
+        if burst.snapshot:
+            snapshot = tracemalloc.take_snapshot()
+            (current, peak) = tracemalloc.get_traced_memory()
+            with open(path + "-tracemalloc.txt", "w") as report:
+                report.write(header)
+                report.write(f"traced: {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n\n")
+                for stat in snapshot.compare_to(burst.snapshot, "lineno")[:TOP_STATS]:
+                    report.write(str(stat) + "\n")
@@ -0,0 +1,237 @@
+# ambience_scheduler.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from datetime import datetime, timedelta
+import heapq, threading, time, uuid
+
+from ambience.ambience_loader import AmbienceLoader
+from ambience.model.ambience_group import AmbienceGroup, AmbienceUnsyncedDevices
+from ambience.singleton import Singleton
+
+GRACE       = 60    # seconds, actions due longer ago than this are skipped
+MAX_SLEEP   = 300   # seconds, bounds a wait so clock changes and suspend are noticed
+
+class AmbienceScheduleException(Exception):
+    """
+    Raised when a schedule is malformed.
+    """
+    pass
+
+def validate(schedule):
+    """
+    Checks the fields next_due and run_loop rely on, raising
+    AmbienceScheduleException if one is missing or malformed.
+    """
+    if not isinstance(schedule, dict) or not isinstance(schedule.get("group"), str):
+        raise AmbienceScheduleException("schedule needs a group")
+
+    try:
+        (hour, minute) = (int(x) for x in schedule["time"].split(":"))
+    except (KeyError, AttributeError, ValueError):
+        raise AmbienceScheduleException(f"time must be HH:MM, not {schedule.get('time')!r}")
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise AmbienceScheduleException(f"time {schedule['time']} is out of range")
+
+    days = schedule.get("days")
+    if days is not None and (not isinstance(days, list) or
+                             not all(isinstance(day, int) and 0 <= day < 7 for day in days)):
+        raise AmbienceScheduleException(f"days must be weekdays 0-6, not {days!r}")
+
+    if not isinstance(schedule.get("action", {}), dict):
+        raise AmbienceScheduleException("action must be an object")
+
+def next_due(schedule, after):
+    """
+    Timestamp of the first occurrence of schedule's "HH:MM" time after the
+    timestamp after, on one of its weekdays (0 is Monday, all days if
+    unset). None if the schedule can never run.
+    """
+    (hour, minute) = (int(x) for x in schedule["time"].split(":"))
+    days = schedule.get("days") or range(7)
+
+    start = datetime.fromtimestamp(after).replace(hour=hour, minute=minute, second=0, microsecond=0)
+    for offset in range(8):
+        candidate = start + timedelta(days=offset)
+        if candidate.weekday() in days and candidate.timestamp() > after:
+            return candidate.timestamp()
+    return None
+
+class AmbienceScheduler(metaclass=Singleton):
+    """
+    Runs timed actions stored in the config under "schedules":
+
+        {"id": ..., "label": "Warm dim", "time": "22:00", "days": [0, 1, 2],
+         "group": "Living room", "device": {<device config>} or None,
+         "action": {"power": True, "color": [h, s, b, k], "infrared": i},
+         "enabled": True}
+
+    Due times are kept in a heap and a single thread sleeps until the
+    earliest one, so the number of schedules doesn't add wakeups. Everything
+    due at the same moment runs off one config read.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []
+        self.schedules = {}     # id: (schedule, generation)
+        self.generation = 0
+        self.thread = None
+
+    def start(self):
+        with self.cond:
+            if self.thread:
+                return
+            self.thread = threading.Thread(target=self.run_loop)
+            self.thread.daemon = True
+            self.thread.start()
+        self.reload()
+
+    def reload(self):
+        """
+        Rebuilds the heap from the config. Malformed schedules are skipped.
+        """
+        schedules = []
+        for schedule in AmbienceLoader().get_schedules():
+            try:
+                validate(schedule)
+                schedules.append(schedule)
+            except AmbienceScheduleException as e:
+                print("Skipping schedule", schedule.get("label") if isinstance(schedule, dict) else schedule, e)
+
+        now = time.time()
+
+        with self.cond:
+            self.heap = []
+            self.schedules = {}
+            for schedule in schedules:
+                schedule.setdefault("id", str(uuid.uuid4()))
+                self.queue(schedule, now)
+            self.cond.notify()
+
+    def queue(self, schedule, after):
+        """
+        Adds the next run of schedule, which must have been validated.
+        Entries of a replaced or removed schedule are left in the heap and
+        skipped by their generation. Called with cond held.
+        """
+        self.generation += 1
+        self.schedules[schedule["id"]] = (schedule, self.generation)
+
+        if not schedule.get("enabled", True):
+            return
+
+        if (due := next_due(schedule, after)) is not None:
+            heapq.heappush(self.heap, (due, self.generation, schedule["id"]))
+
+    def get_schedules(self):
+        with self.cond:
+            return [schedule for (schedule, _) in self.schedules.values()]
+
+    def add_schedule(self, schedule):
+        """
+        Adds or replaces (by id) a schedule and saves it to the config.
+        Raises AmbienceScheduleException if it is malformed.
+        """
+        validate(schedule)
+        schedule.setdefault("id", str(uuid.uuid4()))
+        with self.cond:
+            self.queue(schedule, time.time())
+            self.cond.notify()
+        self.save()
+        return schedule["id"]
+
+    def remove_schedule(self, schedule_id):
+        with self.cond:
+            self.schedules.pop(schedule_id, None)
+            self.cond.notify()
+        self.save()
+
+    def save(self):
+        AmbienceLoader().write_schedules(self.get_schedules())
+
+    def pop_due(self):
+        """
+        Blocks until at least one schedule is due and returns the due
+        schedules, queueing their next runs.
+        """
+        with self.cond:
+            while True:
+                now = time.time()
+                due = []
+                while self.heap and self.heap[0][0] <= now:
+                    (due_time, generation, schedule_id) = heapq.heappop(self.heap)
+                    if schedule_id not in self.schedules:
+                        continue
+
+                    (schedule, current) = self.schedules[schedule_id]
+                    if generation != current:
+                        continue
+
+                    self.queue(schedule, max(due_time, now))
+                    if now - due_time <= GRACE:
+                        due.append(schedule)
+
+                if due:
+                    return due
+
+                timeout = self.heap[0][0] - now if self.heap else MAX_SLEEP
+                self.cond.wait(min(timeout, MAX_SLEEP))
+
+    def run_loop(self):
+        while True:
+            due = self.pop_due()
+            try:
+                self.run_due(due)
+            except Exception as e: # Keep the thread alive for the next ones
+                print("Running schedules failed:", e)
+
+    def run_due(self, due):
+        groups = {config["label"]: config for config in AmbienceLoader().get_config()["groups"]}
+        loaded = {}
+
+        for schedule in due:
+            try:
+                label = schedule.get("group")
+                if label not in groups:
+                    print("Schedule", schedule.get("label"), "targets missing group", label)
+                    continue
+
+                if label not in loaded:
+                    loaded[label] = AmbienceGroup.from_config(groups[label])
+                    loaded[label].generate_groups()
+
+                self.run_action(loaded[label], schedule)
+            except Exception as e:
+                print("Schedule", schedule.get("label"), "failed:", e)
+
+    def run_action(self, group, schedule):
+        action = schedule.get("action", {})
+
+        targets = [group]
+        if device_config := schedule.get("device"):
+            targets = [device for device in group.get_devices() if device.write_config() == device_config]
+
+        for target in targets:
+            if "color" in action:
+                target.set_color(list(action["color"]))
+            if "infrared" in action:
+                target.set_infrared(action["infrared"])
+            if "power" in action:
+                target.set_power(action["power"])
+
+        # The window's copies of these devices still cache the old state
+        AmbienceUnsyncedDevices().mark(targets if device_config else group.get_devices())
@@ -17,7 +17,13 @@
 
 from typing import Dict
 from gi.repository import GLib, Gio
-import json
+from concurrent.futures import ThreadPoolExecutor, wait
+import json, threading
+
+from lifxlan import Light, WorkflowException
+
+MIGRATION_DEADLINE = 5 # seconds
+MIGRATION_WORKERS  = 16
 
 def get_old_dest_file():
     """
@@ -94,31 +100,112 @@ def write_config(config, dest_file):
     else:
         print("Unable to create required directory/ies for config file")
 
-def convert_old_config():
-    print("Converting old config file...")
-
+def index_config(config):
+    """
+    Returns the groups of config by label and the set of MACs it contains.
+    Handles both pre 1.4 ("lights") and current ("devices") groups.
+    """
+    groups = {}
+    macs = set()
+    for group in config["groups"]:
+        groups[group["label"]] = group
+        for light in group.get("lights", []):
+            macs.add(light["mac"])
+        for device in group.get("devices", []):
+            if device.get("kind") == "lifx":
+                macs.add(device["data"]["mac"])
+    return groups, macs
+
+def query_old_lights(progress_cb=None):
+    """
+    Asks every bulb of the old config for its group at the same time.
+    Returns (light, group label) pairs; bulbs that haven't answered by
+    MIGRATION_DEADLINE get None. Returns at the deadline, queries still in
+    flight finish in the background and are ignored. progress_cb(done,
+    total) is called from the querying threads.
+    """
     old = get_config(get_old_dest_file())
-    new = get_config(get_dest_file())
+    if not isinstance(old, list):
+        old = []
 
-    for l in old:
-        light = Light(l["mac"], l["ip"])
+    group_labels = [None] * len(old)
+    done = [0]
+    expired = [False]
+    lock = threading.Lock()
 
+    def query_group(index, l):
         try:
-            group = light.get_group_label()
-            new = add_light_to_group(new, group, l)
+            label = Light(l["mac"], l["ip"]).get_group_label()
         except WorkflowException:
-            in_new = False
-            for group in new["groups"]:
-                for light in group["lights"]:
-                    if l["mac"] == light["mac"] and l["ip"] and light["ip"]:
-                        in_new = True
-                        break
-
-            if not in_new:
-                new = add_light_to_group(new, "Unknown Group", l)
+            label = None
+
+        with lock:
+            if expired[0]:
+                return
+            group_labels[index] = label
+            done[0] += 1
+            if progress_cb:
+                progress_cb(done[0], len(old))
+
+    pool = ThreadPoolExecutor(max_workers=MIGRATION_WORKERS)
+    futures = [pool.submit(query_group, i, l) for (i, l) in enumerate(old)]
+    wait(futures, timeout=MIGRATION_DEADLINE)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    with lock:
+        expired[0] = True
+        return list(zip(old, group_labels))
+
+def merge_old_lights(lights):
+    """
+    Adds the (light, group label) pairs of query_old_lights to the new
+    config. Lights without a label end up in "Unknown Group" unless the
+    config already has them.
+    """
+    new = get_config(get_dest_file())
+    groups, macs = index_config(new)
+    migrated, unknown, skipped = 0, 0, 0
+
+    for (l, label) in lights:
+        if l["mac"] in macs:
+            skipped += 1
+            continue
+
+        if not label:
+            label = "Unknown Group"
+            unknown += 1
+        else:
+            migrated += 1
+
+        if "version" in new: # Already migrated to devices
+            if label not in groups:
+                groups[label] = {"label": label, "devices": []}
+                new["groups"].append(groups[label])
+
+            groups[label]["devices"].append({
+                "label": l.get("label", ""),
+                "kind": "lifx",
+                "data": {"ip": l["ip"], "mac": l["mac"]}
+            })
+        else:
+            if label not in groups:
+                groups[label] = {"label": label, "lights": []}
+                new["groups"].append(groups[label])
+
+            groups[label]["lights"].append(l)
+        macs.add(l["mac"])
 
     write_config(new, get_dest_file())
 
+    print(f"Converted {len(lights)} lights: {migrated} into their groups, {unknown} into Unknown Group, {skipped} already present")
+
+def convert_old_config(progress_cb=None):
+    """
+    Moves the lights of the old config into groups in the new one.
+    """
+    print("Converting old config file...")
+    merge_old_lights(query_old_lights(progress_cb))
+
 def move_old_config():
     data_dir = GLib.get_user_config_dir()
     dest = GLib.build_filenamev([data_dir, "lights.json.bak"])
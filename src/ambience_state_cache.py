@@ -0,0 +1,114 @@
+# ambience_state_cache.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+import json, threading, time
+
+from ambience.ambience_files import atomic_write_json
+from ambience.model.ambience_light import AmbienceLightCapabilities
+from ambience.singleton import Singleton
+
+CACHE_FILE_NAME = "state.json"
+MAX_AGE         = 30 * 24 * 60 * 60 # seconds, older entries are dropped on load
+
+class AmbienceStateCache(metaclass=Singleton):
+    """
+    Last known state of every device, kept in the user cache directory so
+    tiles can be drawn right away on the next launch. Devices filled from
+    the cache are marked stale until a refresh revalidates them.
+
+    Entries are keyed by the device's static id, so a bulb that got a new
+    address keeps its entry, and stored as
+    [label, power, color, capabilities, timestamp].
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = self.read()
+
+    def get_path(self):
+        return GLib.build_filenamev([GLib.get_user_cache_dir(), "ambience", CACHE_FILE_NAME])
+
+    def valid(self, entry) -> bool:
+        return isinstance(entry, list) and len(entry) == 5 \
+            and isinstance(entry[0], str) \
+            and (entry[2] is None or (isinstance(entry[2], list) and len(entry[2]) == 4)) \
+            and isinstance(entry[3], list) \
+            and isinstance(entry[4], (int, float))
+
+    def read(self) -> dict:
+        try:
+            with open(self.get_path()) as cache_file:
+                entries = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(entries, dict):
+            return {}
+
+        oldest = time.time() - MAX_AGE
+        return {key: entry for (key, entry) in entries.items() if self.valid(entry) and entry[4] >= oldest}
+
+    def apply(self, devices):
+        """
+        Fills devices that haven't been loaded yet from the cache and marks
+        them stale.
+        """
+        for device in devices:
+            if device.available is not None:
+                continue
+
+            entry = self.entries.get(device.get_static_id())
+            if not entry:
+                continue
+
+            (label, power, color, capabilities, _) = entry
+            try:
+                capabilities = [AmbienceLightCapabilities(c) for c in capabilities]
+            except ValueError: # Written by a version with other capabilities
+                continue
+
+            device.label = device.label or label
+            device.power = power
+            device.color = tuple(color) if color else None
+            device.capabilities = capabilities
+            device.stale = True
+
+    def store(self, devices):
+        """
+        Records the state of every loaded device and writes the cache file.
+        """
+        now = time.time()
+
+        with self.lock:
+            for device in devices:
+                if not device.available or not device.capabilities:
+                    continue
+
+                self.entries[device.get_static_id()] = [
+                    device.label,
+                    bool(device.power),
+                    [round(c, 4) for c in device.color] if device.color else None,
+                    [c.value for c in device.capabilities],
+                    round(now)
+                ]
+
+            try:
+                atomic_write_json(self.get_path(), self.entries)
+            except (OSError, TypeError, ValueError) as error:
+                print(f"Could not write state cache: {error}")
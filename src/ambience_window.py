@@ -16,17 +16,21 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from struct import error
-import threading
+import asyncio, threading
 
 from gi.repository import Gtk, Gdk, GLib, Handy
 
 from .ambience_loader import *
 
 from .ambience_discovery import AmbienceDiscovery
+from .ambience_info_cache import AmbienceInfoCache
+from .ambience_profiler import AmbienceProfiler
+from .ambience_state_cache import AmbienceStateCache
 
 from ambience.widgets.ambience_flow_box import AmbienceFlowBox
 from ambience.widgets.ambience_group_tile import AmbienceGroupTile
 from ambience.widgets.ambience_light_tile import AmbienceLightTile
+from ambience.widgets.ambience_light_grid import AmbienceLightGrid
 from ambience.widgets.ambience_edit_tile import AmbienceEditTile
 from ambience.widgets.ambience_group_row import AmbienceGroupRow
 from ambience.widgets.ambience_tile import AmbienceTile
@@ -34,6 +38,12 @@ from ambience.widgets.ambience_tile import AmbienceTile
 from ambience.views.ambience_group_control import AmbienceGroupControl
 from ambience.views.ambience_light_control import AmbienceLightControl
 
+from ambience.model.ambience_event_loop import AmbienceEventLoop, AmbienceTaskScope
+from ambience.model.ambience_notify import AmbienceNotifier
+from ambience.model.ambience_retry import AmbienceRetry, AmbienceBreakerState, AmbienceDeviceUnavailableException
+
+from ambience.providers.ambience_providers import AmbienceProviders
+
 import threading
 
 @Gtk.Template(resource_path='/io/github/lukajankovic/ambience/ambience_window.ui')
@@ -64,6 +74,7 @@ class AmbienceWindow(Handy.ApplicationWindow):
     controls_deck = Gtk.Template.Child()
     tiles_box = Gtk.Template.Child()
 
+    tiles_scroll = Gtk.Template.Child()
     tiles_list = Gtk.Template.Child()
 
     new_group_popover = Gtk.Template.Child()
@@ -78,11 +89,16 @@ class AmbienceWindow(Handy.ApplicationWindow):
     etiles_revealer = Gtk.Template.Child()
     etiles_remove = Gtk.Template.Child()
 
+    LOAD_CONCURRENCY = 16 # Devices loaded at the same time when selecting a group
+    INFO_CONCURRENCY = 2  # Devices whose info is prefetched at the same time
+
     group_labels = []
     group_to_delete = []
     edit_devices_tiles = []
     editing = False
     should_update_sb_label = True
+    light_grid = None
+    active_group = None
 
     def create_header_label(self):
         """
@@ -135,6 +151,11 @@ class AmbienceWindow(Handy.ApplicationWindow):
 
         self.refresh_button.set_sensitive(False)
         self.clear_tiles()
+        self.clear_controls()
+
+        # Stops loading the group shown before
+        self.group_tasks.cancel()
+        self.group_tasks = AmbienceTaskScope()
 
         if not self.sidebar.get_selected_row():
             self.group_label_edit.set_visible(False)
@@ -143,6 +164,9 @@ class AmbienceWindow(Handy.ApplicationWindow):
 
         self.main_leaflet.set_visible_child_name("controls")
 
+        if self.active_group: # Keep changes made while it was shown
+            AmbienceEventLoop().submit(asyncio.to_thread(AmbienceStateCache().store, self.active_group.get_devices()))
+
         self.active_group = self.sidebar.get_selected_row().group
         self.title_label.set_text(self.active_group.label)
 
@@ -158,12 +182,10 @@ class AmbienceWindow(Handy.ApplicationWindow):
             self.tiles_list.add(add_category)
             return
 
-        tile_size_group = Gtk.SizeGroup()
-        tile_size_group.set_mode(Gtk.SizeGroupMode.HORIZONTAL)
-
         all_category = AmbienceFlowBox()
         all_tile = AmbienceGroupTile(self.active_group, self.group_edit)
-        tile_size_group.add_widget(all_tile)
+        all_tile.update()
+        self.light_grid.size_group.add_widget(all_tile)
 
         all_category.insert(all_tile, -1)
         self.tiles_list.add(all_category)
@@ -173,52 +195,94 @@ class AmbienceWindow(Handy.ApplicationWindow):
 
         self.tiles_list.add(header_label)
 
-        lights_category = AmbienceFlowBox()
+        AmbienceStateCache().apply(self.active_group.get_devices())
+        self.light_grid.set_devices(self.active_group.get_devices())
+        self.tiles_list.add(self.light_grid)
 
-        for device in self.active_group.get_devices():
-            light_tile = AmbienceLightTile(device, self.tile_clicked)
-            device.tile = light_tile
-            tile_size_group.add_widget(light_tile)
-            lights_category.insert(light_tile, -1)
+        group = self.active_group
+        group_tasks = self.group_tasks
 
-        self.tiles_list.add(lights_category)
+        async def load_data_async():
+            with AmbienceProfiler().timed("sidebar_selected"):
+                semaphore = asyncio.Semaphore(self.LOAD_CONCURRENCY)
 
-        def load_data_async():
-            for device in self.active_group.devices:
-                if device.get_online():
-                    for _ in range(5):
-                        try:
-                            if not device.capabilities:
-                                device.capabilities = device.get_capabilities()
-                            
-                            if not device.color:
-                                device.color = device.get_color()
-                            
-                            if not device.label:
-                                device.label = device.get_label()
-
-                            if not device.power:
-                                device.power = device.get_power()
-
-                            if not device.info:
-                                device.info = device.get_info()
-                            break
-                        except:
-                            pass
-
-                    device.available = True
-                else:
-                    device.available = False
+                async def load(device):
+                    async with semaphore:
+                        await self.load_device(device)
+
+                await asyncio.gather(*[load(device) for device in group.devices])
+                await asyncio.to_thread(AmbienceLoader().reconcile_labels, group.devices)
+                await asyncio.to_thread(AmbienceStateCache().store, group.devices)
+
+            group_tasks.idle(self.refresh_button.set_sensitive, True)
+
+            await self.prefetch_info(group.devices)
+
+        # Also re-enables refresh when loading failed half way
+        group_tasks.submit(load_data_async(), lambda _: group_tasks.idle(self.refresh_button.set_sensitive, True))
+
+    async def load_device_data(self, device):
+        """
+        Fetches whatever state of device isn't cached yet.
+        """
+        connector = AmbienceProviders().import_async_provider(device.kind)
+
+        if not await connector.get_online(device):
+            raise AmbienceDeviceUnavailableException
 
-                def enable_refresh_button():
-                    self.refresh_button.set_sensitive(True)
+        if not device.capabilities:
+            device.capabilities = await connector.get_capabilities(device)
 
-                GLib.idle_add(device.tile.update)
-            GLib.idle_add(all_tile.update)
-            GLib.idle_add(enable_refresh_button)
-        load_devices_thread = threading.Thread(target=load_data_async)
-        load_devices_thread.daemon = True
-        load_devices_thread.start()
+        await connector.refresh_state(device)
+
+    async def prefetch_info(self, devices):
+        """
+        Fills in static info once the group has loaded. It is only shown on
+        the light page, so this runs last and a few devices at a time.
+        """
+        semaphore = asyncio.Semaphore(self.INFO_CONCURRENCY)
+
+        async def prefetch(device):
+            async with semaphore:
+                try:
+                    device.info = await asyncio.to_thread(AmbienceRetry().call, device,
+                                                          lambda: AmbienceInfoCache().load(device, False))
+                except AmbienceDeviceUnavailableException:
+                    pass
+
+        try:
+            await asyncio.gather(*[prefetch(device) for device in devices if device.available])
+        finally:
+            await asyncio.to_thread(AmbienceInfoCache().write)
+
+    async def load_device(self, device):
+        """
+        Loads device through the shared retry policy, failing fast if it is
+        known to be down.
+        """
+        try:
+            await AmbienceRetry().call_async(device, lambda: self.load_device_data(device))
+            device.available = True
+        except AmbienceDeviceUnavailableException:
+            device.available = False
+        device.stale = False
+
+    def breaker_changed(self, device, state):
+        """
+        A device went down or came back. Runs on a background thread.
+        """
+        if not self.active_group:
+            return
+
+        key = device.get_static_id()
+        for d in self.active_group.get_devices():
+            if d.get_static_id() != key:
+                continue
+
+            if state == AmbienceBreakerState.CLOSED:
+                self.group_tasks.submit(self.load_device(d))
+            else:
+                d.available = False
 
     def show_edit_tiles(self):
         self.refresh_button.set_sensitive(False)
@@ -284,21 +348,15 @@ class AmbienceWindow(Handy.ApplicationWindow):
         confirm_dialog.run()
         confirm_dialog.destroy()
 
-    def update_tiles(self, light=None):
-        for child in self.tiles_list.get_children():
-            if type(child) == AmbienceFlowBox:
-                for tile in child.flowbox.get_children():
-                    if (type(tile) == AmbienceLightTile and \
-                       ((light and light.write_config() == tile.light.write_config()) or not light)) or \
-                       (type(tile) == AmbienceGroupTile):
-                        tile.update()
-
     def clear_controls(self):
         """
-        Removes control views from deck.
+        Removes control views from deck, stopping what they still load.
+        Pages left by swiping back are only removed here.
         """
         self.controls_deck.set_visible_child_name("tiles")
         for child in self.controls_deck.get_children()[1:]:
+            if isinstance(child, AmbienceLightControl):
+                child.tasks.cancel()
             self.controls_deck.remove(child)
 
     def clear_sidebar(self):
@@ -307,6 +365,7 @@ class AmbienceWindow(Handy.ApplicationWindow):
         """
 
         for sidebar_item in self.sidebar.get_children():
+            sidebar_item.unsubscribe()
             self.sidebar.remove(sidebar_item)
 
     def clear_tiles(self):
@@ -314,7 +373,15 @@ class AmbienceWindow(Handy.ApplicationWindow):
         Empties the main view from tiles, headers, etc.
         """
 
+        if self.light_grid:
+            self.light_grid.set_devices([])
+
         for group_item in self.tiles_list.get_children():
+            if type(group_item) == AmbienceFlowBox:
+                for tile in group_item.flowbox.get_children():
+                    if type(tile) == AmbienceGroupTile:
+                        tile.unsubscribe()
+                        self.light_grid.size_group.remove_widget(tile)
             self.tiles_list.remove(group_item)
 
     @Gtk.Template.Callback("create_group")
@@ -404,6 +471,7 @@ class AmbienceWindow(Handy.ApplicationWindow):
         """
 
         def discovery_done(sender, user_data):
+            sender.scan_tasks.cancel()
             self.sidebar_selected(self, None)
 
         discovery_window = AmbienceDiscovery(transient_for=self, modal=True, use_header_bar=1)
@@ -416,16 +484,17 @@ class AmbienceWindow(Handy.ApplicationWindow):
         Reloads data from config file and populates sidebar.
         """
 
-        self.controls_deck.set_visible_child(self.tiles_box)
-        self.clear_tiles()
-        self.clear_sidebar()
+        with AmbienceProfiler().phase("reload"):
+            self.controls_deck.set_visible_child(self.tiles_box)
+            self.clear_tiles()
+            self.clear_sidebar()
 
-        for group in AmbienceLoader().get_all_groups():
-            group.generate_groups()
-            group_row = AmbienceGroupRow(group)
-            group_row.check_action = self.update_delete_list
-            self.group_labels.append(group_row.get_title())
-            self.sidebar.insert(group_row, -1)
+            for group in AmbienceLoader().get_all_groups():
+                group.generate_groups()
+                group_row = AmbienceGroupRow(group)
+                group_row.check_action = self.update_delete_list
+                self.group_labels.append(group_row.get_title())
+                self.sidebar.insert(group_row, -1)
 
     @Gtk.Template.Callback("reload_group")
     def reload_group(self, sender):
@@ -433,12 +502,10 @@ class AmbienceWindow(Handy.ApplicationWindow):
             device.capabilities = None
             device.color = None
             device.power = None
-            device.info = None
         self.sidebar_selected(self, None)
 
     def reload_group_name(self):
         self.title_label.set_text(self.active_group.get_label())
-        self.sidebar.get_selected_row().set_title(self.active_group.get_label())
 
     def group_label_valid(self, text):
         return text and not (text in self.group_labels and text != self.active_group.get_label())
@@ -490,10 +557,10 @@ class AmbienceWindow(Handy.ApplicationWindow):
         """
         Runs when a tile gets clicked. Switches to the light control page.
         """
+        self.clear_controls()
         light_controls = AmbienceLightControl(tile.light,
                                               self.controls_deck,
-                                              self.light_control_exit,
-                                              self.update_tiles)
+                                              self.light_control_exit)
         light_controls.set_visible(True)
 
         self.controls_deck.insert_child_after(light_controls, self.tiles_box)
@@ -501,10 +568,10 @@ class AmbienceWindow(Handy.ApplicationWindow):
         light_controls.show()
 
     def group_edit(self, tile):
+        self.clear_controls()
         group_controls = AmbienceGroupControl(tile.group,
                                               self.controls_deck,
-                                              self.light_control_exit,
-                                              self.update_tiles)
+                                              self.light_control_exit)
 
         group_controls.set_visible(True)
 
@@ -520,8 +587,8 @@ class AmbienceWindow(Handy.ApplicationWindow):
         value = -1
         for light in self.online:
             if value == -1:
-                value = light.__dict__[prop]
-            elif not value == light.__dict__[prop]:
+                value = getattr(light, prop)
+            elif not value == getattr(light, prop):
                 break
 
         if value == -1:
@@ -531,6 +598,7 @@ class AmbienceWindow(Handy.ApplicationWindow):
     def remove_group(self, row):
         AmbienceLoader().delete_group(row.group)
         self.group_labels.remove(row.group.get_label())
+        row.unsubscribe()
         self.sidebar.remove(row)
 
     def update_delete_list(self, row):
@@ -579,4 +647,25 @@ class AmbienceWindow(Handy.ApplicationWindow):
 
     def __init__(self, lan, **kwargs):
         super().__init__(**kwargs)
+
+        AmbienceNotifier().set_dispatcher(GLib.idle_add)
+        AmbienceEventLoop().set_dispatcher(GLib.idle_add)
+        self.group_tasks = AmbienceTaskScope()
+
+        self.light_grid = AmbienceLightGrid(self.tiles_scroll.get_vadjustment(), self.tile_clicked)
+        AmbienceRetry().add_listener(self.breaker_changed)
         self.reload(self)
+
+        AmbienceEventLoop().submit(asyncio.to_thread(AmbienceLoader().convert_old_config, self.migration_progress),
+                                   self.migration_done)
+
+    def migration_progress(self, done, total):
+        GLib.idle_add(self.header_bar.set_subtitle, f"Migrating lights {done}/{total}")
+
+    def migration_done(self, future):
+        """
+        Shows the lights moved from the old config, if there were any.
+        """
+        if not future.exception() and future.result():
+            GLib.idle_add(self.reload, self)
+        GLib.idle_add(self.header_bar.set_subtitle, None)
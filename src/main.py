@@ -21,8 +21,10 @@ import gi
 gi.require_version('Gtk', '3.0')
 gi.require_version('Handy', '1')
 
-from gi.repository import Gtk, Gdk, Gio, Handy
+from gi.repository import Gtk, Gdk, Gio, GLib, Handy
 
+from .ambience_profiler import AmbienceProfiler
+from .ambience_scheduler import AmbienceScheduler
 from .ambience_window import AmbienceWindow
 from .ambience_discovery import AmbienceDiscovery
 
@@ -31,6 +33,8 @@ class Application(Gtk.Application):
     win = None
     lan = None
     version = ""
+    startup_run = None
+    background = False
 
     def __init__(self):
         super().__init__(application_id='io.github.lukajankovic.ambience',
@@ -44,6 +48,29 @@ class Application(Gtk.Application):
         refresh_action.connect("activate", self.do_refresh)
         self.add_action(refresh_action)
 
+        # Hidden, toggles cProfile and tracemalloc reports for bug reports
+        profile_action = Gio.SimpleAction.new_stateful("profile", None,
+                                                       GLib.Variant.new_boolean(AmbienceProfiler().enabled()))
+        profile_action.connect("change-state", self.toggle_profiling)
+        self.add_action(profile_action)
+        self.set_accels_for_action("app.profile", ["<Primary><Shift>p"])
+
+        self.add_main_option("background", 0, GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+                             "Run schedules without opening a window", None)
+
+    def do_handle_local_options(self, options):
+        if options.contains("background"):
+            self.background = True
+        return -1
+
+    def do_startup(self):
+        Gtk.Application.do_startup(self)
+        AmbienceScheduler().start()
+
+    def toggle_profiling(self, action, state):
+        action.set_state(state)
+        AmbienceProfiler().set_modes(("cprofile", "tracemalloc") if state.get_boolean() else ())
+
     def about(self, state, user_data):
         about = Gtk.AboutDialog(transient_for=self.win, modal=True)
         authors = ["Luka Jankovic"]
@@ -65,6 +92,12 @@ class Application(Gtk.Application):
         self.win.reload(self)
 
     def do_activate(self):
+        if self.background:
+            # Stays alive for the scheduler; a later launch opens the window
+            self.background = False
+            self.hold()
+            return
+
         self.win = self.props.active_window
         if not self.win:
             self.win = AmbienceWindow(self.lan, application=self)
@@ -76,11 +109,21 @@ class Application(Gtk.Application):
 
         self.win.present()
 
+        def end_startup():
+            AmbienceProfiler().end(self.startup_run)
+            self.startup_run = None
+
+        if self.startup_run:
+            GLib.idle_add(end_startup)
+
 
 def main(version):
 
+    startup_run = AmbienceProfiler().begin("startup")
+
     Handy.init()
 
     app = Application()
+    app.startup_run = startup_run
     app.version = version
     return app.run(sys.argv)
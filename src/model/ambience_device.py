@@ -16,7 +16,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from ambience.model.ambience_group import AmbienceGroup
+from ambience.model.ambience_notify import AmbienceProperty
 from enum import Enum
+import json
 
 class AmbienceDeviceException(Exception):
     """
@@ -35,10 +37,22 @@ class AmbienceDevice():
     """
     Template class to be extended by other template classes that want to
     represent a unique kind of device. (i.e. light)
+
+    Devices use __slots__ since large installs keep thousands of them in
+    memory; subclasses must declare __slots__ for any attribute they add.
+
+    Attributes shown in the UI are AmbienceProperty descriptors, widgets
+    subscribe to them through AmbienceNotifier.
     """
 
-    group = None
-    kind = None
+    __slots__ = ("group", "kind", "_label")
+
+    label = AmbienceProperty("label")
+
+    def __init__(self):
+        self.group = None
+        self.kind = None
+        self.label = None
 
     def get_label(self) -> str:
         raise AmbienceDeviceException 
@@ -58,6 +72,19 @@ class AmbienceDevice():
     def get_info(self) -> dict:
         raise AmbienceDeviceException
 
+    def get_static_id(self) -> str:
+        """
+        Identifies the physical device, whichever group it was loaded from.
+        """
+        return self.kind + ":" + json.dumps(self.write_config(), sort_keys=True)
+
+    def get_info_version(self):
+        """
+        Cheap fingerprint of what get_info returns; AmbienceInfoCache
+        fetches the info again when it changes. Must be JSON serialisable.
+        """
+        return None
+
     def write_config(self) -> dict:
         raise AmbienceDeviceException
 
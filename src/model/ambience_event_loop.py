@@ -0,0 +1,167 @@
+# ambience_event_loop.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from concurrent.futures import ThreadPoolExecutor
+import asyncio, threading
+
+from ambience.singleton import Singleton
+
+MAX_WORKERS = 16    # threads for blocking device calls, shared by the whole app
+
+class AmbienceEventLoop(metaclass=Singleton):
+    """
+    The asyncio loop all provider I/O is scheduled on. It runs on its own
+    daemon thread next to the GTK main loop. Blocking calls made through
+    asyncio.to_thread share one pool of MAX_WORKERS threads.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                                          thread_name_prefix="ambience-io"))
+        self.dispatcher = None
+
+        loop_thread = threading.Thread(target=self.loop.run_forever)
+        loop_thread.daemon = True
+        loop_thread.start()
+
+    def submit(self, coro, done_cb=None, report=True):
+        """
+        Schedules coro on the loop from any thread. done_cb(future) runs on
+        the loop thread once it finishes. Unless report is False, an
+        exception coro raised is printed. Returns a concurrent.futures.Future.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if report:
+            future.add_done_callback(self.report)
+        if done_cb:
+            future.add_done_callback(done_cb)
+        return future
+
+    def report(self, future):
+        if not future.cancelled() and (error := future.exception()):
+            print("Background task failed:", repr(error))
+
+    def run(self, coro):
+        """
+        Runs coro on the loop and blocks until it is done, raising what coro
+        raised. Must not be called from the loop thread.
+        """
+        return self.submit(coro, report=False).result()
+
+    def set_dispatcher(self, dispatcher):
+        """
+        dispatcher(fn) runs fn on the UI thread, e.g. GLib.idle_add.
+        """
+        self.dispatcher = dispatcher
+
+    def dispatch(self, fn):
+        if self.dispatcher:
+            self.dispatcher(fn)
+        else:
+            fn()
+
+class AmbienceTaskScope():
+    """
+    Work started by one view. Cancelling the scope cancels its coroutines,
+    which drops their queued blocking calls, and stops their UI callbacks
+    from running, so a view that was left doesn't touch destroyed widgets.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock() # discard() runs inline if the future is already done
+        self.futures = set()
+        self.cancelled = False
+
+    def submit(self, coro, done_cb=None):
+        """
+        Schedules coro in this scope. done_cb(future) runs on the loop
+        thread once it finishes, including when it fails or is cancelled.
+        """
+        with self.lock:
+            if self.cancelled:
+                coro.close()
+                return None
+
+            future = AmbienceEventLoop().submit(coro, self.discard)
+            self.futures.add(future)
+
+        if done_cb:
+            future.add_done_callback(done_cb)
+        return future
+
+    def discard(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def idle(self, fn, *args):
+        """
+        Runs fn(*args) on the UI thread unless the scope has been cancelled
+        by then.
+        """
+        def run():
+            if not self.cancelled:
+                fn(*args)
+            return False
+
+        AmbienceEventLoop().dispatch(run)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            futures = list(self.futures)
+            self.futures.clear()
+
+        for future in futures:
+            future.cancel()
+
+class AmbienceWriteQueue():
+    """
+    Sends a view's writes from the event loop one at a time, in the order
+    they were made. A write still waiting when a newer one with the same
+    key arrives is replaced by it, so dragging a slider sends the latest
+    value rather than every step.
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.lock = threading.Lock()
+        self.pending = {} # key: coroutine function, oldest first
+        self.running = False
+
+    def put(self, key, coro_fn):
+        with self.lock:
+            self.pending.pop(key, None)
+            self.pending[key] = coro_fn
+            if self.running:
+                return
+            self.running = True
+
+        self.scope.submit(self.drain())
+
+    async def drain(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.running = False
+                    return
+                coro_fn = self.pending.pop(next(iter(self.pending)))
+
+            try:
+                await coro_fn()
+            except Exception as error:
+                print("Write failed:", repr(error))
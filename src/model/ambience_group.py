@@ -16,25 +16,70 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from ambience.providers.ambience_providers import AmbienceProviders
+from ambience.model.ambience_notify import AmbienceNotifier, AmbienceProperty
+from ambience.model.ambience_palette import changed_fields
+from ambience.singleton import Singleton
 
 from lifxlan import Group, group
+import asyncio, threading
+
+class AmbienceUnsyncedDevices(metaclass=Singleton):
+    """
+    Devices whose cached colour and infrared level may not match the device
+    any more: written through another group (the scheduler loads its own),
+    by a colour stream, or whose write was dropped. Keyed by static id so
+    every loaded copy of a device is covered. push_colors and push_infrared
+    send these the full value once.
+    """
+
+    PROPERTIES = ("color", "infrared")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.devices = {}
+
+    def mark(self, devices):
+        with self.lock:
+            for device in devices:
+                self.devices[device.get_static_id()] = set(self.PROPERTIES)
+
+    def take(self, device, prop) -> bool:
+        """
+        True, once, if device's cached prop can't be trusted.
+        """
+        if not self.devices:
+            return False
+
+        key = device.get_static_id()
+        with self.lock:
+            props = self.devices.get(key)
+            if not props or prop not in props:
+                return False
+
+            props.discard(prop)
+            if not props:
+                del self.devices[key]
+            return True
 
 class AmbienceGroup():
     """
-    Colleciton of AmbienceLights.
+    Colleciton of AmbienceLights. Notifies "label" and "devices" changes.
     """
 
-    label = ""
-    devices = []
-    groups = []
+    __slots__ = ("_label", "devices", "groups")
+
+    label = AmbienceProperty("label")
+
     providers = AmbienceProviders()
 
+    def __init__(self, label=""):
+        self.label = label
+        self.devices = []
+        self.groups = []
+
     @classmethod
     def from_config(cls, group_config):
-        new = cls()
-        new.label = group_config["label"]
-
-        new.devices = []
+        new = cls(group_config["label"])
 
         for device_config in group_config["devices"]: # TODO: parallelize using joblib (maybe)
             module = device_config["kind"]
@@ -72,28 +117,137 @@ class AmbienceGroup():
         for group in self.groups:
             group.set_color(hsvk)
 
+    def set_colors(self, colors):
+        """
+        Sets a different colour on each device. colors is aligned with
+        get_devices().
+        """
+        device_colors = {id(device): color for (device, color) in zip(self.devices, colors)}
+        for group in self.groups:
+            group.set_colors([device_colors[id(device)] for device in group.devices])
+
+    def stream_colors(self, colors):
+        """
+        Sends one frame of a colour stream, aligned with get_devices().
+        Returns False if part of it was dropped rather than sent.
+        """
+        device_colors = {id(device): color for (device, color) in zip(self.devices, colors)}
+        sent = True
+        for group in self.groups:
+            sent &= group.stream_colors([device_colors[id(device)] for device in group.devices]) is not False
+
+        # Frames don't update the cached colours
+        AmbienceUnsyncedDevices().mark(self.devices)
+        return sent
+
+    def plan_colors(self, colors):
+        """
+        Returns the writes push_colors makes, as (provider group,
+        device_colors, fields), and updates the cached colours.
+        """
+        unsynced = AmbienceUnsyncedDevices()
+        changes = {}
+        for (device, color) in zip(self.devices, colors):
+            cached = None if unsynced.take(device, "color") else device.color
+            if fields := changed_fields(cached, color):
+                changes[id(device)] = (device, color, fields)
+
+        writes = []
+        for group in self.groups:
+            by_fields = {}
+            for device in group.devices:
+                if id(device) in changes:
+                    (_, color, fields) = changes[id(device)]
+                    by_fields.setdefault(fields, []).append((device, color))
+
+            writes += [(group, device_colors, fields) for (fields, device_colors) in by_fields.items()]
+
+        for (device, color, _) in changes.values():
+            if device.color:
+                device.color = tuple(float(x) for x in color)
+
+        return writes
+
+    def push_colors(self, colors):
+        """
+        Like set_colors, but only devices whose cached colour differs from
+        the new one are written, and only with the components that changed.
+        Cached colours are updated. Returns the number of devices written.
+        """
+        writes = self.plan_colors(colors)
+        for (group, device_colors, fields) in writes:
+            group.set_device_colors(device_colors, fields)
+        return sum(len(device_colors) for (_, device_colors, _) in writes)
+
+    async def push_colors_async(self, colors):
+        """
+        push_colors for the event loop, writing to every provider at once.
+        """
+        writes = self.plan_colors(colors)
+        await asyncio.gather(*[group.set_device_colors_async(device_colors, fields)
+                               for (group, device_colors, fields) in writes])
+        return sum(len(device_colors) for (_, device_colors, _) in writes)
+
     def set_infrared(self, infrared):
         for group in self.groups:
             group.set_infrared(infrared)
 
+    def plan_infrared(self, infrared):
+        """
+        Returns the provider groups push_infrared writes to, and updates the
+        cached infrared levels.
+        """
+        unsynced = AmbienceUnsyncedDevices()
+        level = round(infrared * 65535)
+        groups = []
+        for group in self.groups:
+            changed = [device for device in group.devices
+                       if unsynced.take(device, "infrared") or device.infrared is None
+                       or round(device.infrared * 65535) != level]
+            if not changed:
+                continue
+
+            groups.append(group)
+            for device in changed:
+                if device.infrared is not None:
+                    device.infrared = infrared
+        return groups
+
+    def push_infrared(self, infrared):
+        """
+        Like set_infrared, skipping provider groups whose devices already
+        have this infrared level cached.
+        """
+        for group in self.plan_infrared(infrared):
+            group.set_infrared(infrared)
+
+    async def push_infrared_async(self, infrared):
+        await asyncio.gather(*[group.set_infrared_async(infrared) for group in self.plan_infrared(infrared)])
+
     def set_power(self, power):
         for group in self.groups:
             group.set_power(power)
 
+    async def set_power_async(self, power):
+        await asyncio.gather(*[group.set_power_async(power) for group in self.groups])
+
     def add_device(self, device):
         self.devices.append(device)
         self.generate_groups()
+        AmbienceNotifier().changed(self, "devices")
 
     def remove_device(self, device):
         if device in self.devices:
             self.devices.remove(device)
             self.generate_groups()
+            AmbienceNotifier().changed(self, "devices")
             return
 
         for d in self.devices:
             if d.write_config() == device.write_config():
                 self.devices.remove(d)
                 self.generate_groups()
+                AmbienceNotifier().changed(self, "devices")
                 return
 
     def get_devices(self):
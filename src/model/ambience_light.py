@@ -36,13 +36,25 @@ class AmbienceLight(AmbienceDevice):
     """
     Template class extended by different providers to bind actions to ui.
     """
-    label           = None
-    available       = None
-    capabilities    = None
-    color           = None
-    infrared        = None
-    power           = None
-    info            = None
+
+    __slots__ = ("_available", "_capabilities", "_color", "_infrared", "_power", "_stale", "info")
+
+    available       = AmbienceProperty("available")
+    capabilities    = AmbienceProperty("capabilities")
+    color           = AmbienceProperty("color")
+    infrared        = AmbienceProperty("infrared")
+    power           = AmbienceProperty("power")
+    stale           = AmbienceProperty("stale") # Fields come from AmbienceStateCache, not the device
+
+    def __init__(self):
+        super().__init__()
+        self.available      = None
+        self.capabilities   = None
+        self.color          = None
+        self.infrared       = None
+        self.power          = None
+        self.stale          = False
+        self.info           = None
 
     def get_capabilities(self) -> list:
         raise AmbienceLightException
@@ -59,6 +71,15 @@ class AmbienceLight(AmbienceDevice):
     def set_infrared(self, i):
         raise AmbienceLightCapabilities
 
+    def refresh_state(self):
+        """
+        Fetches color, power and label into the cached fields. Providers
+        that can read all of them in a single request should override this.
+        """
+        self.color = self.get_color()
+        self.power = self.get_power()
+        self.label = self.get_label()
+
     def get_data(self, capability):
         if capability == AmbienceLightCapabilities.COLOR:
             if self.color:
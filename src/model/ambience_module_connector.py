@@ -16,7 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from gi.repository import Gtk
-import json
+import asyncio, json
 
 from ambience.model.ambience_device import AmbienceDevice
 
@@ -30,7 +30,9 @@ class AmbienceModuleConnector():
     """
     Template class for connecting a module to Ambience. Every subclass must
     be named "AmbienceConnector" and be placed inside "ambience_connector.py"
-    and overwrite all functions.
+    and overwrite all functions. A provider with a native
+    AmbienceAsyncModuleConnector names it "AmbienceAsyncConnector" and
+    places it in the same file.
     """
 
     def display_name(self) -> str:
@@ -49,4 +51,102 @@ class AmbienceModuleConnector():
         raise AmbienceModuleConnectorException
 
     def discovery_list(self): # -> list[AmbienceDevice]:
-        raise AmbienceModuleConnectorException 
+        raise AmbienceModuleConnectorException
+
+class AmbienceAsyncModuleConnector():
+    """
+    Async variant of AmbienceModuleConnector. Everything that talks to a
+    device is a coroutine and must not block the event loop. Providers may
+    implement this instead of AmbienceModuleConnector; synchronous ones are
+    wrapped in AmbienceLegacyModuleConnector.
+    """
+
+    def display_name(self) -> str:
+        raise AmbienceModuleConnectorException
+
+    def compare_device(self, device) -> bool:
+        raise AmbienceModuleConnectorException
+
+    def save_device(self, device) -> dict:
+        raise AmbienceModuleConnectorException
+
+    async def discovery_list(self): # -> list[AmbienceDevice]
+        raise AmbienceModuleConnectorException
+
+    async def load_device(self, config, group) -> AmbienceDevice:
+        raise AmbienceModuleConnectorException
+
+    async def get_online(self, device) -> bool:
+        raise AmbienceModuleConnectorException
+
+    async def get_capabilities(self, device) -> list:
+        raise AmbienceModuleConnectorException
+
+    async def get_info(self, device) -> dict:
+        raise AmbienceModuleConnectorException
+
+    async def refresh_state(self, device):
+        """
+        Fills the device's cached color, power and label.
+        """
+        raise AmbienceModuleConnectorException
+
+    async def set_color(self, device, hsvk):
+        raise AmbienceModuleConnectorException
+
+    async def set_power(self, device, power):
+        raise AmbienceModuleConnectorException
+
+    async def set_infrared(self, device, infrared):
+        raise AmbienceModuleConnectorException
+
+    async def set_label(self, device, label):
+        raise AmbienceModuleConnectorException
+
+class AmbienceLegacyModuleConnector(AmbienceAsyncModuleConnector):
+    """
+    Exposes a synchronous AmbienceModuleConnector through the async API by
+    running its blocking calls on the loop's thread pool.
+    """
+
+    def __init__(self, connector):
+        self.connector = connector
+
+    def display_name(self):
+        return self.connector.display_name()
+
+    def compare_device(self, device):
+        return self.connector.compare_device(device)
+
+    def save_device(self, device):
+        return self.connector.save_device(device)
+
+    async def discovery_list(self):
+        return await asyncio.to_thread(self.connector.discovery_list)
+
+    async def load_device(self, config, group):
+        return await asyncio.to_thread(self.connector.load_device, config, group)
+
+    async def get_online(self, device):
+        return await asyncio.to_thread(device.get_online)
+
+    async def get_capabilities(self, device):
+        return await asyncio.to_thread(device.get_capabilities)
+
+    async def get_info(self, device):
+        return await asyncio.to_thread(device.get_info)
+
+    async def refresh_state(self, device):
+        await asyncio.to_thread(device.refresh_state)
+
+    async def set_color(self, device, hsvk):
+        await asyncio.to_thread(device.set_color, hsvk)
+
+    async def set_power(self, device, power):
+        await asyncio.to_thread(device.set_power, power)
+
+    async def set_infrared(self, device, infrared):
+        await asyncio.to_thread(device.set_infrared, infrared)
+
+    async def set_label(self, device, label):
+        await asyncio.to_thread(device.set_label, label)
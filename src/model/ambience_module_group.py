@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+
 class AmbienceModuleGroupException(Exception):
     """
     Raised when a function call is made directly onto an AmbienceModuleGroup 
@@ -32,8 +34,53 @@ class AmbienceModuleGroup():
     def set_color(self, hsvk):
         raise AmbienceModuleGroupException
 
+    def set_colors(self, colors):
+        """
+        Sets one colour per device, in the order the devices were passed to
+        the constructor.
+        """
+        raise AmbienceModuleGroupException
+
+    def set_device_colors(self, device_colors, fields):
+        """
+        Sets colours on some of the group's devices. device_colors is a list
+        of (device, hsvk) and fields the indices of the components that
+        changed. Providers able to send partial updates should override
+        this, the default sets each full colour one device at a time.
+        """
+        for (device, hsvk) in device_colors:
+            device.set_color(hsvk)
+
+    def stream_colors(self, colors):
+        """
+        Like set_colors, for frames sent many times a second. A frame may be
+        lost as the next one replaces it, so providers can skip
+        acknowledgements and retries here, and drop packets instead of
+        delaying them. Returns False if part of the frame was dropped.
+        """
+        self.set_colors(colors)
+        return True
+
     def set_infrared(self, infrared):
         raise AmbienceModuleGroupException
 
     def set_power(self, power):
-        raise AmbienceModuleGroupException
\ No newline at end of file
+        raise AmbienceModuleGroupException
+
+    # Async writes. These run the setters above on the loop's thread pool;
+    # providers whose writes don't block override them.
+
+    async def set_color_async(self, hsvk):
+        await asyncio.to_thread(self.set_color, hsvk)
+
+    async def set_colors_async(self, colors):
+        await asyncio.to_thread(self.set_colors, colors)
+
+    async def set_device_colors_async(self, device_colors, fields):
+        await asyncio.to_thread(self.set_device_colors, device_colors, fields)
+
+    async def set_infrared_async(self, infrared):
+        await asyncio.to_thread(self.set_infrared, infrared)
+
+    async def set_power_async(self, power):
+        await asyncio.to_thread(self.set_power, power)
@@ -0,0 +1,117 @@
+# ambience_notify.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+from ambience.singleton import Singleton
+
+class AmbienceProperty():
+    """
+    Model attribute that reports real value changes to AmbienceNotifier.
+    The value lives in the slot named "_" + name, so objects keep their
+    __slots__ layout.
+    """
+
+    __slots__ = ("name", "slot")
+
+    def __init__(self, name):
+        self.name = name
+        self.slot = "_" + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return getattr(obj, self.slot)
+
+    def __set__(self, obj, value):
+        old = getattr(obj, self.slot, value)
+        object.__setattr__(obj, self.slot, value)
+        if old is not value and old != value:
+            AmbienceNotifier().changed(obj, self.name)
+
+class AmbienceNotifier(metaclass=Singleton):
+    """
+    Delivers property changes of devices and groups to subscribers. Changes
+    made before the next dispatch are coalesced, so a subscriber hears about
+    an object at most once per main loop iteration, with the set of
+    properties that changed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.pending = {}
+        self.dispatcher = None
+
+    def set_dispatcher(self, dispatcher):
+        """
+        dispatcher(fn) runs fn on the UI thread, e.g. GLib.idle_add. Without
+        one changes are delivered immediately on the changing thread.
+        """
+        self.dispatcher = dispatcher
+
+    def subscribe(self, obj, properties, callback):
+        """
+        Calls callback(obj, changed) when any of properties changes on obj.
+        Returns a handle for unsubscribe().
+        """
+        handle = (obj, frozenset(properties), callback)
+        with self.lock:
+            self.subscribers.setdefault(id(obj), []).append(handle)
+        return handle
+
+    def unsubscribe(self, handle):
+        if not handle:
+            return
+
+        with self.lock:
+            handles = self.subscribers.get(id(handle[0]), [])
+            if handle in handles:
+                handles.remove(handle)
+            if not handles:
+                self.subscribers.pop(id(handle[0]), None)
+
+    def changed(self, obj, name):
+        if id(obj) not in self.subscribers:
+            return
+
+        with self.lock:
+            schedule = not self.pending
+            self.pending.setdefault(id(obj), (obj, set()))[1].add(name)
+
+        if not schedule:
+            return
+
+        if self.dispatcher:
+            self.dispatcher(self.flush)
+        else:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+
+        for (obj, changed) in pending.values():
+            with self.lock:
+                handles = list(self.subscribers.get(id(obj), []))
+
+            for (_, properties, callback) in handles:
+                if properties & changed:
+                    callback(obj, changed)
+
+        return False
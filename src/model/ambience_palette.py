@@ -0,0 +1,124 @@
+# ambience_palette.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Per-device colours for group operations. Colours are (hue, saturation,
+brightness, kelvin) rows with the first three in 0..1, computed for the
+whole group at once. NumPy is used when available.
+"""
+
+from enum import Enum
+import random
+
+try:
+    import numpy
+    NUMPY_AVAIL = True
+except ImportError:
+    NUMPY_AVAIL = False
+
+class AmbiencePalettePattern(Enum):
+    UNIFORM     = 0
+    SPREAD      = 1
+    GRADIENT    = 2
+    RANDOM      = 3
+
+def uniform(hsbk, count):
+    if NUMPY_AVAIL:
+        return numpy.tile(numpy.asarray(hsbk, dtype=float), (count, 1))
+    return [list(hsbk) for _ in range(count)]
+
+def gradient(start, end, count):
+    """
+    Linear interpolation from start to end. Hue takes the shorter way
+    around the colour wheel.
+    """
+    start = list(start)
+    end = list(end)
+    if end[0] - start[0] > 0.5:
+        end[0] -= 1
+    elif start[0] - end[0] > 0.5:
+        end[0] += 1
+
+    if NUMPY_AVAIL:
+        t = numpy.linspace(0, 1, count)[:, None]
+        colors = numpy.asarray(start, dtype=float) * (1 - t) + numpy.asarray(end, dtype=float) * t
+        colors[:, 0] %= 1
+        return colors
+
+    colors = []
+    for i in range(count):
+        t = i / (count - 1) if count > 1 else 0
+        color = [a * (1 - t) + b * t for (a, b) in zip(start, end)]
+        color[0] %= 1
+        colors.append(color)
+    return colors
+
+def hue_spread(hsbk, count, span=1.0):
+    """
+    Spreads hues evenly over span of the colour wheel starting at hsbk's hue.
+    """
+    if NUMPY_AVAIL:
+        colors = uniform(hsbk, count)
+        colors[:, 0] = (hsbk[0] + numpy.arange(count) * (span / max(count, 1))) % 1
+        return colors
+
+    return [[(hsbk[0] + i * span / max(count, 1)) % 1] + list(hsbk[1:]) for i in range(count)]
+
+def random_palette(hsbk, count, seed=None):
+    """
+    Random hues at hsbk's saturation, brightness and kelvin.
+    """
+    if NUMPY_AVAIL:
+        colors = uniform(hsbk, count)
+        colors[:, 0] = numpy.random.default_rng(seed).random(count)
+        return colors
+
+    rng = random.Random(seed)
+    return [[rng.random()] + list(hsbk[1:]) for _ in range(count)]
+
+def generate(pattern, hsbk, count):
+    if pattern == AmbiencePalettePattern.SPREAD:
+        return hue_spread(hsbk, count)
+    if pattern == AmbiencePalettePattern.GRADIENT:
+        return gradient(hsbk, [(hsbk[0] + 0.5) % 1] + list(hsbk[1:]), count)
+    if pattern == AmbiencePalettePattern.RANDOM:
+        return random_palette(hsbk, count)
+    return uniform(hsbk, count)
+
+def quantise(colors, scale=65535):
+    """
+    Scales hue, saturation and brightness of every row to 0..scale and
+    rounds all four components to integers.
+    """
+    if NUMPY_AVAIL:
+        colors = numpy.array(colors, dtype=float).reshape(-1, 4)
+        colors[:, :3] *= scale
+        return numpy.rint(colors).astype(int).tolist()
+
+    return [[round(c[0] * scale), round(c[1] * scale), round(c[2] * scale), round(c[3])] for c in colors]
+
+def quantise_one(hsbk, scale=65535):
+    return [round(hsbk[0] * scale), round(hsbk[1] * scale), round(hsbk[2] * scale), round(hsbk[3])]
+
+def changed_fields(old, new):
+    """
+    Indices of the components that differ between two colours once
+    quantised. Every component counts as changed when old is unknown.
+    """
+    if not old:
+        return (0, 1, 2, 3)
+    return tuple(i for (i, (a, b)) in enumerate(zip(quantise_one(old), quantise_one(new))) if a != b)
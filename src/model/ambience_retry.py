@@ -0,0 +1,181 @@
+# ambience_retry.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from enum import Enum
+import asyncio, random, threading, time
+
+from ambience.singleton import Singleton, MAX_RETRIES
+
+BASE_DELAY      = 0.1   # seconds, doubled after every failed attempt
+MAX_DELAY       = 1.0
+PROBE_DELAY     = 15    # seconds until a down device is probed again
+MAX_PROBE_DELAY = 300
+
+class AmbienceDeviceUnavailableException(Exception):
+    """
+    Raised when a device did not respond to any attempt, or is already known
+    to be down. settled is True once the device's breaker accounts for it;
+    AmbienceRetry raises it settled, anything else raising it (a device
+    reporting itself offline) counts as a failure.
+    """
+
+    def __init__(self, settled=False):
+        super().__init__()
+        self.settled = settled
+
+class AmbienceBreakerState(Enum):
+    CLOSED      = 0 # Device responding, calls go through
+    OPEN        = 1 # Device down, calls fail immediately
+    PROBING     = 2 # Device down, background probe in flight
+
+class AmbienceCircuitBreaker():
+    """
+    Reachability state of a single device.
+    """
+
+    __slots__ = ("device", "state", "probe_delay")
+
+    def __init__(self, device):
+        self.device = device
+        self.state = AmbienceBreakerState.CLOSED
+        self.probe_delay = PROBE_DELAY
+
+class AmbienceRetry(metaclass=Singleton):
+    """
+    Shared retry policy for device I/O. Failed attempts are retried with
+    exponential backoff and jitter. Once every attempt has failed the
+    device's breaker opens, further calls fail fast and the device is probed
+    in the background until it answers again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.listeners = []
+
+    def get_breaker(self, device):
+        key = device.get_static_id()
+        with self.lock:
+            if key not in self.breakers:
+                self.breakers[key] = AmbienceCircuitBreaker(device)
+            return self.breakers[key]
+
+    def get_state(self, device) -> AmbienceBreakerState:
+        return self.get_breaker(device).state
+
+    def add_listener(self, callback):
+        """
+        callback(device, state) is called from a background thread whenever
+        a device's breaker changes state.
+        """
+        self.listeners.append(callback)
+
+    def set_state(self, breaker, state, expected=None):
+        """
+        Moves breaker to state, only from the expected state if one is given.
+        Returns whether the state changed.
+        """
+        with self.lock:
+            if breaker.state == state or (expected and breaker.state != expected):
+                return False
+            breaker.state = state
+
+        for callback in self.listeners:
+            callback(breaker.device, state)
+        return True
+
+    def call(self, device, fn, attempts=MAX_RETRIES):
+        """
+        Runs fn, retrying on any exception. Raises
+        AmbienceDeviceUnavailableException without calling fn if the device
+        is known to be down. fn raising it unsettled trips the breaker
+        without further attempts.
+        """
+        breaker = self.get_breaker(device)
+        if breaker.state != AmbienceBreakerState.CLOSED:
+            raise AmbienceDeviceUnavailableException(True)
+
+        delay = BASE_DELAY
+        for attempt in range(attempts):
+            try:
+                return fn()
+            except AmbienceDeviceUnavailableException as error:
+                if error.settled: # By a nested call
+                    raise
+                break # The device says it is offline, asking again won't change that
+            except Exception:
+                if attempt < attempts - 1:
+                    time.sleep(random.uniform(0, delay))
+                    delay = min(delay * 2, MAX_DELAY)
+
+        self.trip(breaker)
+        raise AmbienceDeviceUnavailableException(True)
+
+    async def call_async(self, device, coro_fn, attempts=MAX_RETRIES):
+        """
+        Same as call() for coroutines: awaits coro_fn(), backing off with
+        asyncio.sleep between attempts.
+        """
+        breaker = self.get_breaker(device)
+        if breaker.state != AmbienceBreakerState.CLOSED:
+            raise AmbienceDeviceUnavailableException(True)
+
+        delay = BASE_DELAY
+        for attempt in range(attempts):
+            try:
+                return await coro_fn()
+            except AmbienceDeviceUnavailableException as error:
+                if error.settled: # By a nested call
+                    raise
+                break # The device says it is offline, asking again won't change that
+            except Exception:
+                if attempt < attempts - 1:
+                    await asyncio.sleep(random.uniform(0, delay))
+                    delay = min(delay * 2, MAX_DELAY)
+
+        self.trip(breaker)
+        raise AmbienceDeviceUnavailableException(True)
+
+    def trip(self, breaker):
+        # Concurrent failures trip once, an open breaker already has a probe
+        if self.set_state(breaker, AmbienceBreakerState.OPEN, AmbienceBreakerState.CLOSED):
+            self.schedule_probe(breaker)
+
+    def schedule_probe(self, breaker):
+        with self.lock:
+            delay = breaker.probe_delay * random.uniform(0.8, 1.2)
+            breaker.probe_delay = min(breaker.probe_delay * 2, MAX_PROBE_DELAY)
+
+        probe_timer = threading.Timer(delay, self.probe, args=(breaker,))
+        probe_timer.daemon = True
+        probe_timer.start()
+
+    def probe(self, breaker):
+        if not self.set_state(breaker, AmbienceBreakerState.PROBING, AmbienceBreakerState.OPEN):
+            return
+
+        try:
+            online = breaker.device.get_online()
+        except Exception:
+            online = False
+
+        if online:
+            with self.lock:
+                breaker.probe_delay = PROBE_DELAY
+            self.set_state(breaker, AmbienceBreakerState.CLOSED, AmbienceBreakerState.PROBING)
+        elif self.set_state(breaker, AmbienceBreakerState.OPEN, AmbienceBreakerState.PROBING):
+            self.schedule_probe(breaker)
@@ -0,0 +1,56 @@
+# ambience_connector.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from ambience.model.ambience_module_connector import AmbienceModuleConnector
+
+from .ambience_hue_bridge import AmbienceHueBridges
+from .ambience_hue_light import AmbienceHueLight
+from .ambience_hue_group import AmbienceHueGroup
+
+class AmbienceConnector(AmbienceModuleConnector):
+    def display_name(self):
+        return "Philips Hue"
+
+    def compare_device(self, device):
+        return isinstance(device, AmbienceHueLight)
+
+    def save_device(self, device):
+        return device.write_config()
+
+    def load_device(self, config, group):
+        return AmbienceHueLight.from_config(config, group)
+
+    def create_group(self, devices):
+        return AmbienceHueGroup(devices)
+
+    def discovery_list(self):
+        bridges = AmbienceHueBridges()
+        devices = []
+
+        for bridge in bridges.get_bridges():
+            try:
+                if not bridge.username:
+                    if not bridge.pair():
+                        continue
+                    bridges.write_config()
+
+                for (light_id, data) in bridge.get_lights().items():
+                    devices.append(AmbienceHueLight.from_bridge(bridge, light_id, data))
+            except Exception as error:
+                print(f"Hue bridge {bridge.host}: {error}")
+
+        return devices
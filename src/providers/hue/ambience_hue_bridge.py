@@ -0,0 +1,217 @@
+# ambience_hue_bridge.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+from time import monotonic
+import json, os, socket, threading
+
+from ambience.singleton import Singleton
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_AVAIL = True
+except ImportError:
+    REQUESTS_AVAIL = False
+
+BRIDGES_FILE    = "hue_bridges.json"
+BRIDGES_ENV     = "AMBIENCE_HUE_BRIDGES"    # Comma separated host[:port] list
+POOL_SIZE       = 4     # Keep-alive connections per bridge
+TIMEOUT         = 2     # seconds
+LIGHTS_MAX_AGE  = 60    # seconds the bridge's light list is trusted for group 0 writes
+
+class AmbienceHueBridgeException(Exception):
+    """
+    Raised when the bridge answers with an error object.
+    """
+    pass
+
+class AmbienceHueBridge():
+    """
+    One bridge. All requests share a requests.Session with a small pool of
+    keep-alive connections, and writes are queued to a worker thread where a
+    newer write to the same target replaces one that hasn't been sent yet.
+    Without requests installed every request fails and writes are dropped,
+    so configured lights just show as offline.
+    """
+
+    def __init__(self, host, username=None):
+        self.host = host
+        self.username = username
+        self.light_ids = set()
+        self.lights_updated = None
+
+        self.session = None
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.pending_event = threading.Event()
+
+        if not REQUESTS_AVAIL:
+            return
+
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+
+        write_thread = threading.Thread(target=self.write_loop)
+        write_thread.daemon = True
+        write_thread.start()
+
+    def url(self, *path):
+        return "/".join([f"http://{self.host}/api", self.username] + [str(p) for p in path])
+
+    def check(self, data):
+        if isinstance(data, list):
+            errors = [item["error"]["description"] for item in data if "error" in item]
+            if errors:
+                raise AmbienceHueBridgeException(", ".join(errors))
+        return data
+
+    def request(self, method, *path, body=None):
+        if not self.session:
+            raise AmbienceHueBridgeException("requests is not installed")
+
+        response = self.session.request(method, self.url(*path), json=body, timeout=TIMEOUT)
+        response.raise_for_status()
+        return self.check(response.json())
+
+    def pair(self) -> bool:
+        """
+        Asks the bridge for a username. Only succeeds within 30 seconds of
+        the link button being pressed.
+        """
+        if not self.session:
+            return False
+
+        response = self.session.post(f"http://{self.host}/api", timeout=TIMEOUT,
+                                     json={"devicetype": "ambience#" + socket.gethostname()[:19]})
+        try:
+            data = self.check(response.json())
+        except AmbienceHueBridgeException as error:
+            print(f"Could not pair with Hue bridge {self.host}: {error}")
+            return False
+
+        self.username = data[0]["success"]["username"]
+        return True
+
+    def get_lights(self) -> dict:
+        lights = self.request("GET", "lights")
+        self.light_ids = set(lights.keys())
+        self.lights_updated = monotonic()
+        return lights
+
+    def get_light_ids(self):
+        """
+        Ids of every light on the bridge, refetched once LIGHTS_MAX_AGE old.
+        """
+        if self.lights_updated is None or monotonic() - self.lights_updated >= LIGHTS_MAX_AGE:
+            self.get_lights()
+        return self.light_ids
+
+    def get_light(self, light_id) -> dict:
+        return self.request("GET", "lights", light_id)
+
+    def submit(self, method, *path, body=None):
+        """
+        Queues a write. A queued write to the same path is replaced, so
+        dragging a slider sends the latest value rather than every step.
+        """
+        self.queue(path, lambda: self.request(method, *path, body=body))
+
+    def submit_group(self, light_ids, state):
+        """
+        Queues state for light_ids. When they are every light on the bridge
+        it goes out as one request to group 0, which always holds them all.
+        Otherwise, as no group is created on the bridge for them, it is
+        sent to each light in turn.
+        """
+        light_ids = frozenset(light_ids)
+
+        def write_group():
+            if light_ids == self.get_light_ids():
+                self.request("PUT", "groups", "0", "action", body=state)
+                return
+
+            for light_id in light_ids:
+                self.request("PUT", "lights", light_id, "state", body=state)
+
+        self.queue(("groups", light_ids), write_group)
+
+    def queue(self, key, write_fn):
+        if not self.session:
+            return
+
+        with self.lock:
+            self.pending.pop(key, None) # Replacing moves it last, after older writes
+            self.pending[key] = write_fn
+        self.pending_event.set()
+
+    def write_loop(self):
+        while True:
+            self.pending_event.wait()
+
+            with self.lock:
+                pending = self.pending
+                self.pending = {}
+                self.pending_event.clear()
+
+            for write_fn in pending.values():
+                try:
+                    write_fn()
+                except Exception as error:
+                    print(f"Hue bridge {self.host}: {error}")
+
+class AmbienceHueBridges(metaclass=Singleton):
+    """
+    Bridges from the config file and the AMBIENCE_HUE_BRIDGES environment
+    variable.
+    """
+
+    def __init__(self):
+        self.bridges = {}
+
+        if not REQUESTS_AVAIL:
+            return
+
+        for (host, username) in self.read_config().items():
+            self.bridges[host] = AmbienceHueBridge(host, username)
+
+        for host in filter(None, os.environ.get(BRIDGES_ENV, "").split(",")):
+            if host not in self.bridges:
+                self.bridges[host] = AmbienceHueBridge(host)
+
+    def config_path(self):
+        return GLib.build_filenamev([GLib.get_user_config_dir(), BRIDGES_FILE])
+
+    def read_config(self) -> dict:
+        try:
+            with open(self.config_path()) as config:
+                return json.load(config)
+        except (OSError, ValueError):
+            return {}
+
+    def write_config(self):
+        with open(self.config_path(), "w") as config:
+            json.dump({host: bridge.username for (host, bridge) in self.bridges.items()}, config)
+
+    def get_bridges(self):
+        return list(self.bridges.values())
+
+    def get_bridge(self, host):
+        if host not in self.bridges:
+            self.bridges[host] = AmbienceHueBridge(host)
+        return self.bridges[host]
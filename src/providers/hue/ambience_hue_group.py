@@ -0,0 +1,68 @@
+# ambience_hue_group.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from ambience.model.ambience_module_group import AmbienceModuleGroup
+
+from .ambience_hue_light import hsbk_to_state
+
+class AmbienceHueGroup(AmbienceModuleGroup):
+    """
+    Lights are split by bridge. A bridge whose lights are all in the group
+    gets one request to its group 0 instead of one per light.
+    """
+
+    devices = None
+    bridges = None
+
+    def __init__(self, lights):
+        self.devices = lights
+        self.bridges = {}
+        for light in lights:
+            (_, light_ids) = self.bridges.setdefault(light.bridge.host, (light.bridge, []))
+            light_ids.append(light.light_id)
+
+    def send(self, state):
+        for (bridge, light_ids) in self.bridges.values():
+            bridge.submit_group(light_ids, state)
+
+    def set_color(self, hsvk):
+        self.send(hsbk_to_state(hsvk))
+
+    def set_colors(self, colors):
+        for (light, color) in zip(self.devices, colors):
+            light.set_color(color)
+
+    def set_device_colors(self, device_colors, fields):
+        """
+        Only the group's own light sets use group requests, so a change to
+        part of the group goes out light by light rather than creating new
+        groups on the bridge. The full state is always sent: writes are
+        queued latest-wins, and a partial state could replace a pending one.
+        """
+        states = [hsbk_to_state(hsvk) for (_, hsvk) in device_colors]
+        if len(device_colors) == len(self.devices) and all(state == states[0] for state in states):
+            self.send(states[0])
+            return
+
+        for (device, hsvk) in device_colors:
+            device.set_color(hsvk)
+
+    def set_infrared(self, infrared):
+        pass
+
+    def set_power(self, power):
+        self.send({"on": bool(power)})
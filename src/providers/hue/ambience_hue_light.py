@@ -0,0 +1,155 @@
+# ambience_hue_light.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from ambience.model.ambience_device import AmbienceDeviceInfoType
+from ambience.model.ambience_light import AmbienceLight, AmbienceLightCapabilities
+
+from .ambience_hue_bridge import AmbienceHueBridges
+
+MIN_MIRED = 153 # 6500K
+MAX_MIRED = 500 # 2000K
+
+CAPABILITIES = {
+    "Extended color light"      : [AmbienceLightCapabilities.COLOR, AmbienceLightCapabilities.TEMPERATURE],
+    "Color light"               : [AmbienceLightCapabilities.COLOR],
+    "Color temperature light"   : [AmbienceLightCapabilities.TEMPERATURE],
+}
+
+def hsbk_to_state(hsbk):
+    """
+    Bridge light state for an Ambience colour. Unsaturated colours are sent
+    as a colour temperature.
+    """
+    (h, s, v, k) = hsbk
+    state = {"bri": max(1, min(254, round(v * 254)))}
+
+    if s > 0:
+        state["hue"] = round(h * 65535) % 65536
+        state["sat"] = round(s * 254)
+    else:
+        state["ct"] = max(MIN_MIRED, min(MAX_MIRED, round(1000000 / max(k, 1))))
+
+    return state
+
+def state_to_hsbk(state):
+    kelvin = round(1000000 / state["ct"]) if state.get("ct") else 6500
+    if state.get("colormode") == "ct":
+        return (0, 0, state.get("bri", 254) / 254, kelvin)
+
+    return (state.get("hue", 0) / 65535, state.get("sat", 0) / 254, state.get("bri", 254) / 254, kelvin)
+
+class AmbienceHueLight(AmbienceLight):
+    """
+    A light behind a Hue-style REST bridge.
+    """
+
+    __slots__ = ("bridge", "light_id", "light_type", "model")
+
+    def __init__(self):
+        super().__init__()
+        self.kind = "hue"
+        self.label = ""
+        self.bridge = None
+        self.light_id = None
+        self.light_type = None
+        self.model = None
+
+    @classmethod
+    def from_config(cls, light_config, group):
+        new = cls()
+        new.bridge = AmbienceHueBridges().get_bridge(light_config["data"]["bridge"])
+        new.light_id = light_config["data"]["id"]
+        new.label = light_config["label"]
+        new.group = group
+        return new
+
+    @classmethod
+    def from_bridge(cls, bridge, light_id, data):
+        new = cls()
+        new.bridge = bridge
+        new.light_id = light_id
+        new.update_from(data)
+        return new
+
+    def update_from(self, data):
+        """
+        Fills the cached fields from a bridge light object.
+        """
+        self.light_type = data.get("type")
+        self.model = data.get("productname", data.get("modelid"))
+        self.label = data.get("name", self.label)
+        self.color = state_to_hsbk(data["state"])
+        self.power = data["state"].get("on", False)
+
+    def write_config(self):
+        return {
+            "bridge": self.bridge.host,
+            "id": self.light_id
+        }
+
+    def get_capabilities(self) -> list:
+        if self.light_type is None:
+            self.update_from(self.bridge.get_light(self.light_id))
+        return list(CAPABILITIES.get(self.light_type, []))
+
+    def get_online(self) -> bool:
+        try:
+            data = self.bridge.get_light(self.light_id)
+        except Exception:
+            return False
+
+        self.update_from(data)
+        return data["state"].get("reachable", True)
+
+    def refresh_state(self):
+        self.update_from(self.bridge.get_light(self.light_id))
+
+    def get_label(self) -> str:
+        if not self.label:
+            self.refresh_state()
+        return self.label
+
+    def set_label(self, label):
+        self.bridge.submit("PUT", "lights", self.light_id, body={"name": label})
+
+    def get_power(self) -> bool:
+        return self.bridge.get_light(self.light_id)["state"].get("on", False)
+
+    def set_power(self, power):
+        self.bridge.submit("PUT", "lights", self.light_id, "state", body={"on": bool(power)})
+
+    def get_color(self):
+        return state_to_hsbk(self.bridge.get_light(self.light_id)["state"])
+
+    def set_color(self, hsvk):
+        self.bridge.submit("PUT", "lights", self.light_id, "state", body=hsbk_to_state(hsvk))
+
+    def get_infrared(self) -> float:
+        return 0
+
+    def set_infrared(self, i):
+        pass
+
+    def get_info(self):
+        device_info = {AmbienceDeviceInfoType.IP : self.bridge.host}
+        if self.model:
+            device_info[AmbienceDeviceInfoType.MODEL] = self.model
+        return device_info
+
+    def get_info_version(self):
+        # get_info needs no request, the info itself is its version
+        return [self.bridge.host, self.model]
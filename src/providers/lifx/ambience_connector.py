@@ -38,4 +38,7 @@ class AmbienceConnector(AmbienceModuleConnector):
         return AmbienceLIFXGroup(devices)
 
     def discovery_list(self):
-        return [AmbienceLIFXLight.from_LifxLAN(x) for x in AmbienceLIFXLan().get_lan().get_devices()]
+        lan = AmbienceLIFXLan()
+        devices = lan.get_lan().get_devices()
+        lan.update_subnets([(x.get_mac_addr(), x.get_ip_addr()) for x in devices])
+        return [AmbienceLIFXLight.from_LifxLAN(x) for x in devices]
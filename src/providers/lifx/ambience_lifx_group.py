@@ -15,27 +15,200 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+from ambience.ambience_profiler import AmbienceProfiler
+from ambience.model.ambience_group import AmbienceUnsyncedDevices
 from ambience.model.ambience_module_group import AmbienceModuleGroup
+from ambience.model.ambience_palette import quantise, quantise_one
+from ambience.singleton import Singleton
 
 from lifxlan import Group
+from lifxlan.msgtypes import LightSetColor, LightSetPower
+from time import monotonic
+import queue, threading
+
+from .ambience_lifx_lan import AmbienceLIFXLan
+from .ambience_lifx_messages import LightSetWaveformOptional, waveform_optional_payload
+
+ACK_TIMEOUT         = 0.5   # seconds to wait for a burst to be acknowledged
+COLLECT_INTERVAL    = 0.01  # seconds between checks of the bursts in flight
+
+class AmbienceLIFXBurst():
+    """
+    A sent burst waiting for its acknowledgements.
+    """
+
+    def __init__(self, msg_type, light_payloads, requests, retry=False, acked=()):
+        self.msg_type = msg_type
+        self.light_payloads = light_payloads
+        self.requests = requests
+        self.retry = retry
+        self.acked = list(acked)
+        self.deadline = monotonic() + ACK_TIMEOUT
+
+    def settled(self, now):
+        return now >= self.deadline or all(request.event.is_set() for request in self.requests)
+
+class AmbienceLIFXAckCollector(metaclass=Singleton):
+    """
+    Follows every burst in flight on one thread. Lost packets are sent once
+    more, late rather than never, and the time between the first and the
+    last acknowledgement is recorded.
+    """
+
+    def __init__(self):
+        self.bursts = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def add(self, burst):
+        with self.lock:
+            if not self.thread:
+                self.thread = threading.Thread(target=self.collect_loop)
+                self.thread.daemon = True
+                self.thread.start()
+
+        self.bursts.put(burst)
+
+    def collect_loop(self):
+        in_flight = []
+        while True:
+            try:
+                in_flight.append(self.bursts.get(timeout=COLLECT_INTERVAL if in_flight else None))
+                continue # Take everything queued before checking
+            except queue.Empty:
+                pass
+
+            now = monotonic()
+            waiting = []
+            for burst in in_flight:
+                if not burst.settled(now):
+                    waiting.append(burst)
+                    continue
+
+                try:
+                    if retry := self.settle(burst):
+                        waiting.append(retry)
+                except Exception as e:
+                    print("Unable to follow up LIFX burst", e)
+
+            in_flight = waiting
+
+    def settle(self, burst):
+        """
+        Returns the burst resending the lost packets of burst, if there is
+        one to send.
+        """
+        shared_socket = AmbienceLIFXLan().get_socket()
+        missed = shared_socket.collect(burst.requests, 0)
+        acked = burst.acked + [request.received for request in burst.requests if request.received is not None]
+
+        # A bulb written to again since has a newer value on its way
+        missed = [request for request in missed if shared_socket.is_latest(request)]
+
+        if missed and not burst.retry:
+            light_payloads = [light_payload for (light_payload, request) in zip(burst.light_payloads, burst.requests)
+                              if request in missed]
+            requests = [shared_socket.prepare(light, burst.msg_type, payload) for (light, payload) in light_payloads]
+            shared_socket.burst(requests)
+            return AmbienceLIFXBurst(burst.msg_type, light_payloads, requests, True, acked)
+
+        if len(acked) > 1:
+            AmbienceProfiler().record_metric("lifx_group_spread", max(acked) - min(acked))
+        return None
 
 class AmbienceLIFXGroup(AmbienceModuleGroup):
+    """
+    Changes are applied in sync: packets for every light are built first
+    and sent in one burst over the shared socket. The time between the
+    first and the last acknowledgement is recorded as the lifx_group_spread
+    metric by AmbienceLIFXAckCollector.
+    """
 
+    devices = None
     lights = None
     group = None
 
     def __init__(self, lights):
+        self.devices = lights
         self.lights = [light.lifx_light for light in lights]
         self.group = Group(self.lights)
+        AmbienceLIFXLan().refresh_subnets()
+
+    def send(self, msg_type, payload):
+        """
+        Sends one broadcast to every subnet this group covers completely and
+        a synchronised unicast burst to the remaining lights. Returns the
+        lights whose write was dropped.
+        """
+        lan = AmbienceLIFXLan()
+        subnets, remaining = lan.split_broadcast(self.lights)
+        dropped = []
+
+        if subnets and not lan.get_socket().broadcast(msg_type, payload, subnets):
+            dropped = [light for light in self.lights if light not in remaining]
+
+        if remaining:
+            dropped += self.send_burst(msg_type, [(light, payload) for light in remaining])
+        return dropped
+
+    def send_burst(self, msg_type, light_payloads):
+        """
+        Prebuilds one acknowledged packet per (light, payload), sends them
+        back to back and leaves the acknowledgements to the collector.
+        Returns the lights whose write was dropped.
+        """
+        shared_socket = AmbienceLIFXLan().get_socket()
+        requests = [shared_socket.prepare(light, msg_type, payload) for (light, payload) in light_payloads]
+        dropped = shared_socket.burst(requests)
+
+        AmbienceLIFXAckCollector().add(AmbienceLIFXBurst(msg_type, light_payloads, requests))
+        return [light for ((light, _), request) in zip(light_payloads, requests) if request in dropped]
 
     def set_color(self, hsvk):
-        for i in range(3):
-            hsvk[i] = hsvk[i] * 65535
-        self.group.set_color(hsvk, rapid=True)
-    
+        self.send(LightSetColor, {"color": quantise_one(hsvk), "duration": 0})
+
+    def set_colors(self, colors):
+        self.send_burst(LightSetColor, [(light, {"color": color, "duration": 0})
+                                        for (light, color) in zip(self.lights, quantise(colors))])
+
+    def stream_colors(self, colors):
+        """
+        Frames go out as one unacknowledged burst; a lost packet is
+        corrected by the next frame rather than retried. Packets to
+        throttled bulbs are dropped instead of queued behind the frame.
+        """
+        shared_socket = AmbienceLIFXLan().get_socket()
+        dropped = shared_socket.burst([shared_socket.prepare(light, LightSetColor, {"color": color, "duration": 0}, ack=False)
+                                       for (light, color) in zip(self.lights, quantise(colors))], queue=False)
+        return not dropped
+
+    def set_device_colors(self, device_colors, fields):
+        """
+        Sends LightSetColor when every component changed and
+        LightSetWaveformOptional carrying only the changed components
+        otherwise. A change taking the whole group to one colour goes out as
+        broadcast where possible. Devices whose write was dropped are marked
+        unsynced.
+        """
+        if len(fields) == 4:
+            msg_type = LightSetColor
+            make_payload = lambda color: {"color": color, "duration": 0}
+        else:
+            msg_type = LightSetWaveformOptional
+            make_payload = lambda color: waveform_optional_payload(color, fields)
+
+        light_colors = [(device.lifx_light, quantise_one(hsvk)) for (device, hsvk) in device_colors]
+        if len(light_colors) == len(self.lights) and len({tuple(color) for (_, color) in light_colors}) == 1:
+            dropped = self.send(msg_type, make_payload(light_colors[0][1]))
+        else:
+            dropped = self.send_burst(msg_type, [(light, make_payload(color)) for (light, color) in light_colors])
+
+        if dropped:
+            AmbienceUnsyncedDevices().mark([device for device in self.devices if device.lifx_light in dropped])
+
     def set_infrared(self, infrared):
         # INFRARED FOR GROUP NOT IMPLEMENTED
         pass
 
     def set_power(self, power):
-        self.group.set_power(power, rapid=True)
\ No newline at end of file
+        self.send(LightSetPower, {"power_level": 65535 if power else 0, "duration": 0})
\ No newline at end of file
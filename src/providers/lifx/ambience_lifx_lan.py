@@ -17,18 +17,36 @@
 
 from ambience.singleton import *
 
+import ipaddress, threading
+from time import monotonic
+
 try:
+    import ifaddr
     from lifxlan import *
+    from .ambience_lifx_socket import AmbienceLIFXSocket, AmbienceLIFXSharedLight, mac_key
+    from .ambience_lifx_reachability import AmbienceLIFXReachability
     API_AVAIL = True
 except:
     API_AVAIL = False
 
+SUBNET_MAX_AGE = 60 # seconds
+
 class AmbienceLIFXLan(metaclass=Singleton):
     """
-    Singleton class containing a shared LifxLAN object.
+    Singleton class containing a shared LifxLAN object as well as the socket
+    every light sends through.
     """
 
-    lan = None
+    def __init__(self):
+        self.lan = None
+        self.socket = None
+        self.reachability = None
+
+        self.subnet_members = {}
+        self.last_sweep = {}
+        self.known_macs = set()
+        self.subnet_updated = None
+        self.subnet_refreshing = False
 
     def check_api_availability(self):
         return API_AVAIL
@@ -37,3 +55,113 @@ class AmbienceLIFXLan(metaclass=Singleton):
         if not self.lan:
             self.lan = LifxLAN()
         return self.lan
+
+    def get_socket(self):
+        if not self.socket:
+            self.socket = AmbienceLIFXSocket()
+        return self.socket
+
+    def get_reachability(self):
+        if not self.reachability:
+            self.reachability = AmbienceLIFXReachability(self.get_socket())
+        return self.reachability
+
+    def create_light(self, mac_addr, ip_addr):
+        light = AmbienceLIFXSharedLight(self.get_socket(), mac_addr, ip_addr)
+        self.get_reachability().register(light)
+        return light
+
+    # Subnet membership, used to replace unicast group writes with broadcasts
+
+    def get_subnet(self, ip_addr):
+        """
+        Returns the broadcast address of the local network ip_addr is on, or
+        None if it isn't directly reachable.
+        """
+        if not ip_addr:
+            return None
+
+        address = ipaddress.ip_address(ip_addr)
+        for adapter in ifaddr.get_adapters():
+            for ip in adapter.ips:
+                if not ip.is_IPv4 or ip.ip == "127.0.0.1":
+                    continue
+                network = ipaddress.ip_network(f"{ip.ip}/{ip.network_prefix}", strict=False)
+                if address in network:
+                    return str(network.broadcast_address)
+        return None
+
+    def update_subnets(self, devices):
+        """
+        Records which bulbs answered on which subnet. devices is a list of
+        (mac, ip) tuples covering every bulb seen on the LAN. Members of the
+        previous sweep are kept too, so a bulb missing one reply still
+        counts as being on its subnet.
+        """
+        sweep = {}
+        for (mac_addr, ip_addr) in devices:
+            if subnet := self.get_subnet(ip_addr):
+                sweep.setdefault(subnet, set()).add(mac_key(mac_addr))
+
+        members = {subnet: set(macs) for (subnet, macs) in self.last_sweep.items()}
+        for (subnet, macs) in sweep.items():
+            members.setdefault(subnet, set()).update(macs)
+
+        self.last_sweep = sweep
+        self.subnet_members = members
+        self.known_macs = set().union(*members.values())
+        self.subnet_updated = monotonic()
+
+    def unknown_bulb_seen(self) -> bool:
+        """
+        True if the socket heard from a bulb the last sweep didn't find.
+        """
+        heard = set(self.get_socket().last_seen) - {BROADCAST_MAC}
+        return bool(heard - self.known_macs)
+
+    def subnets_fresh(self):
+        return self.subnet_updated is not None and \
+               monotonic() - self.subnet_updated < SUBNET_MAX_AGE
+
+    def refresh_subnets(self):
+        """
+        Rediscovers subnet membership in the background once it is stale.
+        """
+        if self.subnet_refreshing or self.subnets_fresh():
+            return
+
+        self.subnet_refreshing = True
+
+        def refresh_async():
+            try:
+                responses = self.get_lan().broadcast_with_resp(GetService, StateService)
+                self.update_subnets([(r.target_addr, r.ip_addr) for r in responses])
+            except Exception:
+                pass
+            finally:
+                self.subnet_refreshing = False
+
+        refresh_thread = threading.Thread(target=refresh_async)
+        refresh_thread.daemon = True
+        refresh_thread.start()
+
+    def split_broadcast(self, lights):
+        """
+        Splits lights into subnets that one broadcast reaches exactly (every
+        known bulb on them is in lights) and the lights that still need
+        unicast packets. Nothing is broadcast while membership is stale or
+        a bulb outside it has been heard from.
+        """
+        if self.subnets_fresh() and self.unknown_bulb_seen():
+            self.subnet_updated = None
+
+        if not self.subnets_fresh():
+            self.refresh_subnets()
+            return [], lights
+
+        macs = {mac_key(light.get_mac_addr()) for light in lights}
+
+        subnets = [subnet for subnet, members in self.subnet_members.items() if members <= macs]
+        covered = set().union(*[self.subnet_members[subnet] for subnet in subnets])
+
+        return subnets, [light for light in lights if mac_key(light.get_mac_addr()) not in covered]
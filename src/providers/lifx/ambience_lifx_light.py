@@ -21,23 +21,28 @@ import traceback
 
 from ambience.model.ambience_device import AmbienceDeviceInfoType
 from ambience.model.ambience_light import AmbienceLight, AmbienceLightCapabilities
+from ambience.model.ambience_palette import quantise_one
 
 from .ambience_lifx_device_type import AmbienceLifxDeviceType
+from .ambience_lifx_lan import AmbienceLIFXLan
 
 class AmbienceLIFXLight(AmbienceLight):
     """
     Bridge between lifxlan and ui.
     """
 
-    label = ""
+    __slots__ = ("lifx_light",)
 
     def __init__(self):
+        super().__init__()
         self.kind = "lifx"
+        self.label = ""
+        self.lifx_light = None
 
     @classmethod
     def from_config(cls, light_config, group):
         new = cls()
-        new.lifx_light = Light(light_config["data"]["mac"], light_config["data"]["ip"])
+        new.lifx_light = AmbienceLIFXLan().create_light(light_config["data"]["mac"], light_config["data"]["ip"])
         new.label = light_config["label"]
         new.group = group
         return new
@@ -45,8 +50,9 @@ class AmbienceLIFXLight(AmbienceLight):
     @classmethod
     def from_LifxLAN(cls, light):
         new = cls()
-        new.lifx_light = light
-        return new        
+        new.lifx_light = AmbienceLIFXLan().create_light(light.get_mac_addr(), light.get_ip_addr())
+        new.lifx_light.label = light.label
+        return new
 
     def write_config(self):
         return {
@@ -75,19 +81,20 @@ class AmbienceLIFXLight(AmbienceLight):
         return capabilities
 
     def get_online(self) -> bool:
-        try:
-            remote_label = self.lifx_light.get_label()
-            if not remote_label == self.label: # Config remote mismatch
-                self.lifx_light.label = remote_label
-                # TODO: write config file
+        return AmbienceLIFXLan().get_reachability().is_online(self.lifx_light)
 
-            return True
-        except:
-            return False
+    def check_label(self):
+        """
+        Adopts the label the bulb reported in its last state reply if it
+        differs from the configured one.
+        """
+        remote_label = self.lifx_light.label
+        if remote_label and not remote_label == self.label: # Config remote mismatch
+            self.label = remote_label # Written back by AmbienceLoader.reconcile_labels
 
     def get_label(self) -> str:
-        if self.get_online():
-            return self.lifx_light.get_label()
+        if not self.label and self.get_online():
+            self.label = self.lifx_light.get_label()
         return self.label
 
     def set_label(self, label):
@@ -101,18 +108,32 @@ class AmbienceLIFXLight(AmbienceLight):
     def set_power(self, power):
         self.lifx_light.set_power(power, rapid=True)
 
+    def refresh_state(self):
+        """
+        Fills color, power and label from a single LightState reply.
+        """
+        state = self.lifx_light.req_with_resp(LightGet, LightState)
+
+        self.lifx_light.color = state.color
+        self.lifx_light.power_level = state.power_level
+        self.lifx_light.label = state.label
+        self.check_label()
+
+        (h, s, v, k) = state.color
+        self.color = (h / 65535, s / 65535, v / 65535, k)
+        self.power = state.power_level != 0
+
     def get_color(self): #-> tuple[float, float, float, float]:
         color_hsvk = list(self.lifx_light.get_color())
+        self.check_label()
+
         for i in range(3):
             color_hsvk[i] = color_hsvk[i] / 65535
 
         return tuple(color_hsvk)
 
     def set_color(self, hsvk):
-        color = hsvk.copy()
-        for i in range(3):
-            color[i] = color[i] * 65535
-        self.lifx_light.set_color(color, rapid=True)
+        self.lifx_light.set_color(quantise_one(hsvk), rapid=True)
 
     def get_infrared(self) -> float:
         if AmbienceLightCapabilities.INFRARED in self.get_capabilities():
@@ -132,10 +153,24 @@ class AmbienceLIFXLight(AmbienceLight):
                         AmbienceDeviceInfoType.LOCATION : self.lifx_light.get_location(),
         }
                
-        if model := device_type.get_product(self.lifx_light.get_version_tuple()[1]):
+        if self.lifx_light.product is None: # Cached once capabilities are known
+            (self.lifx_light.vendor, self.lifx_light.product, self.lifx_light.version) = self.lifx_light.get_version_tuple()
+
+        if model := device_type.get_product(self.lifx_light.product):
             device_info[AmbienceDeviceInfoType.MODEL] = model["name"]
 
         return device_info
 
+    def get_static_id(self) -> str:
+        return "lifx:" + self.lifx_light.get_mac_addr()
+
+    def get_info_version(self):
+        """
+        Address, MAC and product, known without asking the bulb once its
+        capabilities are loaded. A group or location renamed in another
+        app isn't noticed until one of these changes.
+        """
+        return [self.lifx_light.get_ip_addr(), self.lifx_light.get_mac_addr(), self.lifx_light.product]
+
     def get_lifx_group_label(self):
         return self.lifx_light.get_group()
@@ -0,0 +1,76 @@
+# ambience_lifx_messages.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+LAN protocol messages lifxlan does not ship.
+"""
+
+import struct
+
+from lifxlan.message import Message
+
+SET_WAVEFORM_OPTIONAL = 119
+
+WAVEFORM_SAW = 0
+
+class LightSetWaveformOptional(Message):
+    """
+    SetWaveform with a flag per colour component. Components whose flag is
+    unset keep their current value on the bulb, so a single component can
+    be changed without knowing the others.
+    """
+
+    def __init__(self, target_addr, source_id, seq_num, payload, ack_requested=False, response_requested=False):
+        self.transient = payload.get("transient", 0)
+        self.color = payload["color"]
+        self.period = payload.get("period", 0)
+        self.cycles = payload.get("cycles", 1)
+        self.skew_ratio = payload.get("skew_ratio", 0)
+        self.waveform = payload.get("waveform", WAVEFORM_SAW)
+        self.set_hue = payload.get("set_hue", 0)
+        self.set_saturation = payload.get("set_saturation", 0)
+        self.set_brightness = payload.get("set_brightness", 0)
+        self.set_kelvin = payload.get("set_kelvin", 0)
+        super().__init__(SET_WAVEFORM_OPTIONAL, target_addr, source_id, seq_num, ack_requested, response_requested)
+
+    def get_payload(self):
+        self.payload_fields.append(("Is Transient", self.transient))
+        self.payload_fields.append(("Color", self.color))
+        self.payload_fields.append(("Period", self.period))
+        self.payload_fields.append(("Cycles", self.cycles))
+        self.payload_fields.append(("Skew Ratio", self.skew_ratio))
+        self.payload_fields.append(("Waveform", self.waveform))
+        self.payload_fields.append(("Set Hue", self.set_hue))
+        self.payload_fields.append(("Set Saturation", self.set_saturation))
+        self.payload_fields.append(("Set Brightness", self.set_brightness))
+        self.payload_fields.append(("Set Kelvin", self.set_kelvin))
+        return struct.pack("<BB4HIfhB4B", 0, self.transient, *self.color, self.period, self.cycles,
+                           self.skew_ratio, self.waveform, self.set_hue, self.set_saturation,
+                           self.set_brightness, self.set_kelvin)
+
+def waveform_optional_payload(color, fields):
+    """
+    Payload applying only the components of color listed in fields
+    (indices into hue, saturation, brightness, kelvin) immediately.
+    """
+    return {
+        "color": color,
+        "set_hue": int(0 in fields),
+        "set_saturation": int(1 in fields),
+        "set_brightness": int(2 in fields),
+        "set_kelvin": int(3 in fields),
+    }
@@ -0,0 +1,215 @@
+# ambience_lifx_rate.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from time import monotonic
+import threading
+
+DEVICE_RATE     = 20    # messages per second a bulb handles without dropping
+DEVICE_BURST    = 4
+SOCKET_RATE     = 200   # messages per second over the whole socket
+SOCKET_BURST    = 100   # a group burst may overdraw this, delaying what follows
+MAX_QUEUED      = 1024  # throttled writes kept before new ones are dropped
+
+class AmbienceTokenBucket():
+    """
+    Allows rate messages per second on average and up to capacity at once.
+    Tokens may go negative, a batch larger than what is left delays the
+    messages after it.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def wait_time(self, now):
+        """
+        Seconds until a token is available, 0 if one is now.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, count=1):
+        self.tokens -= count
+
+class AmbienceLIFXThrottled():
+    """
+    A write waiting for tokens.
+    """
+
+    __slots__ = ("packet", "addrs", "request")
+
+    def __init__(self, packet, addrs, request):
+        self.packet = packet
+        self.addrs = addrs
+        self.request = request
+
+class AmbienceLIFXRateLimiter():
+    """
+    Paces packets per target (bulb mac address, or the broadcast address)
+    and over the whole socket. Writes that find their bucket empty are
+    queued keyed by target and property; a newer write to the same
+    property replaces the queued one instead of queueing behind it. A
+    pacer thread sends queued writes in order as tokens become available.
+    """
+
+    def __init__(self, sendto):
+        self.sendto = sendto
+        self.cond = threading.Condition()
+        self.socket_bucket = AmbienceTokenBucket(SOCKET_RATE, SOCKET_BURST)
+        self.buckets = {}
+        self.queue = OrderedDict()  # (target, property): AmbienceLIFXThrottled
+        self.queued = {}            # target: number of queued writes
+
+        self.counters = {"sent": 0, "throttled": 0, "merged": 0, "dropped": 0}
+
+        pacer_thread = threading.Thread(target=self.pace_loop)
+        pacer_thread.daemon = True
+        pacer_thread.start()
+
+    def get_counters(self) -> dict:
+        with self.cond:
+            return dict(self.counters)
+
+    def get_bucket(self, target):
+        if target not in self.buckets:
+            self.buckets[target] = AmbienceTokenBucket(DEVICE_RATE, DEVICE_BURST)
+        return self.buckets[target]
+
+    def wait_time(self, target, now):
+        return max(self.get_bucket(target).wait_time(now), self.socket_bucket.wait_time(now))
+
+    def consume(self, target, count):
+        self.get_bucket(target).consume(count)
+        self.socket_bucket.consume(count)
+        self.counters["sent"] += count
+
+    def admit(self, target, count=1) -> bool:
+        """
+        Takes count tokens for target if it has nothing queued and tokens
+        are available now. The caller sends right away when True.
+        """
+        with self.cond:
+            if self.queued.get(target) or self.wait_time(target, monotonic()) > 0:
+                return False
+            self.consume(target, count)
+            return True
+
+    def admit_burst(self, targets) -> list:
+        """
+        admit() for one packet to each of targets, returning a flag per
+        target. The socket only needs a token for the burst to start: a
+        burst larger than what is left borrows from later packets, so a
+        group goes out at once whatever its size and the average rate
+        still holds.
+        """
+        with self.cond:
+            now = monotonic()
+            if self.socket_bucket.wait_time(now) > 0:
+                return [False] * len(targets)
+
+            admitted = []
+            for target in targets:
+                bucket = self.get_bucket(target)
+                admit = not self.queued.get(target) and bucket.wait_time(now) == 0
+                if admit:
+                    bucket.consume()
+                admitted.append(admit)
+
+            count = sum(admitted)
+            self.socket_bucket.consume(count)
+            self.counters["sent"] += count
+            return admitted
+
+    def acquire(self, target, count=1):
+        """
+        Blocks until count tokens are taken for target. Used for requests
+        whose caller waits for the reply anyway.
+        """
+        with self.cond:
+            while (wait := self.wait_time(target, monotonic())) > 0:
+                self.cond.wait(wait)
+            self.consume(target, count)
+
+    def enqueue(self, target, prop, packet, addrs, request=None):
+        """
+        Queues a write to property prop of target. A write already queued
+        for it is replaced and its request marked done, so a burst doesn't
+        retry a value that has been superseded. Returns False if the queue
+        is full and the write was dropped.
+        """
+        key = (target, prop)
+        with self.cond:
+            if (replaced := self.queue.pop(key, None)) is not None:
+                self.counters["merged"] += 1
+                if replaced.request:
+                    replaced.request.event.set()
+            elif len(self.queue) >= MAX_QUEUED:
+                self.counters["dropped"] += 1
+                return False
+            else:
+                self.queued[target] = self.queued.get(target, 0) + 1
+
+            self.counters["throttled"] += 1
+            # Moved to the end, behind writes to other properties queued since
+            self.queue[key] = AmbienceLIFXThrottled(packet, addrs, request)
+            self.cond.notify()
+            return True
+
+    def pop_ready(self):
+        """
+        Waits for a queued write whose target has tokens, and takes them.
+        Writes to the same target leave in the order they were queued.
+        """
+        with self.cond:
+            while True:
+                now = monotonic()
+                wait = None
+                blocked = set()
+
+                for (key, throttled) in self.queue.items():
+                    (target, _) = key
+                    if target in blocked:
+                        continue
+
+                    target_wait = self.wait_time(target, now)
+                    if target_wait == 0:
+                        del self.queue[key]
+                        self.queued[target] -= 1
+                        if not self.queued[target]:
+                            del self.queued[target]
+                        self.consume(target, len(throttled.addrs))
+                        return throttled
+
+                    blocked.add(target)
+                    wait = target_wait if wait is None else min(wait, target_wait)
+
+                self.cond.wait(wait)
+
+    def pace_loop(self):
+        while True:
+            throttled = self.pop_ready()
+            try:
+                for addr in throttled.addrs:
+                    self.sendto(throttled.packet, addr)
+            except OSError:
+                pass
@@ -0,0 +1,93 @@
+# ambience_lifx_reachability.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from time import monotonic, sleep
+import threading, weakref
+
+from .ambience_lifx_socket import mac_key
+
+FRESH_FOR       = 10    # seconds a reply counts as proof a bulb is online
+PROBE_BUDGET    = 0.5   # seconds to wait for probe replies
+PROBE_INTERVAL  = 0.02
+PROBE_BATCH     = 8     # other stale bulbs probed along with the one asked for
+PROBE_AGAIN     = 2     # seconds before a silent bulb is probed again
+
+class AmbienceLIFXReachability():
+    """
+    Answers whether a bulb is online from the last time anything was heard
+    from it on the shared socket. Bulbs without recent evidence are probed,
+    a few at a time, and given a small time budget to answer.
+    """
+
+    def __init__(self, socket):
+        self.socket = socket
+        self.lights = weakref.WeakValueDictionary() # Lights leave once their group is dropped
+        self.probed = {}
+        self.lock = threading.Lock()
+
+    def register(self, light):
+        with self.lock:
+            self.lights[mac_key(light.mac_addr)] = light
+
+    def is_fresh(self, mac_addr):
+        seen = self.socket.last_seen.get(mac_key(mac_addr))
+        return seen is not None and monotonic() - seen < FRESH_FOR
+
+    def is_online(self, light) -> bool:
+        if self.is_fresh(light.mac_addr):
+            return True
+
+        self.refresh(light)
+        return self.is_fresh(light.mac_addr)
+
+    def refresh(self, light):
+        """
+        Probes light, unless it was probed lately, along with up to
+        PROBE_BATCH other stale bulbs that weren't. Then waits until light
+        answers or the budget of its probe runs out.
+        """
+        now = monotonic()
+        key = mac_key(light.mac_addr)
+
+        with self.lock:
+            self.probed = {mac: at for (mac, at) in self.probed.items() if now - at < PROBE_AGAIN}
+
+            probes = []
+            if key not in self.probed: # Silence after a recent probe already means offline
+                probes.append(light)
+                self.probed[key] = now
+
+            batch = 0
+            for (mac, l) in list(self.lights.items()):
+                if batch == PROBE_BATCH:
+                    break
+                if mac == key or mac in self.probed or self.is_fresh(mac):
+                    continue
+                probes.append(l)
+                self.probed[mac] = now
+                batch += 1
+
+            deadline = self.probed[key] + PROBE_BUDGET
+
+        for l in probes:
+            try:
+                self.socket.probe(l)
+            except OSError:
+                pass
+
+        while monotonic() < deadline and not self.is_fresh(light.mac_addr):
+            sleep(PROBE_INTERVAL)
@@ -0,0 +1,330 @@
+# ambience_lifx_socket.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from socket import AF_INET, SOCK_DGRAM, SOL_SOCKET, SO_BROADCAST, SO_REUSEADDR, socket
+from time import monotonic
+import random, threading
+
+from lifxlan import Light
+from lifxlan.errors import WorkflowException
+from lifxlan.device import DEFAULT_TIMEOUT, DEFAULT_ATTEMPTS, UDP_BROADCAST_IP_ADDRS, UDP_BROADCAST_PORT
+from lifxlan.message import BROADCAST_MAC
+from lifxlan.msgtypes import Acknowledgement, LightGetPower
+from lifxlan.unpack import unpack_lifx_message
+
+from .ambience_lifx_rate import AmbienceLIFXRateLimiter
+
+def mac_key(mac_addr):
+    """
+    MAC addresses are compared case-insensitively.
+    """
+    return mac_addr.lower()
+
+def property_key(msg):
+    """
+    What a write changes on the bulb. Queued writes with the same key
+    replace each other. Partial colour writes only replace writes to the
+    same components.
+    """
+    return (msg.message_type,) + tuple(getattr(msg, flag, 0) for flag in
+                                       ("set_hue", "set_saturation", "set_brightness", "set_kelvin"))
+
+class AmbienceLIFXRequest():
+    """
+    A request waiting for a reply on the shared socket.
+    """
+
+    def __init__(self, response_types):
+        self.response_types = response_types
+        self.response = None
+        self.ip_addr = None
+        self.received = None
+        self.event = threading.Event()
+
+        # Set by prepare() for burst sends
+        self.key = None
+        self.target = None
+        self.prop = None
+        self.generation = None
+        self.packet = None
+        self.addr = None
+
+class AmbienceLIFXSocket():
+    """
+    One long lived UDP socket shared by every LIFX light. Replies are handed
+    to the waiting request matching their source id, target and sequence
+    number, so several requests to the same bulb can be outstanding at once.
+
+    Every send is paced by an AmbienceLIFXRateLimiter. Throttled writes are
+    queued and merged, requests wait for their turn and reachability probes
+    are skipped.
+    """
+
+    def __init__(self):
+        self.sock = socket(AF_INET, SOCK_DGRAM)
+        self.sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self.sock.setsockopt(SOL_SOCKET, SO_BROADCAST, 1)
+        self.sock.bind(("", 0))
+
+        self.source_id = random.randrange(2, 1 << 32)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.seq_nums = {}
+        self.generations = {}   # (target, property): number of the latest prepared write
+        self.last_seen = {}
+        self.limiter = AmbienceLIFXRateLimiter(self.sock.sendto)
+
+        receive_thread = threading.Thread(target=self.receive_loop)
+        receive_thread.daemon = True
+        receive_thread.start()
+
+    def next_seq_num(self, mac_addr):
+        """
+        Sequence numbers are 8 bits and counted per target.
+        """
+        mac_addr = mac_key(mac_addr)
+        with self.lock:
+            seq_num = self.seq_nums.get(mac_addr, 0)
+            self.seq_nums[mac_addr] = (seq_num + 1) % 256
+        return seq_num
+
+    def get_counters(self) -> dict:
+        """
+        Messages sent, throttled, merged into a newer write and dropped
+        because the throttle queue was full.
+        """
+        return self.limiter.get_counters()
+
+    def get_addrs(self, ip_addr, port):
+        if ip_addr:
+            return [(ip_addr, port)]
+        return [(broadcast_addr, port) for broadcast_addr in UDP_BROADCAST_IP_ADDRS]
+
+    def send(self, msg, ip_addr, port):
+        for addr in self.get_addrs(ip_addr, port):
+            self.sock.sendto(msg.packed_message, addr)
+
+    def write(self, target, msg, addrs):
+        """
+        Sends a write now if target has tokens, otherwise queues it. Returns
+        False if it was dropped because the queue is full.
+        """
+        if self.limiter.admit(target, len(addrs)):
+            for addr in addrs:
+                self.sock.sendto(msg.packed_message, addr)
+            return True
+        return self.limiter.enqueue(target, property_key(msg), msg.packed_message, addrs)
+
+    def fire_and_forget(self, device, msg_type, payload={}, num_repeats=DEFAULT_ATTEMPTS):
+        msg = msg_type(device.mac_addr, device.source_id, seq_num=self.next_seq_num(device.mac_addr),
+                       payload=payload, ack_requested=False, response_requested=False)
+        self.write(mac_key(device.mac_addr), msg, self.get_addrs(device.ip_addr, device.port) * num_repeats)
+
+    def probe(self, device):
+        """
+        Asks device for a small reply without waiting for it. The reply only
+        updates last_seen. Skipped while device is throttled.
+        """
+        addrs = self.get_addrs(device.ip_addr, device.port)
+        if not self.limiter.admit(mac_key(device.mac_addr), len(addrs)):
+            return
+
+        msg = LightGetPower(device.mac_addr, self.source_id, seq_num=self.next_seq_num(device.mac_addr),
+                            payload={}, ack_requested=False, response_requested=True)
+        self.send(msg, device.ip_addr, device.port)
+
+    def broadcast(self, msg_type, payload, subnets):
+        """
+        Sends one tagged message to every bulb on each of the given subnets.
+        Returns False if it was dropped.
+        """
+        msg = msg_type(BROADCAST_MAC, self.source_id, seq_num=self.next_seq_num(BROADCAST_MAC),
+                       payload=payload, ack_requested=False, response_requested=False)
+        return self.write(BROADCAST_MAC, msg, [(subnet, UDP_BROADCAST_PORT) for subnet in subnets])
+
+    def prepare(self, device, msg_type, payload, ack=True):
+        """
+        Packs a message, asking device for an acknowledgement unless ack is
+        False, ready to be sent by burst().
+        """
+        seq_num = self.next_seq_num(device.mac_addr)
+        msg = msg_type(device.mac_addr, device.source_id, seq_num=seq_num, payload=payload,
+                       ack_requested=ack, response_requested=False)
+
+        request = AmbienceLIFXRequest([Acknowledgement])
+        if ack:
+            request.key = (device.source_id, mac_key(device.mac_addr), seq_num)
+        request.target = mac_key(device.mac_addr)
+        request.prop = property_key(msg)
+        request.packet = msg.packed_message
+        request.addr = (device.ip_addr, device.port)
+
+        with self.lock:
+            key = (request.target, request.prop)
+            request.generation = self.generations[key] = self.generations.get(key, 0) + 1
+        return request
+
+    def is_latest(self, request) -> bool:
+        """
+        False once a newer write to the same property of the same bulb has
+        been prepared, so resending request would undo it.
+        """
+        with self.lock:
+            return self.generations.get((request.target, request.prop)) == request.generation
+
+    def burst(self, requests, queue=True):
+        """
+        Sends prepared requests back to back, with nothing but sendto in the
+        loop so the last packet leaves as close to the first as possible.
+        Requests to throttled bulbs are queued instead, or dropped if queue
+        is False. Returns the requests dropped.
+        """
+        with self.lock:
+            for request in requests:
+                if request.key:
+                    self.pending[request.key] = request
+
+        admitted = []
+        dropped = []
+        flags = self.limiter.admit_burst([request.target for request in requests])
+        for (request, admit) in zip(requests, flags):
+            if admit:
+                admitted.append(request)
+            elif not queue or not self.limiter.enqueue(request.target, request.prop, request.packet, [request.addr], request):
+                dropped.append(request)
+
+        # A failed send counts as a lost packet, it is left to the
+        # acknowledgement timeout
+        sendto = self.sock.sendto
+        failed = 0
+        for request in admitted:
+            try:
+                sendto(request.packet, request.addr)
+            except OSError:
+                failed += 1
+
+        if failed:
+            print(f"Unable to send {failed} of {len(admitted)} LIFX packets")
+
+        return dropped
+
+    def collect(self, requests, timeout_secs=DEFAULT_TIMEOUT):
+        """
+        Waits until every request of a burst is acknowledged or timeout_secs
+        has passed. Returns the requests that were not acknowledged.
+        """
+        deadline = monotonic() + timeout_secs
+        for request in requests:
+            request.event.wait(max(deadline - monotonic(), 0))
+
+        with self.lock:
+            for request in requests:
+                self.pending.pop(request.key, None)
+
+        return [request for request in requests if not request.event.is_set()]
+
+    def request(self, device, msg_type, response_types, payload={}, timeout_secs=DEFAULT_TIMEOUT, max_attempts=DEFAULT_ATTEMPTS):
+        """
+        Sends a message and blocks until a matching reply arrives. Raises
+        WorkflowException if every attempt times out.
+        """
+        ack = len(response_types) == 1 and Acknowledgement in response_types
+
+        seq_num = self.next_seq_num(device.mac_addr)
+        key = (device.source_id, mac_key(device.mac_addr), seq_num)
+        msg = msg_type(device.mac_addr, device.source_id, seq_num=seq_num, payload=payload,
+                       ack_requested=ack, response_requested=not ack)
+
+        request = AmbienceLIFXRequest(response_types)
+        with self.lock:
+            self.pending[key] = request
+
+        try:
+            for _ in range(max_attempts):
+                self.limiter.acquire(mac_key(device.mac_addr), len(self.get_addrs(device.ip_addr, device.port)))
+                self.send(msg, device.ip_addr, device.port)
+                if request.event.wait(timeout_secs):
+                    device.ip_addr = request.ip_addr
+                    return request.response
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+        raise WorkflowException("WorkflowException: Did not receive {} from {} (Name: {}) in response to {}".format(
+            str(response_types), str(device.mac_addr), str(device.label), str(msg_type)))
+
+    def match(self, response):
+        """
+        The pending request response answers. Replies addressed to the
+        broadcast MAC are matched by source id and sequence number alone,
+        as lifxlan does, if exactly one request fits.
+        """
+        target = mac_key(response.target_addr)
+        with self.lock:
+            request = self.pending.get((response.source_id, target, response.seq_num))
+            if request or target != BROADCAST_MAC:
+                return request
+
+            candidates = [request for ((source_id, _, seq_num), request) in self.pending.items()
+                          if source_id == response.source_id and seq_num == response.seq_num
+                          and type(response) in request.response_types]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def receive_loop(self):
+        while True:
+            try:
+                data, (ip_addr, _) = self.sock.recvfrom(1024)
+                response = unpack_lifx_message(data)
+            except OSError as error:
+                if self.sock.fileno() == -1: # Socket closed
+                    return
+                print(f"LIFX socket receive failed: {error}")
+                continue
+            except Exception:
+                continue
+
+            if response is None:
+                continue
+
+            received = monotonic()
+            self.last_seen[mac_key(response.target_addr)] = received
+
+            request = self.match(response)
+
+            if request and type(response) in request.response_types:
+                request.response = response
+                request.ip_addr = ip_addr
+                request.received = received
+                request.event.set()
+
+class AmbienceLIFXSharedLight(Light):
+    """
+    lifxlan Light routing all traffic through the shared AmbienceLIFXSocket
+    instead of opening a socket per request.
+    """
+
+    def __init__(self, shared_socket, mac_addr, ip_addr, **kwargs):
+        super().__init__(mac_addr, ip_addr, **kwargs)
+        self.shared_socket = shared_socket
+
+    def fire_and_forget(self, msg_type, payload={}, timeout_secs=DEFAULT_TIMEOUT, num_repeats=DEFAULT_ATTEMPTS):
+        self.shared_socket.fire_and_forget(self, msg_type, payload, num_repeats)
+
+    def req_with_resp(self, msg_type, response_type, payload={}, timeout_secs=DEFAULT_TIMEOUT, max_attempts=DEFAULT_ATTEMPTS):
+        if type(response_type) != list:
+            response_type = [response_type]
+        return self.shared_socket.request(self, msg_type, response_type, payload, timeout_secs, max_attempts)
@@ -0,0 +1,97 @@
+# ambience_connector.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from ambience.model.ambience_module_connector import AmbienceModuleConnector, AmbienceAsyncModuleConnector
+import asyncio
+
+from .ambience_mqtt_client import AmbienceMQTTClient
+from .ambience_mqtt_light import AmbienceMQTTLight, exposed_features
+from .ambience_mqtt_group import AmbienceMQTTGroup
+
+class AmbienceConnector(AmbienceModuleConnector):
+    def display_name(self):
+        return "MQTT"
+
+    def compare_device(self, device):
+        return isinstance(device, AmbienceMQTTLight)
+
+    def save_device(self, device):
+        return device.write_config()
+
+    def load_device(self, config, group):
+        return AmbienceMQTTLight.from_config(config, group)
+
+    def create_group(self, devices):
+        return AmbienceMQTTGroup(devices)
+
+    def discovery_list(self):
+        return [AmbienceMQTTLight.from_bridge(device) for device in AmbienceMQTTClient().get_devices()
+                if device.get("friendly_name") and exposed_features(device)]
+
+class AmbienceAsyncConnector(AmbienceAsyncModuleConnector):
+    """
+    Reads come from the client's copy of the retained state and commands
+    are handed to its network thread, so nothing here blocks, apart from
+    waiting for the device list once.
+    """
+
+    def display_name(self):
+        return "MQTT"
+
+    def compare_device(self, device):
+        return isinstance(device, AmbienceMQTTLight)
+
+    def save_device(self, device):
+        return device.write_config()
+
+    async def wait_for_devices(self):
+        client = AmbienceMQTTClient()
+        if not client.devices_waited:
+            await asyncio.to_thread(client.wait_for_devices)
+
+    async def discovery_list(self):
+        await self.wait_for_devices()
+        return AmbienceConnector().discovery_list()
+
+    async def load_device(self, config, group):
+        return AmbienceMQTTLight.from_config(config, group)
+
+    async def get_online(self, device):
+        await self.wait_for_devices()
+        return device.get_online()
+
+    async def get_capabilities(self, device):
+        await self.wait_for_devices()
+        return device.get_capabilities()
+
+    async def get_info(self, device):
+        return device.get_info()
+
+    async def refresh_state(self, device):
+        device.refresh_state()
+
+    async def set_color(self, device, hsvk):
+        device.set_color(hsvk)
+
+    async def set_power(self, device, power):
+        device.set_power(power)
+
+    async def set_infrared(self, device, infrared):
+        device.set_infrared(infrared)
+
+    async def set_label(self, device, label):
+        device.set_label(label)
@@ -0,0 +1,197 @@
+# ambience_mqtt_client.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+from time import monotonic
+import json, os, threading
+
+from ambience.singleton import Singleton
+
+try:
+    import paho.mqtt.client as mqtt
+    MQTT_AVAIL = True
+except ImportError:
+    MQTT_AVAIL = False
+
+CONFIG_FILE     = "mqtt.json"
+BROKER_ENV      = "AMBIENCE_MQTT_BROKER"    # host[:port]
+BASE_TOPIC      = "zigbee2mqtt"
+KEEPALIVE       = 30    # seconds
+DEVICES_TIMEOUT = 3     # seconds to wait for the retained device list
+
+class AmbienceMQTTClient(metaclass=Singleton):
+    """
+    One persistent broker connection shared by every MQTT light. The client
+    subscribes to everything below the base topic, so retained state
+    messages keep an in-memory copy of every device's state and reads never
+    need a round trip. Uses Zigbee2MQTT style topics:
+
+        <base>/bridge/devices       retained device list
+        <base>/<name>               retained state
+        <base>/<name>/availability  "online" / "offline"
+        <base>/<name>/set           commands
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = {}
+        self.availability = {}
+        self.last_seen = {}
+        self.devices = []
+        self.names = [] # Friendly names, longest first
+        self.devices_event = threading.Event()
+        self.devices_waited = False
+        self.connected = False
+        self.client = None
+
+        config = self.read_config()
+        if env := os.environ.get(BROKER_ENV):
+            (host, _, port) = env.partition(":")
+            config.update({"host": host, "port": int(port or 1883)})
+
+        self.base_topic = config.get("base_topic", BASE_TOPIC)
+
+        if not MQTT_AVAIL or "host" not in config:
+            return
+
+        if hasattr(mqtt, "CallbackAPIVersion"): # paho-mqtt >= 2.0
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+        else:
+            self.client = mqtt.Client()
+
+        if "username" in config:
+            self.client.username_pw_set(config["username"], config.get("password"))
+
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_message = self.on_message
+        self.client.reconnect_delay_set(1, 30)
+
+        self.client.connect_async(config["host"], config.get("port", 1883), KEEPALIVE)
+        self.client.loop_start()
+
+    def read_config(self) -> dict:
+        try:
+            with open(GLib.build_filenamev([GLib.get_user_config_dir(), CONFIG_FILE])) as config:
+                return json.load(config)
+        except (OSError, ValueError):
+            return {}
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f"MQTT broker refused connection: {mqtt.connack_string(rc)}")
+            return
+
+        self.connected = True
+        client.subscribe(self.base_topic + "/#")
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected = False
+
+    def on_message(self, client, userdata, msg):
+        topic = msg.topic[len(self.base_topic) + 1:]
+
+        try:
+            payload = json.loads(msg.payload) if msg.payload else None
+        except ValueError:
+            payload = msg.payload.decode(errors="replace")
+
+        if topic == "bridge/devices":
+            self.devices = payload or []
+            self.names = sorted({device["friendly_name"] for device in self.devices
+                                 if isinstance(device, dict) and device.get("friendly_name")},
+                                key=len, reverse=True)
+            self.devices_event.set()
+            return
+
+        if topic.startswith("bridge/"):
+            return
+
+        (name, sub_topic) = self.split_topic(topic)
+
+        with self.lock:
+            if sub_topic == "availability":
+                # Plain string or {"state": "online"} depending on version
+                state = payload.get("state") if isinstance(payload, dict) else payload
+                self.availability[name] = state == "online"
+            elif sub_topic == "" and isinstance(payload, dict):
+                self.states.setdefault(name, {}).update(payload)
+                self.last_seen[name] = monotonic()
+
+    def split_topic(self, topic):
+        """
+        Splits topic into (friendly name, sub topic). Names may contain "/",
+        so known names are matched first, longest first. Names that aren't
+        in the device list yet are split before the last known sub topic.
+        """
+        for name in self.names:
+            if topic == name or topic.startswith(name + "/"):
+                return (name, topic[len(name) + 1:])
+
+        parts = topic.split("/")
+        for i in range(len(parts) - 1, 0, -1):
+            if parts[i] in ("availability", "set", "get"):
+                return ("/".join(parts[:i]), "/".join(parts[i:]))
+        return (topic, "")
+
+    def wait_for_devices(self, timeout=DEVICES_TIMEOUT):
+        """
+        Waits for the retained device list once. Later calls return right
+        away, whether it arrived or not.
+        """
+        if self.client and not self.devices_waited:
+            self.devices_event.wait(timeout)
+            self.devices_waited = True
+
+    def get_devices(self, timeout=DEVICES_TIMEOUT) -> list:
+        """
+        The bridge's retained device list, waiting for it on first use.
+        """
+        self.wait_for_devices(timeout)
+        return self.devices
+
+    def get_state(self, name) -> dict:
+        with self.lock:
+            return dict(self.states.get(name, {}))
+
+    def is_online(self, name) -> bool:
+        self.wait_for_devices() # Retained states arrive with the device list
+        if not self.connected:
+            return False
+        with self.lock:
+            return self.availability.get(name, name in self.states)
+
+    def publish(self, name, payload):
+        self.publish_many([(name, payload)])
+
+    def publish_many(self, messages):
+        """
+        Publishes (name, payload) commands back to back at QoS 0 without
+        waiting for anything in between. The network thread writes them out
+        together. The in-memory state is updated right away so reads
+        reflect the command before the device echoes it.
+        """
+        if not self.client:
+            return
+
+        with self.lock:
+            for (name, payload) in messages:
+                self.states.setdefault(name, {}).update(payload)
+
+        for (name, payload) in messages:
+            self.client.publish(f"{self.base_topic}/{name}/set", json.dumps(payload), qos=0)
@@ -0,0 +1,77 @@
+# ambience_mqtt_group.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from ambience.model.ambience_module_group import AmbienceModuleGroup
+
+from .ambience_mqtt_client import AmbienceMQTTClient
+from .ambience_mqtt_light import hsbk_to_payload
+
+class AmbienceMQTTGroup(AmbienceModuleGroup):
+    """
+    Group commands are pipelined: every light's publish is queued at once
+    instead of one after another.
+    """
+
+    devices = None
+
+    def __init__(self, lights):
+        self.devices = lights
+
+    def set_color(self, hsvk):
+        payload = hsbk_to_payload(hsvk)
+        AmbienceMQTTClient().publish_many([(light.friendly_name, payload) for light in self.devices])
+
+    def set_colors(self, colors):
+        AmbienceMQTTClient().publish_many([(light.friendly_name, hsbk_to_payload(color))
+                                           for (light, color) in zip(self.devices, colors)])
+
+    def set_device_colors(self, device_colors, fields):
+        """
+        A brightness-only change is published as just the brightness, other
+        changes as the full colour.
+        """
+        if fields == (2,):
+            make_payload = lambda hsvk: {"brightness": hsbk_to_payload(hsvk)["brightness"]}
+        else:
+            make_payload = hsbk_to_payload
+
+        AmbienceMQTTClient().publish_many([(device.friendly_name, make_payload(hsvk))
+                                           for (device, hsvk) in device_colors])
+
+    def set_infrared(self, infrared):
+        pass
+
+    def set_power(self, power):
+        payload = {"state": "ON" if power else "OFF"}
+        AmbienceMQTTClient().publish_many([(light.friendly_name, payload) for light in self.devices])
+
+    # Publishing only queues the messages, no need for a worker thread
+
+    async def set_color_async(self, hsvk):
+        self.set_color(hsvk)
+
+    async def set_colors_async(self, colors):
+        self.set_colors(colors)
+
+    async def set_device_colors_async(self, device_colors, fields):
+        self.set_device_colors(device_colors, fields)
+
+    async def set_infrared_async(self, infrared):
+        pass
+
+    async def set_power_async(self, power):
+        self.set_power(power)
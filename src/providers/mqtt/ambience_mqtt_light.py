@@ -0,0 +1,160 @@
+# ambience_mqtt_light.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from ambience.model.ambience_device import AmbienceDeviceInfoType
+from ambience.model.ambience_light import AmbienceLight, AmbienceLightCapabilities
+
+from .ambience_mqtt_client import AmbienceMQTTClient
+
+MIN_MIRED = 153
+MAX_MIRED = 500
+
+def hsbk_to_payload(hsbk):
+    """
+    Set payload for an Ambience colour. Unsaturated colours are sent as a
+    colour temperature.
+    """
+    (h, s, v, k) = hsbk
+    payload = {"brightness": max(1, min(254, round(v * 254)))}
+
+    if s > 0:
+        payload["color"] = {"hue": round(h * 360) % 360, "saturation": round(s * 100)}
+    else:
+        payload["color_temp"] = max(MIN_MIRED, min(MAX_MIRED, round(1000000 / max(k, 1))))
+
+    return payload
+
+def state_to_hsbk(state):
+    kelvin = round(1000000 / state["color_temp"]) if state.get("color_temp") else 6500
+    brightness = state.get("brightness", 254) / 254
+    color = state.get("color") or {}
+
+    if state.get("color_mode") == "color_temp" or "hue" not in color:
+        return (0, 0, brightness, kelvin)
+
+    return (color["hue"] / 360, color.get("saturation", 0) / 100, brightness, kelvin)
+
+def exposed_features(device) -> set:
+    """
+    Names of the light features a bridge device entry exposes.
+    """
+    features = set()
+    for expose in (device.get("definition") or {}).get("exposes", []):
+        if expose.get("type") == "light":
+            features.update(feature.get("name") for feature in expose.get("features", []))
+    return features
+
+class AmbienceMQTTLight(AmbienceLight):
+    """
+    A light behind an MQTT bridge. Reads are served from the client's copy
+    of the retained state topics.
+    """
+
+    __slots__ = ("friendly_name", "features", "model")
+
+    def __init__(self):
+        super().__init__()
+        self.kind = "mqtt"
+        self.label = ""
+        self.friendly_name = None
+        self.features = None
+        self.model = None
+
+    @classmethod
+    def from_config(cls, light_config, group):
+        new = cls()
+        new.friendly_name = light_config["data"]["name"]
+        new.label = light_config["label"]
+        new.group = group
+        return new
+
+    @classmethod
+    def from_bridge(cls, device):
+        new = cls()
+        new.friendly_name = device["friendly_name"]
+        new.label = device["friendly_name"]
+        new.features = exposed_features(device)
+        new.model = (device.get("definition") or {}).get("description")
+        return new
+
+    def write_config(self):
+        return {
+            "name": self.friendly_name
+        }
+
+    def find_device(self):
+        for device in AmbienceMQTTClient().get_devices():
+            if device.get("friendly_name") == self.friendly_name:
+                return device
+        return {}
+
+    def get_capabilities(self) -> list:
+        if self.features is None:
+            device = self.find_device()
+            self.features = exposed_features(device)
+            self.model = (device.get("definition") or {}).get("description")
+
+        capabilities = []
+        if "color_hs" in self.features or "color_xy" in self.features:
+            capabilities.append(AmbienceLightCapabilities.COLOR)
+        if "color_temp" in self.features:
+            capabilities.append(AmbienceLightCapabilities.TEMPERATURE)
+        return capabilities
+
+    def get_online(self) -> bool:
+        return AmbienceMQTTClient().is_online(self.friendly_name)
+
+    def refresh_state(self):
+        state = AmbienceMQTTClient().get_state(self.friendly_name)
+        self.color = state_to_hsbk(state)
+        self.power = state.get("state") == "ON"
+        self.label = self.get_label()
+
+    def get_label(self) -> str:
+        return self.label or self.friendly_name
+
+    def set_label(self, label):
+        # Renaming changes the topic, leave the bridge's friendly name alone
+        pass
+
+    def get_power(self) -> bool:
+        return AmbienceMQTTClient().get_state(self.friendly_name).get("state") == "ON"
+
+    def set_power(self, power):
+        AmbienceMQTTClient().publish(self.friendly_name, {"state": "ON" if power else "OFF"})
+
+    def get_color(self):
+        return state_to_hsbk(AmbienceMQTTClient().get_state(self.friendly_name))
+
+    def set_color(self, hsvk):
+        AmbienceMQTTClient().publish(self.friendly_name, hsbk_to_payload(hsvk))
+
+    def get_infrared(self) -> float:
+        return 0
+
+    def set_infrared(self, i):
+        pass
+
+    def get_info(self):
+        device_info = {AmbienceDeviceInfoType.IP : AmbienceMQTTClient().base_topic + "/" + self.friendly_name}
+        if self.model:
+            device_info[AmbienceDeviceInfoType.MODEL] = self.model
+        return device_info
+
+    def get_info_version(self):
+        # get_info needs no request, the info itself is its version
+        return [AmbienceMQTTClient().base_topic, self.friendly_name, self.model]
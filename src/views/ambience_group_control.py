@@ -15,9 +15,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from gi.repository import Gtk
+from gi.repository import Gtk, GLib
 
+from ambience.ambience_music_sync import AmbienceMusicSync, NUMPY_AVAIL
+from ambience.ambience_profiler import AmbienceProfiler
+from ambience.model.ambience_event_loop import AmbienceTaskScope, AmbienceWriteQueue
 from ambience.model.ambience_light import AmbienceLightCapabilities
+from ambience.model.ambience_palette import AmbiencePalettePattern, generate
 
 @Gtk.Template(resource_path='/io/github/lukajankovic/ambience/ambience_group_control.ui')
 class AmbienceGroupControl(Gtk.Box):
@@ -38,6 +42,11 @@ class AmbienceGroupControl(Gtk.Box):
     infrared_scale = Gtk.Template.Child()
 
     power_switch = Gtk.Template.Child()
+    pattern_combo = Gtk.Template.Child()
+
+    music_row = Gtk.Template.Child()
+    music_file_button = Gtk.Template.Child()
+    music_switch = Gtk.Template.Child()
 
     light_label = Gtk.Template.Child()
     light_sub_label = Gtk.Template.Child()
@@ -47,15 +56,22 @@ class AmbienceGroupControl(Gtk.Box):
     back_callback = None
     capabilities = []
     has_infrared = False
+    music_sync = None
 
-    def __init__(self, group, deck, back_callback, value_changed_cb, **kwargs):
+    def __init__(self, group, deck, back_callback, **kwargs):
         self.group = group
         self.deck = deck
         self.back_callback = back_callback
-        self.value_changed_cb = value_changed_cb
+        self.writes = AmbienceWriteQueue(AmbienceTaskScope()) # Not cancelled with the page, writes made still arrive
 
         super().__init__(**kwargs)
 
+        self.music_row.set_visible(NUMPY_AVAIL) # FFT needs numpy
+
+        # However the page is left, the stream stops with it
+        self.connect("unmap", self.stop_music)
+        self.connect("destroy", self.stop_music)
+
     def show(self):
         self.update_active = True
 
@@ -127,31 +143,66 @@ class AmbienceGroupControl(Gtk.Box):
         kelvin = self.kelvin_scale.get_value()
         infrared = self.infrared_scale.get_value()
 
-        hsbk = [hue / 365, saturation / 100, brightness / 100, kelvin]
-        self.group.set_color(hsbk.copy())
-        self.group.set_infrared(infrared / 100)
-
-        for device in self.group.get_devices():
-            if device.color:
-                device.color = hsbk
+        with AmbienceProfiler().phase("push_group"):
+            hsbk = [hue / 365, saturation / 100, brightness / 100, kelvin]
+            pattern = AmbiencePalettePattern(self.pattern_combo.get_active())
 
-            if device.infrared:
-                device.infrared = infrared
+            if pattern == AmbiencePalettePattern.UNIFORM:
+                colors = [hsbk] * len(self.group.get_devices())
+            else:
+                colors = generate(pattern, hsbk, len(self.group.get_devices()))
 
-        self.value_changed_cb()
+            # Devices already showing a colour are skipped, and a drag on one
+            # slider only sends that component
+            self.writes.put("color", lambda: self.group.push_colors_async(colors))
+            self.writes.put("infrared", lambda: self.group.push_infrared_async(infrared / 100))
 
     @Gtk.Template.Callback("set_light_power")
     def set_light_power(self, sender, user_data):
         if self.update_active:
             return
 
-        for device in self.group.get_devices():
-            if device.power is not None:
-                device.power = self.power_switch.get_active() 
+        power = self.power_switch.get_active()
+
+        with AmbienceProfiler().phase("push_group"):
+            for device in self.group.get_devices():
+                if device.power is not None:
+                    device.power = power
+
+            self.writes.put("power", lambda: self.group.set_power_async(power))
+
+    @Gtk.Template.Callback("toggle_music")
+    def toggle_music(self, sender, user_data):
+        if self.music_sync:
+            self.music_sync.stop()
+            self.music_sync = None
+
+        if not self.music_switch.get_active():
+            return
+
+        path = self.music_file_button.get_filename()
+        if not path:
+            self.music_switch.set_active(False)
+            return
+
+        def music_done(music_sync):
+            def reset_switch():
+                if self.music_sync is music_sync:
+                    self.music_sync = None
+                    self.music_switch.set_active(False)
+            GLib.idle_add(reset_switch)
+
+        # Opened on the sync's own thread, a pipe blocks until written to
+        self.music_sync = AmbienceMusicSync(self.group, path, music_done)
+        self.music_sync.start()
 
-        self.group.set_power(self.power_switch.get_active())
-        self.value_changed_cb()
+    def stop_music(self, *args):
+        if self.music_sync:
+            self.music_sync.stop()
+            self.music_sync = None
+        self.music_switch.set_active(False)
 
     @Gtk.Template.Callback("go_back")
     def go_back(self, sender):
+        self.stop_music()
         self.back_callback(self)
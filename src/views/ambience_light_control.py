@@ -16,10 +16,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from gi.repository import Gtk, Gdk, GLib
-import threading
+import asyncio
 
+from ambience.ambience_info_cache import AmbienceInfoCache
+from ambience.model.ambience_event_loop import AmbienceTaskScope, AmbienceWriteQueue
 from ambience.model.ambience_light import AmbienceLightCapabilities
 from ambience.model.ambience_device import AmbienceDeviceInfoType
+from ambience.ambience_profiler import AmbienceProfiler
+from ambience.model.ambience_retry import AmbienceRetry, AmbienceDeviceUnavailableException
+from ambience.providers.ambience_providers import AmbienceProviders
 
 @Gtk.Template(resource_path='/io/github/lukajankovic/ambience/ambience_light_control.ui')
 class AmbienceLightControl(Gtk.Box):
@@ -64,13 +69,12 @@ class AmbienceLightControl(Gtk.Box):
     back_callback = None
     update_active = False
 
-    value_changed_cb = None
-
-    def __init__(self, light, deck, back_callback, value_changed_cb, **kwargs):
+    def __init__(self, light, deck, back_callback, **kwargs):
         self.light = light
         self.deck = deck
         self.back_callback = back_callback
-        self.value_changed_cb = value_changed_cb
+        self.tasks = AmbienceTaskScope()
+        self.writes = AmbienceWriteQueue(AmbienceTaskScope()) # Not cancelled with the page, writes made still arrive
 
         super().__init__(**kwargs)
 
@@ -78,40 +82,36 @@ class AmbienceLightControl(Gtk.Box):
         """
         The view is ready to show. Update rows.
         """
-        def show_async():
+        async def show_async():
 
             #self.main_stack.set_visible_child_name("loading")
 
-            for _ in range(5):
-                try:
-                    #self.label = self.light.get_label()
-                    #self.power = self.light.get_power()
-
-                    #self.color = self.light.get_color()
+            self.label = self.light.label
+            self.power = self.light.power
+            self.color = self.light.color
+            self.info = self.light.info or AmbienceInfoCache().get(self.light) or {}
+            self.capabilities = self.light.capabilities or []
+            self.infrared = None
 
-                    #self.capabilities = self.light.get_capabilities()
-
-                    #if AmbienceLightCapabilities.INFRARED in self.capabilities:
-                    #    self.infrared = self.light.get_infrared()
-
-                    self.label = self.light.label
-                    self.power = self.light.power
-                    self.color = self.light.color
-                    self.info = self.light.info
-                    self.capabilities = self.light.capabilities
+            if AmbienceLightCapabilities.INFRARED in self.capabilities:
+                try:
+                    self.infrared = await asyncio.to_thread(AmbienceRetry().call, self.light, self.light.get_infrared)
+                except AmbienceDeviceUnavailableException:
+                    pass
 
-                    if AmbienceLightCapabilities.INFRARED in self.capabilities:
-                        self.infrared = self.light.get_inrfared()
-                    break
+            self.tasks.idle(self.update_rows)
 
-                except:
-                    pass
+            if self.light.available:
+                try:
+                    self.light.info = await asyncio.to_thread(AmbienceRetry().call, self.light,
+                                                              lambda: AmbienceInfoCache().load(self.light))
+                except AmbienceDeviceUnavailableException:
+                    return
 
-            GLib.idle_add(self.update_rows)
+                self.info = self.light.info
+                self.tasks.idle(self.update_info_rows)
 
-        show_thread = threading.Thread(target=show_async)
-        show_thread.daemon = True
-        show_thread.start()
+        self.tasks.submit(show_async())
 
     def update_rows(self):
         self.main_stack.set_visible_child_name("controls")
@@ -121,6 +121,8 @@ class AmbienceLightControl(Gtk.Box):
         self.light_label.set_label(self.label)
         self.power_switch.set_active(self.power)
 
+        self.update_info_rows()
+
         if not self.color or not self.capabilities:
             self.hue_row.set_visible(True)
             self.saturation_row.set_visible(True)
@@ -149,6 +151,7 @@ class AmbienceLightControl(Gtk.Box):
 
         self.update_active = False
 
+    def update_info_rows(self):
         rows = {
             AmbienceDeviceInfoType.MODEL    : self.model_row,
             AmbienceDeviceInfoType.IP       : self.ip_row,
@@ -182,13 +185,15 @@ class AmbienceLightControl(Gtk.Box):
         kelvin = self.kelvin_scale.get_value()
 
         hsbk = [hue / 365, saturation / 100, brightness / 100, kelvin]
-        self.light.set_color(hsbk)
-        self.light.color = hsbk
 
-        if AmbienceLightCapabilities.INFRARED in self.light.capabilities:
-            self.light.set_infrared(self.infrared_scale.get_value() * 100)
+        with AmbienceProfiler().phase("push_light"):
+            connector = AmbienceProviders().import_async_provider(self.light.kind)
+            self.writes.put("color", lambda: connector.set_color(self.light, hsbk))
+            self.light.color = hsbk
 
-        self.value_changed_cb(light=self.light)
+            if AmbienceLightCapabilities.INFRARED in self.light.capabilities:
+                infrared = self.infrared_scale.get_value() * 100
+                self.writes.put("infrared", lambda: connector.set_infrared(self.light, infrared))
 
     @Gtk.Template.Callback("set_light_power")
     def set_light_power(self, sender, user_data):
@@ -196,10 +201,11 @@ class AmbienceLightControl(Gtk.Box):
             return 
 
         power = sender.get_active()
-        self.light.set_power(power)
-        self.light.power = power
 
-        self.value_changed_cb(self.light)
+        with AmbienceProfiler().phase("push_light"):
+            connector = AmbienceProviders().import_async_provider(self.light.kind)
+            self.writes.put("power", lambda: connector.set_power(self.light, power))
+            self.light.power = power
 
     # Editing label
 
@@ -247,8 +253,7 @@ class AmbienceLightControl(Gtk.Box):
             self.light.label = new_label
             self.light_label.set_text(new_label)
 
-            self.value_changed_cb(self.light)
-
     @Gtk.Template.Callback("go_back")
     def go_back(self, sender):
+        self.tasks.cancel()
         self.back_callback(self)
\ No newline at end of file
@@ -28,3 +28,6 @@ class AmbienceFlowBox(Gtk.Box):
 
     def insert(self, item, index):
         self.flowbox.insert(item, index)
+
+    def remove_item(self, item):
+        self.flowbox.remove(item)
@@ -17,12 +17,15 @@
 
 from gi.repository import Gtk
 
+from ambience.model.ambience_notify import AmbienceNotifier
+
 @Gtk.Template(resource_path='/io/github/lukajankovic/ambience/ambience_group_row.ui')
 class AmbienceGroupRow(Gtk.ListBoxRow):
     __gtype_name__ = 'AmbienceGroupRow'
 
     group = None
     check_action = None
+    subscription = None
 
     title = Gtk.Template.Child()
     check = Gtk.Template.Child()
@@ -41,4 +44,13 @@ class AmbienceGroupRow(Gtk.ListBoxRow):
         super().__init__(**kwargs)
 
         self.group = group
-        self.title.set_label(self.group.get_label())
\ No newline at end of file
+        self.title.set_label(self.group.get_label())
+
+        self.subscription = AmbienceNotifier().subscribe(group, ("label",), self.label_changed)
+
+    def unsubscribe(self):
+        AmbienceNotifier().unsubscribe(self.subscription)
+        self.subscription = None
+
+    def label_changed(self, group, changed):
+        self.set_title(group.get_label())
\ No newline at end of file
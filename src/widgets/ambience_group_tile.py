@@ -17,6 +17,10 @@
 
 from gi.repository import Gtk
 
+from ambience.model.ambience_light import AmbienceLightCapabilities
+from ambience.model.ambience_notify import AmbienceNotifier
+from ambience.widgets.ambience_tile_colors import rgb_css, tile_rgb
+
 @Gtk.Template(resource_path='/io/github/lukajankovic/ambience/ambience_group_tile.ui')
 class AmbienceGroupTile(Gtk.FlowBoxChild):
     __gtype_name__ = 'AmbienceGroupTile'
@@ -24,6 +28,13 @@ class AmbienceGroupTile(Gtk.FlowBoxChild):
     label = ""
     online = []
 
+    DISPLAYED = ("capabilities", "color", "power")
+
+    subscriptions = []
+
+    button_style_provider = None
+    text_style_provider = None
+
     clicked_callback = None
 
     top_label = Gtk.Template.Child()
@@ -38,6 +49,30 @@ class AmbienceGroupTile(Gtk.FlowBoxChild):
         self.clicked_callback = clicked_callback
         self.top_label.set_text("All lights")
 
+        self.subscribe()
+
+    def subscribe(self):
+        """
+        Follows the group's membership and what each member displays.
+        """
+        notifier = AmbienceNotifier()
+        self.subscriptions = [notifier.subscribe(self.group, ("devices",), self.devices_changed)]
+        for device in self.group.get_devices():
+            self.subscriptions.append(notifier.subscribe(device, self.DISPLAYED, self.device_changed))
+
+    def unsubscribe(self):
+        for subscription in self.subscriptions:
+            AmbienceNotifier().unsubscribe(subscription)
+        self.subscriptions = []
+
+    def devices_changed(self, group, changed):
+        self.unsubscribe()
+        self.subscribe()
+        self.update()
+
+    def device_changed(self, device, changed):
+        self.update()
+
     def count_on(self):
         count = 0
         for device in self.group.get_devices():
@@ -45,10 +80,55 @@ class AmbienceGroupTile(Gtk.FlowBoxChild):
                 count += 1
         return count
 
+    def clear_styles(self):
+        if self.button_style_provider:
+            self.tile_button.get_style_context().remove_provider(self.button_style_provider)
+            self.button_style_provider = None
+
+        if self.text_style_provider:
+            self.top_label.get_style_context().remove_provider(self.text_style_provider)
+            self.bottom_label.get_style_context().remove_provider(self.text_style_provider)
+            self.text_style_provider = None
+
+    def average_rgb(self):
+        """
+        Mean tile colour of the lights that are on, None if all are off.
+        """
+        colors = []
+        for device in self.group.get_devices():
+            if not getattr(device, "power", None) or not device.capabilities:
+                continue
+            if AmbienceLightCapabilities.COLOR in device.capabilities and device.color:
+                colors.append(tile_rgb(*device.color))
+            else:
+                colors.append(tile_rgb(0, 0, 1, 6500))
+
+        if not colors:
+            return None
+        return tuple(sum(c[i] for c in colors) / len(colors) for i in range(3))
+
     def update(self):
         count = self.count_on()
         self.bottom_label.set_text(str(count) + "/" + str(len(self.group.get_devices())) + " lights on")
 
+        self.clear_styles()
+        rgb = self.average_rgb()
+        if rgb is None:
+            return
+
+        (background, text) = rgb_css(*rgb)
+
+        css = f'.ambience_light_tile {{ background: { background }; text-shadow: none; }}'.encode()
+        self.button_style_provider = Gtk.CssProvider()
+        self.button_style_provider.load_from_data(css)
+        self.tile_button.get_style_context().add_provider(self.button_style_provider, 600)
+
+        css = f'.ambience_light_tile_text {{ color: { text }; }}'.encode()
+        self.text_style_provider = Gtk.CssProvider()
+        self.text_style_provider.load_from_data(css)
+        self.top_label.get_style_context().add_provider(self.text_style_provider, 600)
+        self.bottom_label.get_style_context().add_provider(self.text_style_provider, 600)
+
     @Gtk.Template.Callback("tile_clicked")
     def tile_clicked(self, sender):
         if self.clicked_callback:
@@ -0,0 +1,179 @@
+# ambience_light_grid.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from collections import Counter
+
+from gi.repository import Gtk, GLib
+
+from ambience.widgets.ambience_flow_box import AmbienceFlowBox
+from ambience.widgets.ambience_light_tile import AmbienceLightTile
+
+class AmbienceLightGrid(Gtk.Box):
+    """
+    Grid of light tiles backed by a list of devices. Only the rows around the
+    viewport have tiles, the rest is padded with spacers. Tiles leaving the
+    viewport go back to a pool and are reused for the rows entering it.
+    """
+    __gtype_name__ = 'AmbienceLightGrid'
+
+    PAGE_SIZE = 24
+    BUFFER_ROWS = 2
+
+    def __init__(self, adjustment, clicked_callback, **kwargs):
+        super().__init__(orientation=Gtk.Orientation.VERTICAL, **kwargs)
+
+        self.adjustment = adjustment
+        self.clicked_callback = clicked_callback
+
+        self.devices = []
+        self.tiles = {} # Device index -> tile
+        self.pool = []
+        self.window = (0, 0)
+        self.update_pending = False
+
+        self.size_group = Gtk.SizeGroup()
+        self.size_group.set_mode(Gtk.SizeGroupMode.HORIZONTAL)
+
+        self.top_spacer = Gtk.Box(visible=True)
+        self.bottom_spacer = Gtk.Box(visible=True)
+        self.flow_box = AmbienceFlowBox()
+
+        self.add(self.top_spacer)
+        self.add(self.flow_box)
+        self.add(self.bottom_spacer)
+        self.set_visible(True)
+
+        self.adjustment.connect("value-changed", self.scrolled)
+        self.adjustment.connect("changed", self.scrolled)
+        self.flow_box.connect("size-allocate", self.scrolled)
+
+    def set_devices(self, devices):
+        """
+        Shows a new list of devices, returning the current tiles to the pool.
+        """
+        for tile in self.tiles.values():
+            self.release(tile)
+
+        self.devices = list(devices)
+        self.tiles = {}
+        self.window = (0, 0)
+
+        self.set_window(0, min(self.PAGE_SIZE, len(self.devices)))
+
+    def release(self, tile):
+        self.flow_box.remove_item(tile)
+        self.size_group.remove_widget(tile)
+        tile.unsubscribe()
+        self.pool.append(tile)
+
+    def create(self, index, position):
+        device = self.devices[index]
+        if self.pool:
+            tile = self.pool.pop()
+            tile.set_light(device)
+        else:
+            tile = AmbienceLightTile(device, self.clicked_callback)
+
+        self.tiles[index] = tile
+        self.size_group.add_widget(tile)
+        self.flow_box.insert(tile, position)
+
+        if device.available is not None or device.stale:
+            tile.update()
+
+    def set_window(self, first, last):
+        """
+        Keeps tiles for devices[first:last] only.
+        """
+        for index in [index for index in self.tiles if not first <= index < last]:
+            self.release(self.tiles.pop(index))
+
+        # Ascending order keeps index - first equal to the tile's position
+        for index in range(first, last):
+            if index not in self.tiles:
+                self.create(index, index - first)
+
+        self.window = (first, last)
+
+    def measure(self):
+        """
+        Returns (columns, row height) of the laid out tiles, or None before
+        they have been allocated.
+        """
+        allocations = [tile.get_allocation() for tile in self.tiles.values()]
+        if not allocations or allocations[0].height <= 1:
+            return None
+
+        columns = max(Counter(allocation.y for allocation in allocations).values())
+        row_height = allocations[0].height + self.flow_box.flowbox.get_row_spacing()
+        return (columns, row_height)
+
+    def get_offset(self):
+        """
+        Position of the grid inside the scrolled content.
+        """
+        content = self
+        while content.get_parent() and not isinstance(content.get_parent(), Gtk.Viewport):
+            content = content.get_parent()
+
+        coordinates = self.translate_coordinates(content, 0, 0)
+        return coordinates[1] if coordinates else 0
+
+    def scrolled(self, *args):
+        # Layout changes are not allowed while allocating, defer to idle
+        if not self.update_pending:
+            self.update_pending = True
+            GLib.idle_add(self.update_window)
+
+    def update_window(self):
+        """
+        Moves the tile window to the rows around the viewport and resizes the
+        spacers to stand in for the rows without tiles.
+        """
+        self.update_pending = False
+
+        metrics = self.measure()
+        if not metrics:
+            return
+
+        (columns, row_height) = metrics
+        top = self.adjustment.get_value() - self.get_offset()
+        bottom = top + self.adjustment.get_page_size()
+
+        first_row = max(0, int(top // row_height) - self.BUFFER_ROWS)
+        last_row = max(first_row, int(bottom // row_height) + 1 + self.BUFFER_ROWS)
+
+        first = min(first_row * columns, len(self.devices))
+        last = min(last_row * columns, len(self.devices))
+
+        if (first, last) != self.window:
+            self.set_window(first, last)
+
+        rows = -(-len(self.devices) // columns)
+        self.set_spacer(self.top_spacer, (first // columns) * row_height)
+        self.set_spacer(self.bottom_spacer, (rows - -(-last // columns)) * row_height)
+
+    def set_spacer(self, spacer, height):
+        if spacer.get_size_request()[1] != height:
+            spacer.set_size_request(-1, height)
+
+    def update(self):
+        """
+        Redraws every created tile. Tiles follow their own light's changes,
+        this is only needed when something outside the model changed.
+        """
+        for tile in self.tiles.values():
+            tile.update()
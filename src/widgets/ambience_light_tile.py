@@ -18,21 +18,19 @@
 import gi
 
 from gi.repository import Gtk
-import colorsys
 
 from ambience.model.ambience_light import AmbienceLightCapabilities
-
-def rgb_to_hex(r, g, b):
-    return '#{:02x}{:02x}{:02x}'.format(int(r * 255), int(g * 255), int(b * 255))
-
-def darkmode_color(r, g, b):
-    return (int(r * 255) * 0.299 + int(g * 255) * 0.587 + int(b * 255) * 0.114) > 145
+from ambience.model.ambience_notify import AmbienceNotifier
+from ambience.widgets.ambience_tile_colors import tile_css
 
 @Gtk.Template(resource_path='/io/github/lukajankovic/ambience/ambience_light_tile.ui')
 class AmbienceLightTile(Gtk.FlowBoxChild):
     __gtype_name__ = 'AmbienceLightTile'
 
+    DISPLAYED = ("label", "available", "capabilities", "color", "power", "stale")
+
     light = None
+    subscription = None
 
     button_style_provider = None
     text_style_provider = None
@@ -45,8 +43,11 @@ class AmbienceLightTile(Gtk.FlowBoxChild):
     tile_button = Gtk.Template.Child()
 
     def clear_styles(self):
+        self.tile_button.get_style_context().remove_class("stale")
+
         if self.button_style_provider:
             self.tile_button.get_style_context().remove_provider(self.button_style_provider)
+            self.button_style_provider = None
 
         if self.text_style_provider:
                 self.top_label.get_style_context().remove_provider(self.text_style_provider)
@@ -57,31 +58,31 @@ class AmbienceLightTile(Gtk.FlowBoxChild):
         self.top_label.set_text(self.light.label)
         self.clear_styles()
 
-        if self.offline or not self.light.capabilities:
+        if self.light.stale:
+            self.tile_button.get_style_context().add_class("stale")
+
+        if self.offline or self.light.available is False or not self.light.capabilities:
             self.bottom_label.set_text("Unavailable")
             return
 
         if AmbienceLightCapabilities.COLOR in self.light.capabilities:
             color = self.light.color
         else:
-            color = (0, 0, 1, 1) # Display colorless lights as white
+            color = (0, 0, 1, 6500) # Display colorless lights as daylight white
 
         if self.light.power:
             (h, s, v, k) = color
-            (r, g, b) = colorsys.hsv_to_rgb(h, s, v)
+            (background, text) = tile_css(h, s, v, k)
 
             self.bottom_label.set_text(str(int(v * 100)) + "%")
 
-            css = f'.ambience_light_tile {{ background: { rgb_to_hex(r, g, b) }; text-shadow: none; }}'.encode()
+            css = f'.ambience_light_tile {{ background: { background }; text-shadow: none; }}'.encode()
             self.button_style_provider = Gtk.CssProvider()
             self.button_style_provider.load_from_data(css)
 
             self.tile_button.get_style_context().add_provider(self.button_style_provider, 600) # TODO: fix magic number
 
-            css = '.ambience_light_tile_text { color: #FFFFFF; }'.encode()
-
-            if darkmode_color(r, g, b):
-                css = '.ambience_light_tile_text { color: #000000; }'.encode()
+            css = f'.ambience_light_tile_text {{ color: { text }; }}'.encode()
 
             self.text_style_provider = Gtk.CssProvider()
             self.text_style_provider.load_from_data(css)
@@ -93,18 +94,44 @@ class AmbienceLightTile(Gtk.FlowBoxChild):
             self.bottom_label.set_text("Off")
 
 
+    def light_changed(self, light, changed):
+        if light is not self.light: # Recycled since the change was queued
+            return
+        if light.available is None and not light.stale: # Still loading, drawn once it's done
+            return
+        self.update()
+
     @Gtk.Template.Callback("tile_clicked")
     def tile_clicked(self, sender):
         if self.clicked_callback:
             self.clicked_callback(self)
 
-    def __init__(self, light, clicked_callback, offline=False, **kwargs):
-        super().__init__(**kwargs)
+    def set_light(self, light, offline=False):
+        """
+        Binds the tile to a (possibly different) light, used when recycling.
+        """
+        AmbienceNotifier().unsubscribe(self.subscription)
 
         self.light = light
-        self.clicked_callback = clicked_callback
         self.offline = offline
+        self.subscription = AmbienceNotifier().subscribe(light, self.DISPLAYED, self.light_changed)
 
+        self.clear_styles()
         self.top_label.set_text(self.light.label)
+        self.bottom_label.set_text("")
+
+    def unsubscribe(self):
+        """
+        Drops the light before the tile is pooled.
+        """
+        AmbienceNotifier().unsubscribe(self.subscription)
+        self.subscription = None
+        self.light = None
+
+    def __init__(self, light, clicked_callback, offline=False, **kwargs):
+        super().__init__(**kwargs)
+
+        self.clicked_callback = clicked_callback
+        self.set_light(light, offline)
 
         #self.update()
@@ -0,0 +1,96 @@
+# ambience_tile_colors.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tile background colours. Hue and white temperature come from tables built
+once at import; the final colour of a tile is cached per quantised
+(hue, saturation, brightness, kelvin), so an update costs one lookup.
+"""
+
+from functools import lru_cache
+import colorsys, math
+
+HUE_STEPS       = 360
+KELVIN_MIN      = 1500
+KELVIN_MAX      = 9000
+KELVIN_STEP     = 100
+
+def kelvin_to_rgb(kelvin):
+    """
+    Blackbody approximation by Tanner Helland, good enough for the range
+    LIFX bulbs support.
+    """
+    t = kelvin / 100
+
+    if t <= 66:
+        r = 255
+        g = 99.4708025861 * math.log(t) - 161.1195681661
+    else:
+        r = 329.698727446 * (t - 60) ** -0.1332047592
+        g = 288.1221695283 * (t - 60) ** -0.0755148492
+
+    if t >= 66:
+        b = 255
+    elif t <= 19:
+        b = 0
+    else:
+        b = 138.5177312231 * math.log(t - 10) - 305.0447927307
+
+    return tuple(min(max(c, 0), 255) / 255 for c in (r, g, b))
+
+HUE_TABLE = [colorsys.hsv_to_rgb(i / HUE_STEPS, 1, 1) for i in range(HUE_STEPS)]
+KELVIN_TABLE = [kelvin_to_rgb(k) for k in range(KELVIN_MIN, KELVIN_MAX + 1, KELVIN_STEP)]
+
+def rgb_to_hex(r, g, b):
+    return '#{:02x}{:02x}{:02x}'.format(int(r * 255), int(g * 255), int(b * 255))
+
+def darkmode_color(r, g, b):
+    return (int(r * 255) * 0.299 + int(g * 255) * 0.587 + int(b * 255) * 0.114) > 145
+
+@lru_cache(maxsize=4096)
+def lookup(hue, saturation, brightness, kelvin):
+    """
+    Colour for a quantised key: hue in degrees, saturation and brightness
+    in percent, kelvin in KELVIN_STEP steps from KELVIN_MIN.
+    """
+    hue_rgb = HUE_TABLE[hue]
+    white_rgb = KELVIN_TABLE[kelvin]
+    s = saturation / 100
+    v = brightness / 100
+
+    return tuple((w * (1 - s) + c * s) * v for (w, c) in zip(white_rgb, hue_rgb))
+
+def tile_rgb(h, s, v, k):
+    """
+    Colour of a bulb set to (h, s, v, k), with h, s and v in 0..1. Low
+    saturation blends towards the bulb's white temperature.
+    """
+    kelvin = min(max(int(k), KELVIN_MIN), KELVIN_MAX)
+    return lookup(int(h * HUE_STEPS) % HUE_STEPS,
+                  min(max(int(s * 100), 0), 100),
+                  min(max(int(v * 100), 0), 100),
+                  (kelvin - KELVIN_MIN) // KELVIN_STEP)
+
+@lru_cache(maxsize=4096)
+def rgb_css(r, g, b):
+    """
+    (background, text colour) for a tile of the given colour.
+    """
+    return (rgb_to_hex(r, g, b), "#000000" if darkmode_color(r, g, b) else "#FFFFFF")
+
+def tile_css(h, s, v, k):
+    return rgb_css(*tile_rgb(h, s, v, k))
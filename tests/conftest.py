@@ -0,0 +1,29 @@
+# conftest.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Tests run against an installed build, like the benchmarks, and share
+their mock devices:
+
+    AMBIENCE_PKGDATADIR=/usr/local/share/ambience python3 -m pytest tests
+"""
+
+import os, sys
+
+pkgdatadir = os.environ.get("AMBIENCE_PKGDATADIR", "/usr/local/share/ambience")
+sys.path.insert(1, pkgdatadir)
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks"))
@@ -0,0 +1,43 @@
+# test_files.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json, os
+
+import pytest
+
+from ambience.ambience_files import atomic_write_json
+
+def test_writes_and_replaces(tmp_path):
+    path = os.path.join(tmp_path, "cache", "state.json")
+
+    atomic_write_json(path, {"a": 1})
+    atomic_write_json(path, {"a": 2})
+
+    with open(path) as written:
+        assert json.load(written) == {"a": 2}
+    assert os.listdir(os.path.dirname(path)) == ["state.json"]
+
+def test_failed_write_keeps_old_file(tmp_path):
+    path = os.path.join(tmp_path, "state.json")
+    atomic_write_json(path, {"a": 1})
+
+    with pytest.raises(TypeError):
+        atomic_write_json(path, {"a": object()})
+
+    with open(path) as written:
+        assert json.load(written) == {"a": 1}
+    assert os.listdir(tmp_path) == ["state.json"] # No temporary file left
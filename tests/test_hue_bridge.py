@@ -0,0 +1,95 @@
+# test_hue_bridge.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from types import SimpleNamespace
+import threading, time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from mock_hue_bridge import USERNAME, create_bridge
+
+from ambience.providers.hue.ambience_hue_bridge import AmbienceHueBridge
+from ambience.providers.hue.ambience_hue_group import AmbienceHueGroup
+
+LIGHTS = 6
+
+@pytest.fixture
+def server():
+    server = create_bridge(0, LIGHTS)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def bridge(server):
+    return AmbienceHueBridge("{}:{}".format(*server.server_address), USERNAME)
+
+def writes(server):
+    with server.lock:
+        return [(method, path.split("/", 3)[3]) for (method, path) in server.log if method != "GET"]
+
+def wait_for_writes(server, count, timeout=2):
+    deadline = time.monotonic() + timeout
+    while len(writes(server)) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05) # Anything sent past count
+    return writes(server)
+
+def test_requests_share_one_connection(server, bridge):
+    for light_id in range(1, LIGHTS + 1):
+        bridge.get_light(light_id)
+        bridge.request("PUT", "lights", light_id, "state", body={"bri": 100})
+
+    assert server.requests == 2 * LIGHTS
+    assert server.connections == 1
+
+def test_whole_bridge_uses_group_0(server, bridge):
+    bridge.submit_group([str(i) for i in range(1, LIGHTS + 1)], {"on": False})
+
+    assert wait_for_writes(server, 1) == [("PUT", "groups/0/action")]
+    assert all(not light["state"]["on"] for light in server.lights.values())
+
+def test_part_of_bridge_is_sent_per_light(server, bridge):
+    bridge.submit_group(["1", "3"], {"bri": 10})
+
+    assert sorted(wait_for_writes(server, 2)) == [("PUT", "lights/1/state"), ("PUT", "lights/3/state")]
+    assert not server.groups # No group created on the bridge
+    assert [light_id for (light_id, light) in server.lights.items() if light["state"]["bri"] == 10] == ["1", "3"]
+
+def test_queued_write_is_replaced(server, bridge):
+    release = threading.Event()
+    bridge.queue("hold", release.wait) # Keeps the write thread busy while writes are queued
+    time.sleep(0.05)
+
+    for bri in (10, 20, 30):
+        bridge.submit("PUT", "lights", "2", "state", body={"bri": bri})
+    release.set()
+
+    assert wait_for_writes(server, 1) == [("PUT", "lights/2/state")]
+    assert server.lights["2"]["state"]["bri"] == 30
+
+def test_group_follows_bridge_lights(server, bridge):
+    lights = [SimpleNamespace(bridge=bridge, light_id=str(i)) for i in range(1, LIGHTS + 1)]
+
+    AmbienceHueGroup(lights).set_power(False)
+    assert wait_for_writes(server, 1) == [("PUT", "groups/0/action")]
+
+    server.log.clear()
+    AmbienceHueGroup(lights[:2]).set_power(True)
+    assert sorted(wait_for_writes(server, 2)) == [("PUT", "lights/1/state"), ("PUT", "lights/2/state")]
@@ -0,0 +1,120 @@
+# test_mqtt.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json, time
+
+import pytest
+
+pytest.importorskip("paho.mqtt.client")
+
+from mock_mqtt_broker import BASE_TOPIC, create_broker
+
+from ambience.singleton import Singleton
+from ambience.providers.mqtt.ambience_mqtt_client import AmbienceMQTTClient
+from ambience.providers.mqtt.ambience_mqtt_group import AmbienceMQTTGroup
+from ambience.providers.mqtt.ambience_mqtt_light import AmbienceMQTTLight, hsbk_to_payload, state_to_hsbk
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+@pytest.fixture
+def broker():
+    broker = create_broker(0, 2)
+    broker.add_light("living room/lamp")
+    broker.add_light("living room")
+    broker.add_light("json online", json.dumps({"state": "online"}).encode())
+    broker.add_light("json offline", json.dumps({"state": "offline"}).encode())
+    yield broker
+    broker.shutdown()
+    broker.server_close()
+
+@pytest.fixture
+def client(broker, monkeypatch):
+    monkeypatch.setenv("AMBIENCE_MQTT_BROKER", "{}:{}".format(*broker.server_address))
+    client = type.__call__(AmbienceMQTTClient) # Not the shared instance
+    monkeypatch.setitem(Singleton._instances, AmbienceMQTTClient, client) # Lights and groups use this one
+
+    client.wait_for_devices()
+    assert wait_for(lambda: len(client.states) == len(broker.devices))
+    yield client
+    client.client.disconnect()
+    client.client.loop_stop()
+
+def sent(broker, name):
+    with broker.lock:
+        return [json.loads(payload) for (topic, payload) in broker.log if topic == f"{BASE_TOPIC}/{name}/set"]
+
+def test_names_with_slashes(client):
+    assert client.split_topic("living room/lamp/availability") == ("living room/lamp", "availability")
+    assert client.split_topic("living room/lamp") == ("living room/lamp", "")
+    assert client.split_topic("living room") == ("living room", "")
+    assert client.split_topic("not yet/known/set") == ("not yet/known", "set") # Not in the device list
+
+    assert client.get_state("living room/lamp")["brightness"] == 254
+    assert "living room/lamp/availability" not in client.states
+
+def test_availability_formats(client):
+    assert client.is_online("light_1")            # "online"
+    assert client.is_online("json online")        # {"state": "online"}
+    assert not client.is_online("json offline")   # {"state": "offline"}
+
+@pytest.mark.parametrize("hsbk", [(0.5, 0.6, 0.8, 3500), (0.25, 1.0, 0.1, 3500)])
+def test_color_round_trip(hsbk):
+    payload = hsbk_to_payload(hsbk)
+    assert payload == {"brightness": round(hsbk[2] * 254),
+                       "color": {"hue": round(hsbk[0] * 360), "saturation": round(hsbk[1] * 100)}}
+
+    (h, s, b, _) = state_to_hsbk(dict(payload, color_mode="hs"))
+    assert (h, s, b) == pytest.approx(hsbk[:3], abs=0.01)
+
+@pytest.mark.parametrize("kelvin", [2700, 4000, 6500])
+def test_temperature_round_trip(kelvin):
+    payload = hsbk_to_payload((0, 0, 0.5, kelvin))
+    assert "color" not in payload
+
+    (h, s, b, k) = state_to_hsbk(dict(payload, color_mode="color_temp"))
+    assert (h, s) == (0, 0)
+    assert b == pytest.approx(0.5, abs=0.01)
+    assert k == pytest.approx(kelvin, rel=0.01)
+
+def test_brightness_only_change(broker, client):
+    light = AmbienceMQTTLight.from_config({"label": "Lamp", "data": {"name": "light_1"}}, None)
+    AmbienceMQTTGroup([light]).set_device_colors([(light, (0.5, 0.6, 0.5, 3500))], (2,))
+
+    assert wait_for(lambda: sent(broker, "light_1"))
+    assert sent(broker, "light_1") == [{"brightness": 127}]
+
+    # Cached at once, then confirmed by the bridge's state message
+    assert client.get_state("light_1")["brightness"] == 127
+    assert wait_for(lambda: broker.commands == 1)
+    assert client.get_state("light_1")["color_mode"] == "color_temp"
+
+def test_colour_change(broker, client):
+    lights = [AmbienceMQTTLight.from_config({"label": name, "data": {"name": name}}, None)
+              for name in ("light_1", "living room/lamp")]
+    AmbienceMQTTGroup(lights).set_device_colors([(light, (0.5, 0.6, 0.5, 3500)) for light in lights], (0, 2))
+
+    for light in lights:
+        assert wait_for(lambda: sent(broker, light.friendly_name))
+        assert sent(broker, light.friendly_name) == [{"brightness": 127, "color": {"hue": 180, "saturation": 60}}]
+
+    assert wait_for(lambda: client.get_state("living room/lamp").get("color_mode") == "hs")
+    (h, s, b, _) = lights[1].get_color()
+    assert (h, s, b) == pytest.approx((0.5, 0.6, 0.5), abs=0.01)
@@ -0,0 +1,109 @@
+# test_retry.py
+#
+# Copyright 2022 Luka Jankovic
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio, threading
+
+import pytest
+
+from ambience.model import ambience_retry
+from ambience.model.ambience_retry import AmbienceBreakerState, AmbienceDeviceUnavailableException, AmbienceRetry
+
+class OfflineDevice():
+    kind = "test"
+
+    def __init__(self, name):
+        self.name = name
+        self.online_calls = 0
+
+    def write_config(self):
+        return {"name": self.name}
+
+    def get_static_id(self):
+        return "test:" + self.name
+
+    def get_online(self):
+        self.online_calls += 1
+        return False
+
+@pytest.fixture
+def retry(monkeypatch):
+    monkeypatch.setattr(ambience_retry, "PROBE_DELAY", 0.05)
+    monkeypatch.setattr(ambience_retry, "BASE_DELAY", 0.001)
+    return type.__call__(AmbienceRetry) # Not the shared instance
+
+def record_states(retry, count):
+    states = []
+    done = threading.Event()
+
+    def changed(device, state):
+        states.append(state)
+        if len(states) >= count:
+            done.set()
+
+    retry.add_listener(changed)
+    return (states, done)
+
+async def load_offline(device):
+    if not device.get_online():
+        raise AmbienceDeviceUnavailableException
+
+def test_offline_device_opens_breaker_and_is_probed(retry):
+    device = OfflineDevice("call")
+    (states, done) = record_states(retry, 3)
+
+    def load():
+        if not device.get_online():
+            raise AmbienceDeviceUnavailableException
+
+    with pytest.raises(AmbienceDeviceUnavailableException) as error:
+        retry.call(device, load)
+
+    assert error.value.settled
+    assert device.online_calls == 1 # Not retried
+    assert retry.get_state(device) == AmbienceBreakerState.OPEN
+
+    # Fails fast while open
+    with pytest.raises(AmbienceDeviceUnavailableException):
+        retry.call(device, load)
+    assert device.online_calls == 1
+
+    assert done.wait(2)
+    assert states[:3] == [AmbienceBreakerState.OPEN, AmbienceBreakerState.PROBING, AmbienceBreakerState.OPEN]
+
+def test_offline_device_opens_breaker_async(retry):
+    device = OfflineDevice("call_async")
+    (states, done) = record_states(retry, 2)
+
+    with pytest.raises(AmbienceDeviceUnavailableException):
+        asyncio.run(retry.call_async(device, lambda: load_offline(device)))
+
+    assert retry.get_state(device) != AmbienceBreakerState.CLOSED
+    assert done.wait(2)
+    assert states[:2] == [AmbienceBreakerState.OPEN, AmbienceBreakerState.PROBING]
+
+def test_nested_failure_counts_once(retry):
+    device = OfflineDevice("nested")
+    (states, _) = record_states(retry, 1)
+
+    def outer():
+        return retry.call(device, lambda: 1 / 0, attempts=1)
+
+    with pytest.raises(AmbienceDeviceUnavailableException):
+        retry.call(device, outer)
+
+    assert states[:1] == [AmbienceBreakerState.OPEN]
+    assert AmbienceBreakerState.OPEN not in states[1:2] # Not tripped a second time